@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of publish completion tracking.
+
+Measures the bookkeeping cost of one network loop iteration, the cost
+to retire one acknowledged message, and the memory per in-flight
+message as the number of in-flight messages grows.  The legacy polling
+scan over a dict of paho MQTTMessageInfo and its memory are measured
+for comparison.
+"""
+
+#
+# Copyright (c) 2020, Shigemi ISHIDA
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import time
+import tracemalloc
+import paho.mqtt.client as mqtt
+import mqbeebotte
+from mqbeebotte.inflight import inflight
+
+#==========================================================================
+# argument parser
+def arg_parser():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", "--inflight", type=int, nargs="+",
+                    default=[100, 1000, 10000, 50000],
+                    help="numbers of in-flight messages (default: 100 1000 10000 50000)",
+                    )
+    ap.add_argument("-r", "--repeat", type=int, action="store",
+                    default=100,
+                    help="loop iterations to measure (default: 100)",
+                    )
+    return ap
+
+#---------------------------------------------------------------------------
+# legacy in-flight dict, i.e., mid -> (MQTTMessageInfo, callback, qos, published_at)
+def legacy_pubs(mids):
+    pubs = {}
+    for mid in mids:
+        pub = mqtt.MQTTMessageInfo(mid)
+        pub.rc = mqtt.MQTT_ERR_SUCCESS
+        pubs[mid] = (pub, None, 1, time.perf_counter())
+    return pubs
+
+#---------------------------------------------------------------------------
+# legacy polling scan, i.e., what run() did on every iteration
+def legacy_scan(pubs, lock):
+    remove_targets = []
+    with lock:
+        for mid, (pub, callback, qos, published_at) in pubs.items():
+            if pub.is_published():
+                remove_targets.append(mid)
+    with lock:
+        for mid in remove_targets:
+            del pubs[mid]
+
+#---------------------------------------------------------------------------
+def compact_pubs(mids):
+    pubs = inflight()
+    for mid in mids:
+        pubs.reserve()
+        pubs.add(mid, 1, time.perf_counter())
+    return pubs
+
+#---------------------------------------------------------------------------
+# bytes allocated per message to track in-flight messages
+def bytes_per_message(build, mids):
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    pubs = build(mids)
+    size = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    del pubs
+    return size / max(len(mids), 1)
+
+#---------------------------------------------------------------------------
+# client with n QoS 1 messages waiting for PUBACK
+def prepare(n):
+    cl = mqbeebotte.client()
+    cl._client = mqtt.Client()
+    cl._client.on_publish = cl._client__on_publish
+    cl._client.max_queued_messages_set(0)
+    for cnt in range(n):
+        cl.publish('bench/inflight', b'x', qos=1)
+    return cl
+
+#---------------------------------------------------------------------------
+def bench(n, repeat):
+    cl = prepare(n)
+    mids = list(cl._pubs)
+
+    start = time.perf_counter()
+    for cnt in range(repeat):
+        cl._client.loop(timeout=0)
+    loop_us = (time.perf_counter() - start) / repeat * 1e6
+
+    pubs = legacy_pubs(mids)
+    start = time.perf_counter()
+    for cnt in range(repeat):
+        legacy_scan(pubs, cl._pubs_lock)
+    scan_us = (time.perf_counter() - start) / repeat * 1e6
+
+    on_publish = cl._client__on_publish
+    start = time.perf_counter()
+    for mid in mids:
+        on_publish(cl._client, None, mid)
+    retire_us = (time.perf_counter() - start) / max(len(mids), 1) * 1e6
+
+    compact_bytes = bytes_per_message(compact_pubs, mids)
+    legacy_bytes = bytes_per_message(legacy_pubs, mids)
+
+    cl._client = None
+    return loop_us, scan_us, retire_us, compact_bytes, legacy_bytes
+
+#==========================================================================
+if __name__ == '__main__':
+    args = arg_parser().parse_args()
+
+    print('{:>10} {:>12} {:>12} {:>12} {:>12} {:>12}'.format(
+        'inflight', 'loop [us]', 'legacy [us]', 'retire [us]', 'B/msg', 'legacy B/msg'))
+    for n in args.inflight:
+        loop_us, scan_us, retire_us, compact_bytes, legacy_bytes = bench(n, args.repeat)
+        print('{:>10d} {:>12.2f} {:>12.2f} {:>12.3f} {:>12.1f} {:>12.1f}'.format(
+            n, loop_us, scan_us, retire_us, compact_bytes, legacy_bytes))
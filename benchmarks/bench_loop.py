@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of network loop wake-ups.
+
+Measures, against the local in-process broker, the CPU time consumed
+by an idle connected client, the latency of stop() until the loop
+thread exits, and the round trip of a QoS 0 message published from
+another thread.  The mqbeebotte.client loop waits for the socket and
+a wake-up channel; the paho loop_start() thread polling with a timeout
+is measured for comparison.
+"""
+
+#
+# Copyright (c) 2020, Shigemi ISHIDA
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import os
+import statistics
+import sys
+import threading
+import time
+import paho.mqtt.client as mqtt
+import mqbeebotte
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from broker import broker
+
+#==========================================================================
+# argument parser
+def arg_parser():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-i", "--idle", type=float, action="store",
+                    default=5.0,
+                    help="idle period in seconds (default: 5.0)",
+                    )
+    ap.add_argument("-r", "--repeat", type=int, action="store",
+                    default=10,
+                    help="number of stop and round trip measurements (default: 10)",
+                    )
+    return ap
+
+#---------------------------------------------------------------------------
+def start_mqbeebotte(port, on_message):
+    cl = mqbeebotte.client(host='127.0.0.1', port=port)
+    cl.connect('bench', on_message=lambda c, u, msg: on_message())
+    cl.start()
+    cl.subscribe('bench/loop')
+    def stop():
+        cl.stop(block_wait=True)
+    def close():
+        cl.disconnect()
+    return cl.publish, stop, close
+
+#---------------------------------------------------------------------------
+def start_paho(port, on_message):
+    mqttc = mqtt.Client()
+    mqttc.on_message = lambda c, u, msg: on_message()
+    mqttc.connect('127.0.0.1', port)
+    mqttc.loop_start()
+    mqttc.subscribe('bench/loop')
+    def stop():
+        mqttc.loop_stop()
+    def close():
+        mqttc.disconnect()
+    return mqttc.publish, stop, close
+
+#---------------------------------------------------------------------------
+def bench(port, starter, idle, repeat):
+    received = threading.Semaphore(0)
+    publish, stop, close = starter(port, received.release)
+    time.sleep(0.2)
+
+    # CPU time while nothing happens
+    cpu = time.process_time()
+    time.sleep(idle)
+    cpu = time.process_time() - cpu
+
+    # round trip from this thread through the loop thread
+    rtts = []
+    for cnt in range(repeat):
+        start = time.perf_counter()
+        publish('bench/loop', b'x')
+        received.acquire()
+        rtts.append(time.perf_counter() - start)
+        time.sleep(0.05)
+    stop()
+    close()
+
+    # stop() until the loop thread exits
+    stops = []
+    for cnt in range(repeat):
+        publish, stop, close = starter(port, received.release)
+        time.sleep(0.05 + 0.1 * cnt / repeat)
+        start = time.perf_counter()
+        stop()
+        stops.append(time.perf_counter() - start)
+        close()
+
+    return cpu / idle, statistics.median(rtts), statistics.median(stops), max(stops)
+
+#==========================================================================
+if __name__ == '__main__':
+    args = arg_parser().parse_args()
+
+    server = broker()
+    server.start()
+
+    print('{:<12} {:>10} {:>10} {:>12} {:>12}'.format(
+        'loop', 'idle CPU', 'rtt [us]', 'stop p50 [ms]', 'stop max [ms]'))
+    for name, starter in (('mqbeebotte', start_mqbeebotte), ('paho', start_paho)):
+        cpu, rtt, stop_p50, stop_max = bench(server.port, starter, args.idle, args.repeat)
+        print('{:<12} {:>9.3f}% {:>10.0f} {:>12.2f} {:>12.2f}'.format(
+            name, cpu * 100, rtt * 1e6, stop_p50 * 1e3, stop_max * 1e3))
+
+    server.stop()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of many clients sharing one reactor.
+
+Connects clients attached to a single mqbeebotte.reactor to the local
+broker and reports the number of client-side threads, the time to
+connect all the clients, and the rate of QoS 1 publishes acknowledged
+across all the clients.  With --threaded, each client runs its own
+network loop thread for comparison.
+"""
+
+#
+# Copyright (c) 2020, Shigemi ISHIDA
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import os
+import sys
+import threading
+import time
+import mqbeebotte
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from broker import broker
+
+#==========================================================================
+# argument parser
+def arg_parser():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", "--clients", type=int, nargs="+",
+                    default=[10, 100, 500],
+                    help="numbers of clients (default: 10 100 500)",
+                    )
+    ap.add_argument("-m", "--messages", type=int, action="store",
+                    default=10,
+                    help="messages per client (default: 10)",
+                    )
+    ap.add_argument("--threaded", action="store_true",
+                    help="run a network loop thread per client",
+                    )
+    return ap
+
+#---------------------------------------------------------------------------
+def client_threads():
+    return sum(1 for th in threading.enumerate() if not th.name.startswith('broker'))
+
+#---------------------------------------------------------------------------
+def bench(port, n, messages, threaded):
+    r = None
+    if not threaded:
+        r = mqbeebotte.reactor()
+        r.start()
+
+    start = time.perf_counter()
+    clients = []
+    for cnt in range(n):
+        cl = mqbeebotte.client(host='127.0.0.1', port=port, reactor=r)
+        cl.connect('bench')
+        cl.start()
+        clients.append(cl)
+    connect_time = time.perf_counter() - start
+    threads = client_threads()
+
+    done = threading.Semaphore(0)
+    start = time.perf_counter()
+    for cnt in range(messages):
+        for cl in clients:
+            cl.publish('bench/res', b'x', 1, callback=lambda mid: done.release())
+    for cnt in range(messages * n):
+        done.acquire()
+    elapsed = time.perf_counter() - start
+
+    for cl in clients:
+        cl.stop(block_wait=True)
+        cl.disconnect()
+    if r is not None:
+        r.stop(block_wait=True)
+
+    return threads, connect_time, messages * n / elapsed
+
+#==========================================================================
+if __name__ == '__main__':
+    args = arg_parser().parse_args()
+
+    server = broker()
+    server.start()
+
+    print('{:>8} {:>8} {:>12} {:>12}'.format('clients', 'threads', 'connect [s]', 'msg/s'))
+    for n in args.clients:
+        threads, connect_time, rate = bench(server.port, n, args.messages, args.threaded)
+        print('{:>8d} {:>8d} {:>12.3f} {:>12.0f}'.format(n, threads, connect_time, rate))
+
+    server.stop()
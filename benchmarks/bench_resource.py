@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark of publishing to a fixed resource.
+
+Measures, against the local in-process broker, the time per QoS 0
+message of client.write() and client.publish() with a topic formatted
+per message as in the samples, and of the handle returned by
+client.resource() with the topic and the envelope built once and
+QoS 0 messages left untracked.  The best of the runs is reported.
+"""
+
+#
+# Copyright (c) 2020, Shigemi ISHIDA
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import os
+import sys
+import time
+import mqbeebotte
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from broker import broker
+
+#==========================================================================
+# argument parser
+def arg_parser():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", "--messages", type=int, action="store",
+                    default=100000,
+                    help="number of messages per run (default: 100000)",
+                    )
+    ap.add_argument("-r", "--repeat", type=int, action="store",
+                    default=5,
+                    help="number of runs (default: 5)",
+                    )
+    return ap
+
+#---------------------------------------------------------------------------
+def run_write(cl, count):
+    for cnt in range(count):
+        cl.write('{}/{}'.format('bench', 'res'), cnt)
+
+#---------------------------------------------------------------------------
+def run_handle(cl, count):
+    res = cl.resource('bench', 'res')
+    for cnt in range(count):
+        res.publish(cnt)
+
+#---------------------------------------------------------------------------
+def run_publish(cl, count):
+    for cnt in range(count):
+        cl.publish('{}/{}'.format('bench', 'res'), b'1')
+
+#---------------------------------------------------------------------------
+def run_publish_raw(cl, count):
+    res = cl.resource('bench', 'res')
+    for cnt in range(count):
+        res.publish_raw(b'1')
+
+#==========================================================================
+if __name__ == '__main__':
+    args = arg_parser().parse_args()
+
+    server = broker()
+    server.start()
+    cl = mqbeebotte.client(host='127.0.0.1', port=server.port)
+    cl.connect('bench')
+    cl.start()
+
+    runners = (('client.write', run_write), ('resource.publish', run_handle),
+               ('client.publish', run_publish), ('resource.publish_raw', run_publish_raw))
+    # runs interleaved so that all the methods see the same load
+    elapsed = {name: [] for name, runner in runners}
+    for cnt in range(args.repeat):
+        for name, runner in runners:
+            start = time.perf_counter()
+            runner(cl, args.messages)
+            elapsed[name].append(time.perf_counter() - start)
+            cl.flush(10.0)
+
+    print('{:<24} {:>12} {:>12}'.format('method', 'us/msg', 'msgs/s'))
+    for name, runner in runners:
+        per_msg = min(elapsed[name]) / args.messages
+        print('{:<24} {:>12.2f} {:>12.0f}'.format(name, per_msg * 1e6, 1.0 / per_msg))
+
+    cl.stop(block_wait=True)
+    cl.disconnect()
+    server.stop()
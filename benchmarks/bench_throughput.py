@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Throughput and latency benchmark against a local in-process broker.
+
+Publishes messages through mqbeebotte.client to benchmarks/broker.py and
+measures messages per second and publish-to-completion latency, i.e.,
+until queued for QoS 0 or acknowledged for QoS 1/2, for each
+combination of QoS, payload size, and in-flight depth.
+
+Results are written as JSON so that runs can be compared over time.
+"""
+
+#
+# Copyright (c) 2020, Shigemi ISHIDA
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import paho.mqtt
+import mqbeebotte
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from broker import broker
+
+#==========================================================================
+# argument parser
+def arg_parser():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", "--messages", type=int, action="store",
+                    default=5000,
+                    help="messages per case (default: 5000)",
+                    )
+    ap.add_argument("-q", "--qos", type=int, nargs="+",
+                    default=[0, 1, 2],
+                    help="QoS levels (default: 0 1 2)",
+                    )
+    ap.add_argument("-s", "--sizes", type=int, nargs="+",
+                    default=[16, 256, 4096],
+                    help="payload sizes in bytes (default: 16 256 4096)",
+                    )
+    ap.add_argument("-d", "--depths", type=int, nargs="+",
+                    default=[1, 20, 100],
+                    help="in-flight depths (default: 1 20 100)",
+                    )
+    ap.add_argument("-o", "--output", type=str, action="store",
+                    default=None,
+                    help="output JSON file (default: stdout)",
+                    )
+    return ap
+
+#---------------------------------------------------------------------------
+def package_version():
+    try:
+        from importlib.metadata import version
+        return version('mqbeebotte')
+    except Exception:
+        return None
+
+#---------------------------------------------------------------------------
+def percentile(values, pct):
+    if len(values) == 0:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+#---------------------------------------------------------------------------
+def bench(port, n, qos, size, depth):
+    cl = mqbeebotte.client(host='127.0.0.1', port=port)
+    cl.connect('bench')
+    # paho queues messages over its own in-flight limit
+    cl._client.max_inflight_messages_set(depth)
+    cl.start()
+
+    payload = b'x' * size
+    window = threading.Semaphore(depth)
+    done = threading.Event()
+    latencies = []
+    sent_at = {}
+    lock = threading.Lock()
+
+    def on_published(mid):
+        now = time.perf_counter()
+        with lock:
+            latencies.append(now - sent_at.pop(mid, now))
+            count = len(latencies)
+        window.release()
+        if count == n:
+            done.set()
+
+    start = time.perf_counter()
+    for cnt in range(n):
+        window.acquire()
+        now = time.perf_counter()
+        # mids are assigned sequentially by paho
+        with lock:
+            sent_at[cnt % 65535 + 1] = now
+        cl.publish('bench/res', payload, qos, callback=on_published)
+    done.wait(60)
+    elapsed = time.perf_counter() - start
+
+    cl.stop(block_wait=True)
+    cl.disconnect()
+
+    return {
+        'qos': qos,
+        'size': size,
+        'depth': depth,
+        'messages': len(latencies),
+        'elapsed': elapsed,
+        'rate': len(latencies) / elapsed,
+        'p50': percentile(latencies, 50),
+        'p99': percentile(latencies, 99),
+    }
+
+#==========================================================================
+if __name__ == '__main__':
+    args = arg_parser().parse_args()
+
+    server = broker()
+    server.start()
+
+    results = []
+    for qos in args.qos:
+        for size in args.sizes:
+            for depth in args.depths:
+                result = bench(server.port, args.messages, qos, size, depth)
+                results.append(result)
+                print('qos={qos:d} size={size:d} depth={depth:d}: '
+                      '{rate:.0f} msg/s p50={p50:.6f}s p99={p99:.6f}s'.format(**result),
+                      file=sys.stderr)
+    server.stop()
+
+    report = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'paho': paho.mqtt.__version__,
+        'mqbeebotte': package_version(),
+        'results': results,
+    }
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as fp:
+            json.dump(report, fp, indent=2)
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of TLS connection setup.
+
+Measures, against the local in-process broker accepting TLS, the time
+from creating a client to CONNACK over repeated connections.  The
+mqbeebotte.client shares an SSL context loading the CA certificate
+once and resumes the TLS session of the previous connection; paho
+tls_set() on a new client is measured for comparison.
+"""
+
+#
+# Copyright (c) 2020, Shigemi ISHIDA
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import os
+import ssl
+import statistics
+import sys
+import threading
+import time
+import paho.mqtt.client as mqtt
+import mqbeebotte
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from broker import broker
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'data')
+
+#==========================================================================
+# argument parser
+def arg_parser():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-r", "--repeat", type=int, action="store",
+                    default=50,
+                    help="number of connections (default: 50)",
+                    )
+    ap.add_argument("-c", "--cert", type=str, action="store",
+                    default=os.path.join(DATA, 'tls_cert.pem'),
+                    help="server certificate for localhost",
+                    )
+    ap.add_argument("-a", "--ca", type=str, action="store",
+                    default=None,
+                    help="CA certificate file including the server certificate (default: the server certificate)",
+                    )
+    ap.add_argument("-k", "--key", type=str, action="store",
+                    default=os.path.join(DATA, 'tls_key.pem'),
+                    help="server private key",
+                    )
+    return ap
+
+#---------------------------------------------------------------------------
+def connect_mqbeebotte(port, ca_cert, connected):
+    cl = mqbeebotte.client(host='localhost', port=port, ca_cert=ca_cert)
+    cl.connect('bench', on_connect=lambda c, u, f, rc: connected.set())
+    cl.start()
+    connected.wait()
+    def close():
+        cl.stop(block_wait=True)
+        cl.disconnect()
+        return cl.stats()['handshake_time']['sum']
+    return close
+
+#---------------------------------------------------------------------------
+def connect_paho(port, ca_cert, connected):
+    mqttc = mqtt.Client()
+    mqttc.on_connect = lambda c, u, f, rc: connected.set()
+    mqttc.tls_set(ca_cert)
+    mqttc.connect('localhost', port)
+    mqttc.loop_start()
+    connected.wait()
+    def close():
+        mqttc.disconnect()
+        mqttc.loop_stop()
+        return None
+    return close
+
+#---------------------------------------------------------------------------
+def bench(port, ca_cert, connector, repeat):
+    setups = []
+    handshakes = []
+    cpu = time.process_time()
+    for cnt in range(repeat):
+        connected = threading.Event()
+        start = time.perf_counter()
+        close = connector(port, ca_cert, connected)
+        setups.append(time.perf_counter() - start)
+        handshake = close()
+        if handshake is not None:
+            handshakes.append(handshake)
+    cpu = time.process_time() - cpu
+
+    return statistics.median(setups), cpu / repeat, statistics.median(handshakes) if len(handshakes) > 0 else None
+
+#==========================================================================
+if __name__ == '__main__':
+    args = arg_parser().parse_args()
+
+    ca_cert = args.ca if args.ca is not None else args.cert
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(args.cert, args.key)
+    server = broker(ssl_context=context)
+    server.start()
+
+    print('{:<12} {:>14} {:>14} {:>16}'.format('client', 'connect [ms]', 'CPU [ms]', 'handshake [ms]'))
+    for name, connector in (('mqbeebotte', connect_mqbeebotte), ('paho', connect_paho)):
+        setup, cpu, handshake = bench(server.port, ca_cert, connector, args.repeat)
+        print('{:<12} {:>14.2f} {:>14.2f} {:>16}'.format(
+            name, setup * 1e3, cpu * 1e3, '-' if handshake is None else '{:.2f}'.format(handshake * 1e3)))
+    print('resumed: {}'.format(mqbeebotte.tls_context.get(ca_cert).stats()))
+
+    server.stop()
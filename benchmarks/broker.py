@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+Minimal in-process MQTT 3.1.1 broker for benchmarks and tests.
+
+Supports CONNECT, PUBLISH with QoS 0/1/2, SUBSCRIBE with '+' and '#'
+wildcards, UNSUBSCRIBE, retained messages, PINGREQ, and DISCONNECT.
+Authentication is not checked.
+"""
+
+#
+# Copyright (c) 2020, Shigemi ISHIDA
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import socket
+import ssl
+import struct
+import threading
+
+#==========================================================================
+def topic_matches(sub, topic):
+    sub_levels = sub.split('/')
+    topic_levels = topic.split('/')
+    for idx, level in enumerate(sub_levels):
+        if level == '#':
+            return True
+        if idx >= len(topic_levels):
+            return False
+        if level != '+' and level != topic_levels[idx]:
+            return False
+    return len(sub_levels) == len(topic_levels)
+
+#==========================================================================
+class session(object):
+    def __init__(self, server, sock):
+        self.server = server
+        self.sock = sock
+        self.subs = {}
+        self.lock = threading.Lock()
+        self.mid = 0
+
+    #----------------------------------------------------------------------
+    def send(self, data):
+        with self.lock:
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                pass
+
+    #----------------------------------------------------------------------
+    def deliver(self, topic, payload, qos, retain=False):
+        header = 0x30 | (qos << 1) | (1 if retain else 0)
+        body = struct.pack('!H', len(topic)) + topic
+        if qos > 0:
+            with self.lock:
+                self.mid = self.mid % 65535 + 1
+                mid = self.mid
+            body += struct.pack('!H', mid)
+        self.send(packet(header, body + payload))
+
+    #----------------------------------------------------------------------
+    def recv_exact(self, size):
+        buf = bytearray()
+        while len(buf) < size:
+            chunk = self.sock.recv(size - len(buf))
+            if not chunk:
+                raise ConnectionError('closed')
+            buf += chunk
+        return bytes(buf)
+
+    #----------------------------------------------------------------------
+    def read_packet(self):
+        header = self.recv_exact(1)[0]
+        length = 0
+        mult = 1
+        while True:
+            byte = self.recv_exact(1)[0]
+            length += (byte & 0x7f) * mult
+            mult *= 128
+            if byte & 0x80 == 0:
+                break
+        return header, self.recv_exact(length) if length > 0 else b''
+
+    #----------------------------------------------------------------------
+    def run(self):
+        try:
+            if isinstance(self.sock, ssl.SSLSocket):
+                self.sock.do_handshake()
+            while True:
+                header, body = self.read_packet()
+                if not self.handle(header, body):
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.server._remove(self)
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+
+    #----------------------------------------------------------------------
+    def handle(self, header, body):
+        cmd = header & 0xf0
+        if cmd == 0x10:     # CONNECT
+            self.send(b'\x20\x02\x00\x00')
+        elif cmd == 0x30:   # PUBLISH
+            qos = (header >> 1) & 0x03
+            retain = header & 0x01
+            tlen, = struct.unpack('!H', body[:2])
+            topic = body[2:2 + tlen]
+            pos = 2 + tlen
+            if qos > 0:
+                mid = body[pos:pos + 2]
+                pos += 2
+            payload = body[pos:]
+            if qos == 1 and not self.server.drop_acks:
+                self.send(b'\x40\x02' + mid)
+            elif qos == 2 and not self.server.drop_acks:
+                self.send(b'\x50\x02' + mid)
+            self.server._route(topic, payload, qos, retain)
+        elif cmd == 0x60:   # PUBREL
+            self.send(b'\x70\x02' + body[:2])
+        elif cmd == 0x50:   # PUBREC for delivered QoS 2
+            self.send(b'\x62\x02' + body[:2])
+        elif cmd == 0x80:   # SUBSCRIBE
+            with self.server._lock:
+                self.server.subscribes += 1
+            mid = body[:2]
+            pos = 2
+            granted = bytearray()
+            subs = []
+            while pos < len(body):
+                tlen, = struct.unpack('!H', body[pos:pos + 2])
+                topic = body[pos + 2:pos + 2 + tlen].decode('utf-8')
+                qos = body[pos + 2 + tlen] & 0x03
+                pos += 3 + tlen
+                self.subs[topic] = qos
+                granted.append(qos)
+                subs.append((topic, qos))
+            self.send(packet(0x90, mid + bytes(granted)))
+            for sub, qos in subs:
+                for topic, (payload, rqos) in self.server._retained_items():
+                    if topic_matches(sub, topic.decode('utf-8')):
+                        self.deliver(topic, payload, min(qos, rqos), True)
+        elif cmd == 0xa0:   # UNSUBSCRIBE
+            mid = body[:2]
+            pos = 2
+            while pos < len(body):
+                tlen, = struct.unpack('!H', body[pos:pos + 2])
+                self.subs.pop(body[pos + 2:pos + 2 + tlen].decode('utf-8'), None)
+                pos += 2 + tlen
+            self.send(b'\xb0\x02' + mid)
+        elif cmd == 0xc0:   # PINGREQ
+            self.send(b'\xd0\x00')
+        elif cmd == 0xe0:   # DISCONNECT
+            return False
+        return True
+
+#==========================================================================
+def packet(header, body):
+    length = len(body)
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        if length > 0:
+            byte |= 0x80
+        encoded.append(byte)
+        if length == 0:
+            break
+    return bytes([header]) + bytes(encoded) + body
+
+#==========================================================================
+class broker(threading.Thread):
+    """
+    MQTT broker running in a daemon thread.
+
+    Attributes
+    ----------
+    host : str
+        Listening address.
+    port : int
+        Listening port number, assigned by OS when 0 is given.
+    ssl_context : ssl.SSLContext
+        Server context to accept TLS connections, None for plain TCP.
+    drop_acks : bool
+        Do not acknowledge QoS 1/2 messages when True.
+    received : int
+        Number of PUBLISH packets received from clients.
+    subscribes : int
+        Number of SUBSCRIBE packets received from clients.
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, host='127.0.0.1', port=0, ssl_context=None):
+        super().__init__(name='broker', daemon=True)
+        self.host = host
+        self.ssl_context = ssl_context
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((host, port))
+        self._sock.listen(128)
+        self.port = self._sock.getsockname()[1]
+        self.drop_acks = False
+        self.received = 0
+        self.subscribes = 0
+        self._sessions = []
+        self._retained = {}
+        self._lock = threading.Lock()
+        self._is_running = True
+
+    #----------------------------------------------------------------------
+    def run(self):
+        while self._is_running:
+            try:
+                sock, addr = self._sock.accept()
+            except OSError:
+                break
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if self.ssl_context is not None:
+                # handshake on the session thread not to block accept
+                sock = self.ssl_context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False)
+            sess = session(self, sock)
+            with self._lock:
+                self._sessions.append(sess)
+            threading.Thread(target=sess.run, name='broker-session', daemon=True).start()
+
+    #----------------------------------------------------------------------
+    def stop(self):
+        self._is_running = False
+        try:
+            self._sock.close()
+        except OSError:
+            pass
+        with self._lock:
+            sessions = list(self._sessions)
+        for sess in sessions:
+            try:
+                sess.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    #----------------------------------------------------------------------
+    def drop_connections(self):
+        """
+        Closes all the client connections to simulate a broker blip.
+        """
+        with self._lock:
+            sessions = list(self._sessions)
+        for sess in sessions:
+            try:
+                sess.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    #----------------------------------------------------------------------
+    def _remove(self, sess):
+        with self._lock:
+            if sess in self._sessions:
+                self._sessions.remove(sess)
+
+    #----------------------------------------------------------------------
+    def _retained_items(self):
+        with self._lock:
+            return list(self._retained.items())
+
+    #----------------------------------------------------------------------
+    def _route(self, topic, payload, qos, retain):
+        with self._lock:
+            self.received += 1
+            if retain:
+                self._retained[topic] = (payload, qos)
+            sessions = list(self._sessions)
+        name = topic.decode('utf-8')
+        for sess in sessions:
+            for sub, sub_qos in list(sess.subs.items()):
+                if topic_matches(sub, name):
+                    sess.deliver(topic, payload, min(qos, sub_qos))
+                    break
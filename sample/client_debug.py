@@ -46,6 +46,10 @@ def arg_parser():
                     default="config.py",
                     help="config file (default: config.py)",
                     )
+    ap.add_argument("-w", "--capture", type=str, action="store",
+                    default=None,
+                    help="capture log file to record messages (default: None)",
+                    )
     return ap
 
 #---------------------------------------------------------------------------
@@ -111,7 +115,8 @@ if __name__ == '__main__':
     ca_cert = config.ca_cert if 'ca_cert' in param_names else None
 
     # create a client instance
-    client = mqbeebotte.client(host, port, ca_cert)
+    capture = mqbeebotte.capture(args.capture) if args.capture is not None else None
+    client = mqbeebotte.client(host, port, ca_cert, capture=capture)
     client.connect(config.channel_token)
     client.start()
 
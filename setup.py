@@ -43,16 +43,15 @@ setup(
         # These classifiers are *not* checked by 'pip install'. See instead
         # 'python_requires' below.
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
     ],
     keywords='mqtt beebotte',
     package_dir={'': 'src'},
     packages=find_packages(where='src'),
-    python_requires='!=3.0.*, !=3.1.*, !=3.2.*, !=3.3.*, !=3.4.*, <4',
+    python_requires='>=3.7, <4',
     install_requires=['paho-mqtt'],
+    extras_require={'numpy': ['numpy']},
     project_urls={
         'Bug Reports': 'https://github.com/pman0214/mqbeebotte/issues',
         'Source': 'https://github.com/pman0214/mqbeebotte/',
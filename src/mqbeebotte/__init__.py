@@ -34,3 +34,16 @@ Provides
 # SUCH DAMAGE.
 
 from mqbeebotte.client import *
+from mqbeebotte.pool import *
+from mqbeebotte.spool import *
+from mqbeebotte.dispatch import *
+from mqbeebotte.ratelimit import *
+from mqbeebotte.metrics import *
+from mqbeebotte.reactor import *
+from mqbeebotte.stream import *
+from mqbeebotte.fanout import *
+from mqbeebotte.dedup import *
+from mqbeebotte.cache import *
+from mqbeebotte.rest import *
+from mqbeebotte.capture import *
+from mqbeebotte.tls import *
@@ -0,0 +1,495 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020, Shigemi ISHIDA
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import asyncio
+import threading
+import paho.mqtt.client as mqtt
+from logging import getLogger, NullHandler
+from mqbeebotte.client import client as _client
+
+#======================================================================
+class client(object):
+    """
+    Beebotte MQTT asyncio client API class
+
+    The socket is driven by the running event loop; no thread is used
+    except for the blocking TCP/TLS connection setup in connect().
+
+    Attributes
+    ----------
+    logger : logging.Logger
+        Logger object class attribute.  Default handler is NullHandler().
+    HOST : str
+        Default host name class attribute, i.e., mqtt.beebotte.com.
+    PORT : int
+        Default port number class attribute, i.e., 1883.
+    PORT_SSL : int
+        Default port number class attribute, i.e., 8883, for SSL connection.
+    MISC_INTERVAL : float
+        Interval in seconds to process keepalive and retries.
+    host : str
+        MQTT server name to connect.
+    port : int
+        MQTT server port number.
+    ca_cert : str
+        CA Certificate file path.
+    topics : list
+        Subscribed topics.
+    """
+
+    logger = getLogger(__name__)
+    logger.addHandler(NullHandler())
+    HOST = _client.HOST
+    PORT = _client.PORT
+    PORT_SSL = _client.PORT_SSL
+    MISC_INTERVAL = 1.0
+
+    #----------------------------------------------------------------------
+    def __init__(self, host=None, port=None, ca_cert=None, *, maxsize=0, logger=None):
+        """
+        Creates and maintains connection parameters and a logger instance.
+
+        Parameters
+        ----------
+        host : str, default None
+            Beebotte MQTT server hostname, None to use default value,
+            i.e., mqtt.beebotte.com.
+        port : int, default None
+            Beebotte MQTT server port number, None to use default value,
+            i.e., 1883 for non-SSL connection and 8883 for SSL connection.
+        ca_cert : str, default None
+            CA Certificate file path, None for non-SSL connection.
+        maxsize : int, default 0
+            Maximum number of received messages kept until consumed by
+            messages(), 0 for unlimited.
+        logger : logging.Logger, default None
+            Logger object, None to use module internal logging object.
+        """
+
+        self.host = host if host is not None else client.HOST
+        self.ca_cert = ca_cert
+        if port is not None:
+            self.port = port
+        else:
+            self.port = client.PORT if self.ca_cert is None else client.PORT_SSL
+        #
+        if logger is not None:
+            client.logger = logger
+
+        self.topics = []
+
+        self._maxsize = maxsize
+        self._client = None
+        self._loop = None
+        self._loop_thread = None
+        self._misc_task = None
+        self._connack = None
+        self._disconnected = None
+        self._messages = None
+        # messages() ends once the queue is drained
+        self._is_closed = False
+        # mid -> future waiting for SUBACK/UNSUBACK/PUBACK
+        self._acks = {}
+
+        return
+
+    #----------------------------------------------------------------------
+    def __call(self, func, *args):
+        # socket callbacks come from the executor thread during connect()
+        if threading.get_ident() == self._loop_thread:
+            func(*args)
+        else:
+            self._loop.call_soon_threadsafe(func, *args)
+        return
+
+    #----------------------------------------------------------------------
+    def __on_socket_open(self, mqttc, userdata, sock):
+        self.__call(self._loop.add_reader, sock, self.__on_readable)
+        return
+
+    #----------------------------------------------------------------------
+    def __on_socket_close(self, mqttc, userdata, sock):
+        self.__call(self._loop.remove_reader, sock)
+        self.__call(self._loop.remove_writer, sock)
+        return
+
+    #----------------------------------------------------------------------
+    def __on_socket_register_write(self, mqttc, userdata, sock):
+        self.__call(self._loop.add_writer, sock, self.__on_writable)
+        return
+
+    #----------------------------------------------------------------------
+    def __on_socket_unregister_write(self, mqttc, userdata, sock):
+        self.__call(self._loop.remove_writer, sock)
+        return
+
+    #----------------------------------------------------------------------
+    def __on_readable(self):
+        if self._client is not None:
+            self._client.loop_read()
+        return
+
+    #----------------------------------------------------------------------
+    def __on_writable(self):
+        if self._client is not None:
+            self._client.loop_write()
+        return
+
+    #----------------------------------------------------------------------
+    async def __misc(self):
+        while True:
+            await asyncio.sleep(client.MISC_INTERVAL)
+            if self._client is None or self._client.loop_misc() != mqtt.MQTT_ERR_SUCCESS:
+                return
+
+    #----------------------------------------------------------------------
+    def __resolve(self, mid, result):
+        fut = self._acks.pop(mid, None)
+        if fut is not None and not fut.done():
+            fut.set_result(result)
+        return
+
+    #----------------------------------------------------------------------
+    def __on_connect(self, mqttc, userdata, flags, respons_code):
+        client.logger.debug('connected to {}, rc={:d}'.format(self.host, respons_code))
+        if not self._connack.done():
+            self._connack.set_result(respons_code == mqtt.CONNACK_ACCEPTED)
+        return
+
+    #----------------------------------------------------------------------
+    def __on_disconnect(self, mqttc, userdata, respons_code):
+        client.logger.debug('disconnected from {}, rc={:d}'.format(self.host, respons_code))
+        if not self._connack.done():
+            self._connack.set_result(False)
+        # nothing will be acknowledged on this connection anymore
+        for fut in self._acks.values():
+            if not fut.done():
+                fut.set_result(False)
+        self._acks.clear()
+        self._is_closed = True
+        try:
+            self._messages.put_nowait(None)
+        except asyncio.QueueFull:
+            # messages() checks _is_closed instead
+            pass
+        if not self._disconnected.done():
+            self._disconnected.set_result(True)
+        return
+
+    #----------------------------------------------------------------------
+    def __on_message(self, mqttc, userdata, msg):
+        try:
+            self._messages.put_nowait(msg)
+        except asyncio.QueueFull:
+            client.logger.warning('message dropped: {}'.format(msg.topic))
+        return
+
+    #----------------------------------------------------------------------
+    def __on_subscribe(self, mqttc, userdata, mid, granted_qos):
+        self.__resolve(mid, 0x80 not in granted_qos)
+        return
+
+    #----------------------------------------------------------------------
+    def __on_unsubscribe(self, mqttc, userdata, mid):
+        self.__resolve(mid, True)
+        return
+
+    #----------------------------------------------------------------------
+    def __on_publish(self, mqttc, userdata, mid):
+        self.__resolve(mid, True)
+        return
+
+    #----------------------------------------------------------------------
+    def __wait_ack(self, mid):
+        fut = self._loop.create_future()
+        self._acks[mid] = fut
+        return fut
+
+    #----------------------------------------------------------------------
+    async def connect(self, token):
+        """
+        Connects to a MQTT server and waits for CONNACK.
+
+        Parameters
+        ----------
+        token : str
+            Token string for Beebotte MQTT server.
+            You can derive the token for a channel on Beebotte web
+            https://beebotte.com.
+
+        Returns
+        -------
+        is_success : bool
+            True on success, False when any error occurs.
+        """
+        if self._client is not None:
+            client.logger.debug('already connected to {}'.format(self.host))
+            return False
+
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._connack = self._loop.create_future()
+        self._disconnected = self._loop.create_future()
+        self._messages = asyncio.Queue(self._maxsize)
+        self._is_closed = False
+
+        self._client = mqtt.Client()
+        self._client.on_connect = self.__on_connect
+        self._client.on_disconnect = self.__on_disconnect
+        self._client.on_message = self.__on_message
+        self._client.on_subscribe = self.__on_subscribe
+        self._client.on_unsubscribe = self.__on_unsubscribe
+        self._client.on_publish = self.__on_publish
+        self._client.on_socket_open = self.__on_socket_open
+        self._client.on_socket_close = self.__on_socket_close
+        self._client.on_socket_register_write = self.__on_socket_register_write
+        self._client.on_socket_unregister_write = self.__on_socket_unregister_write
+        self._client.username_pw_set('token:{}'.format(token))
+        if self.ca_cert is not None:
+            client.logger.debug('use ca_cert: {}'.format(self.ca_cert))
+            self._client.tls_set(self.ca_cert)
+
+        client.logger.debug('connecting to {}:{:d}'.format(self.host, self.port))
+        try:
+            await self._loop.run_in_executor(None, self._client.connect, self.host, self.port)
+        except OSError as err:
+            client.logger.error('cannot connect to {}: {}'.format(self.host, err))
+            self._client = None
+            return False
+
+        self._misc_task = self._loop.create_task(self.__misc())
+        if not await self._connack:
+            client.logger.error('connection refused by {}'.format(self.host))
+            await self.__close()
+            return False
+
+        return True
+
+    #----------------------------------------------------------------------
+    async def __close(self):
+        if self._misc_task is not None:
+            self._misc_task.cancel()
+            self._misc_task = None
+        self._client = None
+        return
+
+    #----------------------------------------------------------------------
+    async def disconnect(self, timeout=None):
+        """
+        Unsubscribes from all the topics, waits for all the messages to
+        be published, and disconnects from a MQTT server.
+
+        Parameters
+        ----------
+        timeout : float, default None
+            Maximum time in seconds to wait for outstanding messages,
+            None to use mqbeebotte.client.DISCONNECT_TIMEOUT.
+            publish() waiting for messages not published by then
+            returns False.
+
+        Returns
+        -------
+        is_success : bool
+            True on success, False when any error occurs or any message
+            is discarded.
+        """
+        if self._client is None:
+            return True
+
+        if timeout is None:
+            timeout = _client.DISCONNECT_TIMEOUT
+        deadline = self._loop.time() + timeout
+
+        client.logger.debug('unsubscribe all topics')
+        try:
+            await asyncio.wait_for(self.unsubscribe(None), timeout)
+        except asyncio.TimeoutError:
+            client.logger.warning('no UNSUBACK in {}s'.format(timeout))
+
+        # wait for all publish requests to be published
+        client.logger.debug('wait for all topics to be published')
+        pending = [fut for fut in self._acks.values() if not fut.done()]
+        if len(pending) > 0:
+            done, pending = await asyncio.wait(pending, timeout=max(0.0, deadline - self._loop.time()))
+        if len(pending) > 0:
+            client.logger.warning('{:d} messages not published in {}s'.format(len(pending), timeout))
+
+        # publish() waiting for the rest returns False on disconnection
+        self._client.disconnect()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._disconnected),
+                                   max(client.MISC_INTERVAL, deadline - self._loop.time()))
+        except asyncio.TimeoutError:
+            client.logger.warning('disconnection from {} not completed'.format(self.host))
+            self.__on_disconnect(self._client, None, mqtt.MQTT_ERR_CONN_LOST)
+        await self.__close()
+
+        return len(pending) == 0
+
+    #----------------------------------------------------------------------
+    async def unsubscribe(self, topics):
+        """
+        Unsubscribes from a single topic or multiple topics and waits for
+        UNSUBACK.
+
+        Parameters
+        ----------
+        topics : list or str
+            A list of topics or a name of topic to be unsubscribed.
+            None to unsubscribe from all the subscribed topics.
+
+        Returns
+        -------
+        is_success : bool
+            True on success, False when any error occurs.
+        """
+        if self._client is None:
+            client.logger.error('cannot unsubscribe: not connected')
+            return False
+
+        if topics is None:
+            topics = self.topics.copy()
+        elif type(topics) is not list:
+            topics = [topics]
+        topics = [topic for topic in topics if topic in self.topics]
+        if len(topics) == 0:
+            return True
+
+        client.logger.debug('unsubscribe from {}'.format(', '.join(topics)))
+        result, mid = self._client.unsubscribe(topics)
+        if result != mqtt.MQTT_ERR_SUCCESS:
+            client.logger.error('unsubscribe error')
+            return False
+        for topic in topics:
+            self.topics.remove(topic)
+
+        return await self.__wait_ack(mid)
+
+    #----------------------------------------------------------------------
+    async def subscribe(self, topics, qos=0):
+        """
+        Subscribes to a single topic or multiple topics and waits for
+        SUBACK.
+
+        Parameters
+        ----------
+        topics : list or str
+            A list of topics, a list of tuple of (topic, qos),
+            or a name of topic to be subscribed.
+        qos : int, default 0
+            The integer of 0, 1, or 2 to specify Quality of Service
+            for the subscription.  When topics is a list, qos is ignored.
+
+        Returns
+        -------
+        is_success : bool
+            True on success, False when any error occurs or the server
+            refuses any of the subscriptions.
+        """
+        if self._client is None:
+            client.logger.error('cannot subscribe: not connected')
+            return False
+
+        if type(topics) is list:
+            topic_qos = [x if type(x) is tuple else (x, 0) for x in topics]
+        elif type(topics) is str:
+            topic_qos = [(topics, qos)]
+        else:
+            client.logger.error('invalid variable for topic name')
+            return False
+        topic_qos = [x for x in topic_qos if x[0] not in self.topics]
+        if len(topic_qos) == 0:
+            return True
+
+        client.logger.debug('subscribe to {}'.format(', '.join([x[0] for x in topic_qos])))
+        result, mid = self._client.subscribe(topic_qos)
+        if result != mqtt.MQTT_ERR_SUCCESS:
+            client.logger.error('subscribe error')
+            return False
+        self.topics.extend([x[0] for x in topic_qos])
+
+        return await self.__wait_ack(mid)
+
+    #----------------------------------------------------------------------
+    async def publish(self, topic, msg, qos=0, retain=False):
+        """
+        Publishes a message to a topic and waits for it to be published,
+        i.e., written to the socket for QoS 0 or acknowledged for QoS 1/2.
+
+        Parameters
+        ----------
+        topic : str
+            The name of publish target topic.
+        msg : str or byte
+            A message to be published.
+        qos : int, default 0
+            An integer of 0, 1, or 2 to specify Quality of Service for publish.
+        retain : bool
+            A flag to indicate that the message will be retained.
+
+        Returns
+        -------
+        is_success : bool
+            True on success, False when any error occurs.
+        """
+        if self._client is None:
+            client.logger.error('cannot publish: not connected')
+            return False
+
+        pub = self._client.publish(topic, msg, qos, retain)
+        if pub.rc != mqtt.MQTT_ERR_SUCCESS:
+            client.logger.error('publish error')
+            return False
+
+        return await self.__wait_ack(pub.mid)
+
+    #----------------------------------------------------------------------
+    async def messages(self):
+        """
+        Iterates over received messages until disconnected.  Messages
+        received before disconnection are yielded first.
+
+        Yields
+        ------
+        msg : paho.mqtt.client.MQTTMessage
+            Received message.
+        """
+        if self._messages is None:
+            return
+
+        while True:
+            if self._is_closed and self._messages.empty():
+                return
+            msg = await self._messages.get()
+            if msg is None:
+                # left for the other iterators
+                self._messages.put_nowait(None)
+                return
+            yield msg
+
+#======================================================================
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020, Shigemi ISHIDA
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+import os
+import struct
+import threading
+import time
+import zlib
+from logging import getLogger, NullHandler
+from mqbeebotte.topic import topic_trie
+
+#======================================================================
+class last_value(object):
+    """
+    Cache of the last message payload of each topic
+
+    Topics are kept in a trie so that topic filters with '+' and '#'
+    wildcards are looked up without scanning all the topics.  The cache
+    can be saved to a snapshot file and is loaded from it on creation,
+    so that the last values are available before any message arrives.
+
+    Snapshot records are (topic length, payload length, update time,
+    CRC32) followed by the topic and the payload.
+
+    Attributes
+    ----------
+    logger : logging.Logger
+        Logger object class attribute.  Default handler is NullHandler().
+    path : str
+        Snapshot file path, None not to save snapshots.
+    save_interval : float
+        Interval in seconds to save a snapshot when updated.
+    """
+
+    logger = getLogger(__name__)
+    logger.addHandler(NullHandler())
+
+    _MAGIC = b'MQLV0001'
+    _RECORD = struct.Struct('<HIdI')
+
+    #----------------------------------------------------------------------
+    def __init__(self, path=None, save_interval=60.0, *, logger=None):
+        """
+        Creates a cache and loads the snapshot if any.
+
+        Parameters
+        ----------
+        path : str, default None
+            Snapshot file path, None not to save snapshots.
+        save_interval : float, default 60.0
+            Interval in seconds to save a snapshot when updated.
+        logger : logging.Logger, default None
+            Logger object, None to use module internal logging object.
+        """
+        if logger is not None:
+            last_value.logger = logger
+
+        self.path = path
+        self.save_interval = save_interval
+
+        # topic -> (payload, time.time() updated at)
+        self._values = topic_trie()
+        self._lock = threading.Lock()
+        self._is_dirty = False
+        self._saved_at = time.monotonic()
+        if path is not None:
+            self.load()
+
+        return
+
+    #----------------------------------------------------------------------
+    def __len__(self):
+        return len(self._values)
+
+    #----------------------------------------------------------------------
+    def update(self, topic, payload, updated_at=None):
+        """
+        Sets the last value of a topic.
+
+        Parameters
+        ----------
+        topic : str
+            The name of topic.
+        payload : bytes
+            Message payload.  Empty to remove the topic.
+        updated_at : float, default None
+            time.time() of the update, None to use the current time.
+        """
+        with self._lock:
+            self._is_dirty = True
+            if len(payload) == 0:
+                self._values.pop(topic)
+                return
+            self._values[topic] = (payload, time.time() if updated_at is None else updated_at)
+        return
+
+    #----------------------------------------------------------------------
+    def latest(self, topic):
+        """
+        Gets the last value of a topic.
+
+        Parameters
+        ----------
+        topic : str
+            The name of topic.
+
+        Returns
+        -------
+        payload : bytes
+            The last payload, None when not cached.
+        """
+        with self._lock:
+            entry = self._values.get(topic)
+        return None if entry is None else entry[0]
+
+    #----------------------------------------------------------------------
+    def latest_many(self, topic_filter):
+        """
+        Gets the last values of the topics matching a topic filter.
+
+        Parameters
+        ----------
+        topic_filter : str
+            Topic filter including '+' and '#' wildcards.
+
+        Returns
+        -------
+        payloads : dict
+            The last payloads keyed by topic.
+        """
+        with self._lock:
+            items = self._values.search(topic_filter)
+        return {topic: entry[0] for topic, entry in items}
+
+    #----------------------------------------------------------------------
+    def updated_at(self, topic):
+        """
+        Gets the time of the last update of a topic.
+
+        Parameters
+        ----------
+        topic : str
+            The name of topic.
+
+        Returns
+        -------
+        updated_at : float
+            time.time() of the last update, None when not cached.
+        """
+        with self._lock:
+            entry = self._values.get(topic)
+        return None if entry is None else entry[1]
+
+    #----------------------------------------------------------------------
+    def save(self):
+        """
+        Saves a snapshot to the file atomically.
+
+        Returns
+        -------
+        is_success : bool
+            True on success, False when any error occurs.
+        """
+        if self.path is None:
+            last_value.logger.error('cannot save: no snapshot path')
+            return False
+
+        with self._lock:
+            items = self._values.items()
+            self._is_dirty = False
+            self._saved_at = time.monotonic()
+
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'wb') as fp:
+                fp.write(last_value._MAGIC)
+                for topic, (payload, updated_at) in items:
+                    btopic = topic.encode('utf-8')
+                    fp.write(last_value._RECORD.pack(len(btopic), len(payload), updated_at,
+                                                     zlib.crc32(payload, zlib.crc32(btopic))))
+                    fp.write(btopic)
+                    fp.write(payload)
+            os.replace(tmp, self.path)
+        except OSError as err:
+            last_value.logger.error('cannot save snapshot {}: {}'.format(self.path, err))
+            return False
+
+        last_value.logger.debug('saved {:d} values to {}'.format(len(items), self.path))
+        return True
+
+    #----------------------------------------------------------------------
+    def load(self):
+        """
+        Loads the snapshot file.  Values newer than the snapshot are kept.
+        Stops at the first broken record.
+
+        Returns
+        -------
+        is_success : bool
+            True on success, False when any error occurs.
+        """
+        try:
+            with open(self.path, 'rb') as fp:
+                data = fp.read()
+        except FileNotFoundError:
+            return True
+        except OSError as err:
+            last_value.logger.error('cannot load snapshot {}: {}'.format(self.path, err))
+            return False
+
+        if not data.startswith(last_value._MAGIC):
+            last_value.logger.error('not a snapshot: {}'.format(self.path))
+            return False
+
+        count = 0
+        offset = len(last_value._MAGIC)
+        size = last_value._RECORD.size
+        with self._lock:
+            while offset + size <= len(data):
+                topic_len, payload_len, updated_at, crc = last_value._RECORD.unpack_from(data, offset)
+                start = offset + size
+                end = start + topic_len + payload_len
+                btopic = data[start:start + topic_len]
+                payload = data[start + topic_len:end]
+                if end > len(data) or zlib.crc32(payload, zlib.crc32(btopic)) != crc:
+                    last_value.logger.warning('broken snapshot record at {:d}'.format(offset))
+                    break
+                topic = btopic.decode('utf-8')
+                entry = self._values.get(topic)
+                if entry is None or entry[1] < updated_at:
+                    self._values[topic] = (payload, updated_at)
+                    count += 1
+                offset = end
+
+        last_value.logger.debug('loaded {:d} values from {}'.format(count, self.path))
+        return True
+
+    #----------------------------------------------------------------------
+    def _tick(self, now):
+        """
+        Saves a snapshot every save_interval when updated.
+        Called by the network loop.
+
+        Parameters
+        ----------
+        now : float
+            Current time.monotonic().
+        """
+        if self.path is None or not self._is_dirty or now - self._saved_at < self.save_interval:
+            return
+        self.save()
+        return
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020, Shigemi ISHIDA
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+import mmap
+import os
+import struct
+import threading
+import time
+from logging import getLogger, NullHandler
+
+#======================================================================
+class capture(object):
+    """
+    Binary log of inbound and outbound messages
+
+    Records are appended to a file as a length prefix followed by the
+    time, direction, QoS, retain flag, topic, and payload, so that a
+    message stream seen by a client can be replayed with replay().
+
+    Attributes
+    ----------
+    logger : logging.Logger
+        Logger object class attribute.  Default handler is NullHandler().
+    INBOUND : int
+        Direction of received messages, i.e., 0.
+    OUTBOUND : int
+        Direction of published messages, i.e., 1.
+    path : str
+        Log file path.
+    records : int
+        Number of records written by this instance.
+    bytes : int
+        Number of bytes written by this instance.
+    """
+
+    logger = getLogger(__name__)
+    logger.addHandler(NullHandler())
+    INBOUND = 0
+    OUTBOUND = 1
+
+    _MAGIC = b'MQCP0001'
+    # record length, time.time(), flags, topic length
+    _RECORD = struct.Struct('<IdBH')
+    _RETAIN = 0x08
+
+    #----------------------------------------------------------------------
+    def __init__(self, path, *, buffer_size=65536, logger=None):
+        """
+        Opens a log file to append records.
+
+        Parameters
+        ----------
+        path : str
+            Log file path, created if not exists.
+        buffer_size : int, default 65536
+            Write buffer size in bytes.
+        logger : logging.Logger, default None
+            Logger object, None to use module internal logging object.
+        """
+        if logger is not None:
+            capture.logger = logger
+
+        self.path = path
+        self.records = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+        self._fp = open(path, 'ab', buffering=buffer_size)
+        if self._fp.tell() == 0:
+            self._fp.write(capture._MAGIC)
+        else:
+            with open(path, 'rb') as fp:
+                magic = fp.read(len(capture._MAGIC))
+            if magic != capture._MAGIC:
+                capture.logger.error('not a capture log: {}'.format(path))
+                self._fp.close()
+                self._fp = None
+
+        return
+
+    #----------------------------------------------------------------------
+    def __del__(self):
+        self.close()
+        return
+
+    #----------------------------------------------------------------------
+    def record(self, direction, topic, payload, qos=0, retain=False, ts=None):
+        """
+        Appends a message to the log.
+
+        Parameters
+        ----------
+        direction : int
+            INBOUND or OUTBOUND.
+        topic : str
+            The name of topic.
+        payload : bytes
+            Message payload.
+        qos : int, default 0
+            Quality of Service of the message.
+        retain : bool, default False
+            A flag to indicate that the message is retained.
+        ts : float, default None
+            time.time() of the message, None to use the current time.
+
+        Returns
+        -------
+        is_success : bool
+            True on success, False when the log is closed.
+        """
+        btopic = topic.encode('utf-8')
+        flags = direction | (qos << 1) | (capture._RETAIN if retain else 0)
+        header = capture._RECORD.pack(capture._RECORD.size - 4 + len(btopic) + len(payload),
+                                      time.time() if ts is None else ts, flags, len(btopic))
+        with self._lock:
+            if self._fp is None:
+                return False
+            self._fp.write(header)
+            self._fp.write(btopic)
+            self._fp.write(payload)
+            self.records += 1
+            self.bytes += len(header) + len(btopic) + len(payload)
+        return True
+
+    #----------------------------------------------------------------------
+    def flush(self):
+        """
+        Writes buffered records to the file.
+        """
+        with self._lock:
+            if self._fp is not None:
+                self._fp.flush()
+        return
+
+    #----------------------------------------------------------------------
+    def close(self):
+        """
+        Flushes and closes the log file.
+        """
+        with self._lock:
+            if self._fp is not None:
+                self._fp.close()
+                self._fp = None
+        return
+
+    #----------------------------------------------------------------------
+    def stats(self):
+        """
+        Gets the numbers of written records and bytes.
+
+        Returns
+        -------
+        stats : dict
+            'records' and 'bytes'.
+        """
+        with self._lock:
+            return {'records': self.records, 'bytes': self.bytes}
+
+    #----------------------------------------------------------------------
+    @staticmethod
+    def read(path):
+        """
+        Reads records of a log file through a memory map.
+        Stops at the first broken record, e.g., a record cut by a crash.
+
+        Parameters
+        ----------
+        path : str
+            Log file path.
+
+        Yields
+        ------
+        record : tuple
+            (ts, direction, topic, payload, qos, retain), where ts is
+            time.time() of the message.
+        """
+        with open(path, 'rb') as fp:
+            if os.fstat(fp.fileno()).st_size <= len(capture._MAGIC):
+                return
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                if buf[:len(capture._MAGIC)] != capture._MAGIC:
+                    capture.logger.error('not a capture log: {}'.format(path))
+                    return
+                offset = len(capture._MAGIC)
+                size = capture._RECORD.size
+                while offset + size <= len(buf):
+                    length, ts, flags, topic_len = capture._RECORD.unpack_from(buf, offset)
+                    end = offset + 4 + length
+                    if length < size - 4 + topic_len or end > len(buf):
+                        capture.logger.warning('broken capture record at {:d}'.format(offset))
+                        break
+                    start = offset + size
+                    topic = buf[start:start + topic_len].decode('utf-8')
+                    yield (ts, flags & 0x01, topic, buf[start + topic_len:end],
+                           (flags >> 1) & 0x03, bool(flags & capture._RETAIN))
+                    offset = end
+        return
+
+#======================================================================
+def replay(cl, path, speed=1.0, *, direction=capture.OUTBOUND):
+    """
+    Publishes the messages of a capture log through a client.
+
+    Parameters
+    ----------
+    cl : mqbeebotte.client
+        Connected client to publish the messages.
+    path : str
+        Capture log file path.
+    speed : float, default 1.0
+        Speed relative to the original intervals of the messages, e.g.,
+        2.0 for twice as fast, None or 0 for maximum speed.
+    direction : int, default capture.OUTBOUND
+        Direction of the messages to publish, capture.INBOUND,
+        capture.OUTBOUND, or None for both.
+
+    Returns
+    -------
+    count : int
+        Number of published messages.  Messages failed to be published
+        are not counted.
+    """
+    count = 0
+    first_ts = None
+    for ts, msg_direction, topic, payload, qos, retain in capture.read(path):
+        if direction is not None and msg_direction != direction:
+            continue
+        if speed:
+            if first_ts is None:
+                first_ts = ts
+                started_at = time.monotonic()
+            delay = started_at + (ts - first_ts) / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        if cl.publish(topic, payload, qos, retain):
+            count += 1
+
+    capture.logger.debug('replayed {:d} messages from {}'.format(count, path))
+    return count
@@ -26,9 +26,21 @@
 # OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
 # SUCH DAMAGE.
 
+import collections
+import random
 import threading
+import time
 import paho.mqtt.client as mqtt
-from logging import getLogger, NullHandler
+from logging import getLogger, NullHandler, DEBUG
+from mqbeebotte.topic import topic_trie
+from mqbeebotte.codec import message, encode, envelope
+from mqbeebotte.metrics import metrics
+from mqbeebotte.inflight import inflight
+from mqbeebotte.stream import message_stream
+from mqbeebotte.rest import rest_writer
+from mqbeebotte.reactor import reactor as event_loop
+from mqbeebotte.capture import capture as capture_log
+from mqbeebotte.tls import tls_context, tls_socket
 
 #======================================================================
 class client(threading.Thread):
@@ -45,14 +57,52 @@ class client(threading.Thread):
         Default port number class attribute, i.e., 1883.
     PORT_SSL : int
         Default port number class attribute, i.e., 8883, for SSL connection.
+    RECONNECT_MIN_DELAY : float
+        Default initial reconnect delay in seconds, i.e., 1.
+    RECONNECT_MAX_DELAY : float
+        Default maximum reconnect delay in seconds, i.e., 120.
+    DISCONNECT_TIMEOUT : float
+        Default time in seconds for disconnect() to wait for
+        outstanding messages, i.e., 30.
+    MAX_INFLIGHT : int
+        Default maximum number of QoS 1/2 messages waiting for
+        completion, i.e., 65535.
     host : str
         MQTT server name to connect.
     port : int
         MQTT server port number.
     ca_cert : str
         CA Certificate file path.
+    spool : mqbeebotte.spool
+        On-disk spool of outbound messages, None when not used.
+    dispatcher : mqbeebotte.dispatcher
+        Worker threads to run message callbacks, None to run them on
+        the network loop thread.
+    rate_limit : mqbeebotte.rate_limiter
+        Publish rate limiter, None when not used.
+    dedup : mqbeebotte.dedup
+        Index of received messages to drop redeliveries, None when
+        not used.
+    cache : mqbeebotte.last_value
+        Cache of the last payload of each topic, None when not used.
+    rest : mqbeebotte.rest_writer
+        REST API bulk writer used by write_many(), None until needed.
+    capture : mqbeebotte.capture
+        Binary log of received and published messages, None when not
+        used.
+    metrics : mqbeebotte.metrics
+        Publish/receive counters and latency histograms.
+    reactor : mqbeebotte.reactor
+        Shared network loop thread, None to run own network loop thread.
     topics : list
         Subscribed topics.
+    auto_reconnect : bool
+        A flag to indicate to reconnect when the connection is lost.
+    reconnect_count : int
+        Number of successful reconnections.
+    recover_time : float
+        Seconds from the last connection loss to the reconnection,
+        None before any reconnection.
     """
 
     logger = getLogger(__name__)
@@ -60,9 +110,19 @@ class client(threading.Thread):
     HOST = 'mqtt.beebotte.com'
     PORT = 1883
     PORT_SSL = 8883
+    RECONNECT_MIN_DELAY = 1.0
+    RECONNECT_MAX_DELAY = 120.0
+    DISCONNECT_TIMEOUT = 30.0
+    MAX_INFLIGHT = 65535
+    # early completions kept for publish() to pick up
+    _EARLY_MAX = 1024
 
     #----------------------------------------------------------------------
-    def __init__(self, host=None, port=None, ca_cert=None, *, logger=None):
+    def __init__(self, host=None, port=None, ca_cert=None, *, spool=None, dispatcher=None,
+                 rate_limit=None, dedup=None, cache=None, rest=None, capture=None,
+                 reactor=None, auto_reconnect=True, reconnect_min_delay=None,
+                 reconnect_max_delay=None, max_inflight=None, exporter=None,
+                 export_interval=10.0, logger=None):
         """
         Creates and maintains connection parameters and a logger instance.
         
@@ -76,6 +136,60 @@ class client(threading.Thread):
             i.e., 1883 for non-SSL connection and 8883 for SSL connection.
         ca_cert : str, default None
             CA Certificate file path, None for non-SSL connection.
+        spool : mqbeebotte.spool, default None
+            On-disk spool to keep outbound messages until published.
+            Messages published while not connected are kept in the spool
+            and replayed in order on connect, and those failed to be
+            published while connected are retried.
+        dispatcher : mqbeebotte.dispatcher, default None
+            Worker threads to run on_message and subscription callbacks
+            so that slow callbacks do not stall the network loop.
+            None to run the callbacks on the network loop thread.
+        rate_limit : mqbeebotte.rate_limiter, default None
+            Publish rate limiter to pace messages under the server limits.
+            publish() waits for or rejects messages over the rate
+            depending on the limiter mode.
+        dedup : mqbeebotte.dedup, default None
+            Index of received messages.  Messages found in the index,
+            e.g., QoS 1 redeliveries after reconnection, are dropped
+            before any callback is called.
+        cache : mqbeebotte.last_value, default None
+            Cache updated with received and published messages to be
+            looked up with latest() and latest_many().  Its snapshot
+            is saved periodically by the network loop and on
+            disconnect().
+        rest : mqbeebotte.rest_writer, default None
+            REST API bulk writer used by write_many(), None to create
+            one with the token given to connect() when needed.
+        capture : mqbeebotte.capture, default None
+            Binary log to record every received and published message,
+            to be replayed with mqbeebotte.replay().  Flushed on
+            disconnect().
+        reactor : mqbeebotte.reactor, default None
+            Shared network loop thread driving the socket instead of
+            the own thread of this instance.  start() and stop() attach
+            and detach this instance to and from the reactor.
+        auto_reconnect : bool, default True
+            A flag to indicate to reconnect when the connection is lost
+            while the network loop thread is running.  The subscribed
+            topics are restored with a single SUBSCRIBE on reconnection.
+        reconnect_min_delay : float, default None
+            Initial reconnect delay in seconds, None to use
+            RECONNECT_MIN_DELAY.  The upper bound of the delay is doubled
+            on every failure and the delay is randomized up to the bound
+            to avoid reconnecting at the same moment as other clients.
+        reconnect_max_delay : float, default None
+            Maximum reconnect delay in seconds, None to use
+            RECONNECT_MAX_DELAY.
+        max_inflight : int, default None
+            Maximum number of QoS 1/2 messages waiting for completion,
+            up to 65535, None to use MAX_INFLIGHT.  publish() fails
+            while the limit is reached.
+        exporter : function, default None
+            Callback function called with stats() every export_interval
+            seconds on the network loop thread.
+        export_interval : float, default 10.0
+            Interval in seconds to call exporter.
         logger : logging.Logger, default None
             Logger object, None to use module internal logging object.
         """
@@ -92,15 +206,73 @@ class client(threading.Thread):
         if logger is not None:
             client.logger = logger
 
-        self.topics = []
-
-        self._pubs = {}
+        self.spool = spool
+        self.dispatcher = dispatcher
+        self.rate_limit = rate_limit
+        self.dedup = dedup
+        self.cache = cache
+        self.rest = rest
+        self.capture = capture
+        self._token = None
+        self.reactor = reactor
+        # network loop driving this instance; a private one is created by
+        # start() to run in this thread
+        self._loop = reactor
+        self.metrics = metrics()
+        self._exporter = exporter
+        self._export_interval = export_interval
+        self.auto_reconnect = auto_reconnect
+        self.reconnect_count = 0
+        self.recover_time = None
+        self._reconnect_min_delay = (reconnect_min_delay if reconnect_min_delay is not None
+                                     else client.RECONNECT_MIN_DELAY)
+        self._reconnect_max_delay = (reconnect_max_delay if reconnect_max_delay is not None
+                                     else client.RECONNECT_MAX_DELAY)
+        self._reconnect_attempts = 0
+        self._lost_at = None
+        self._reconnect_at = None
+        self._is_reconnecting = False
+        self._exported_at = time.monotonic()
+
+        # subscribed topic -> qos
+        self._subs = {}
+        # subscribed topic -> callback
+        self._handlers = topic_trie()
+        # topic -> stream returned by messages()
+        self._streams = {}
+        self._on_message = None
+
+        self._pubs = inflight(max_inflight if max_inflight is not None else client.MAX_INFLIGHT)
+        # mid -> time.perf_counter() of on_publish before publish() returns
+        self._pubs_early = {}
+        # mid -> errback of in-flight messages given one
+        self._errbacks = {}
         self._pubs_lock = threading.RLock()
+        # notified whenever an entry leaves _pubs
+        self._pubs_cond = threading.Condition(self._pubs_lock)
         self._client = None
         self._is_running = False
+        # socket events are routed to self._loop between start() and stop()
+        self._is_attached = False
+        self._on_connect = None
+        # spool seqs handed to the current paho client
+        self._spool_sent = set()
+        # spooled messages to be handed to paho in order, i.e., the head
+        # is the first unsent one, as (seq, topic, msg, qos, retain, callback)
+        self._spool_backlog = collections.deque()
+        self._spool_lock = threading.RLock()
+        self._spool_blocked = False
 
         return
 
+    #----------------------------------------------------------------------
+    @property
+    def topics(self):
+        """
+        Subscribed topics.
+        """
+        return list(self._subs)
+
     #----------------------------------------------------------------------
     def __del__(self):
         """
@@ -111,47 +283,323 @@ class client(threading.Thread):
         return
 
     #----------------------------------------------------------------------
-    def __on_connect(self, client, userdata, flags, respons_code):
+    def __on_connect(self, mqttc, userdata, flags, respons_code):
         client.logger.debug('connected to {}'.format(self.host))
+        sock = mqttc.socket()
+        if isinstance(sock, tls_socket) and sock.handshake_time is not None:
+            self.metrics.on_handshake(sock.handshake_time, sock.session_reused)
+            # TLS 1.3 session tickets are received after the handshake
+            sock.context.keep_session(sock)
+        if respons_code == mqtt.CONNACK_ACCEPTED:
+            if self._lost_at is not None:
+                self.__on_reconnect(flags)
+            if self.spool is not None:
+                self.__replay_spool()
+        if self._on_connect is not None:
+            self._on_connect(mqttc, userdata, flags, respons_code)
         return
    
     #----------------------------------------------------------------------
-    def __on_message(self, client, userdata, msg):
-        client.logger.debug('{} {}'.format(msg.topic, str(msg.payload)))
-        client.logger.debug(msg.payload.decode("utf-8"))
+    def __on_disconnect(self, mqttc, userdata, respons_code):
+        if respons_code != mqtt.MQTT_ERR_SUCCESS and self._lost_at is None:
+            client.logger.warning('connection lost from {}, rc={:d}'.format(self.host, respons_code))
+            self._lost_at = time.monotonic()
+        return
+
+    #----------------------------------------------------------------------
+    def __on_reconnect(self, flags):
+        self.recover_time = time.monotonic() - self._lost_at
+        self.reconnect_count += 1
+        self._lost_at = None
+        self._reconnect_attempts = 0
+        client.logger.info('reconnected to {} in {:.3f}s'.format(self.host, self.recover_time))
+
+        # restore all the subscriptions at once
+        if flags.get('session present', 0) == 0 and len(self._subs) > 0:
+            client.logger.debug('resubscribe topics {}'.format(', '.join(self._subs)))
+            self._client.subscribe(list(self._subs.items()))
+        return
+
+    #----------------------------------------------------------------------
+    def __reconnect_delay(self):
+        if self._lost_at is None:
+            self._lost_at = time.monotonic()
+
+        # exponential backoff with full jitter, the exponent capped not to
+        # overflow on a long outage
+        exponent = min(self._reconnect_attempts, 30)
+        delay = random.uniform(0, min(self._reconnect_max_delay,
+                                      self._reconnect_min_delay * (2 ** exponent)))
+        self._reconnect_attempts += 1
+        client.logger.debug('reconnect to {} in {:.3f}s'.format(self.host, delay))
+        return delay
+
+    #----------------------------------------------------------------------
+    def __reconnect_now(self):
+        mqttc = self._client
+        try:
+            if mqttc is not None:
+                mqttc.reconnect()
+        except OSError as err:
+            client.logger.warning('cannot reconnect to {}: {}'.format(self.host, err))
+        finally:
+            self._is_reconnecting = False
+        return
+
+    #----------------------------------------------------------------------
+    def _loop_misc(self, now):
+        """
+        Processes keepalive, reconnection, and stats export.
+        Called by the network loop every reactor.MISC_INTERVAL.
+
+        Parameters
+        ----------
+        now : float
+            Current time.monotonic().
+
+        Returns
+        -------
+        when : float
+            time.monotonic() to be called again at, None to wait for
+            the next interval.
+        """
+        if self._exporter is not None and now - self._exported_at >= self._export_interval:
+            self._exported_at = now
+            try:
+                self._exporter(self.stats())
+            except Exception:
+                client.logger.exception('error in exporter')
+        if self.cache is not None:
+            self.cache._tick(now)
+
+        mqttc = self._client
+        if mqttc is None or self._is_reconnecting:
+            return None
+
+        if mqttc.socket() is not None:
+            mqttc.loop_misc()
+            if len(self._spool_backlog) > 0:
+                self.__drain_spool()
+            return None
+
+        if not self.auto_reconnect:
+            return None
+        if self._reconnect_at is None:
+            self._reconnect_at = now + self.__reconnect_delay()
+        if now < self._reconnect_at:
+            return self._reconnect_at
+
+        self._reconnect_at = None
+        self._is_reconnecting = True
+        self._loop._reconnect(self.__reconnect_now)
+        return None
+
+    #----------------------------------------------------------------------
+    def __dispatch(self, mqttc, userdata, msg):
+        self.metrics.on_receive(len(msg.payload))
+        if self.capture is not None:
+            self.capture.record(capture_log.INBOUND, msg.topic, msg.payload, msg.qos, msg.retain)
+        msg = message(msg)
+        if self.dedup is not None and self.dedup.is_duplicate(msg):
+            client.logger.debug('drop duplicate on {}'.format(msg.topic))
+            return
+        if self.cache is not None:
+            self.cache.update(msg.topic, msg.payload)
+        if self.dispatcher is not None:
+            self.dispatcher.submit(msg.topic, self.__handle, mqttc, userdata, msg)
+            return
+
+        self.__handle(mqttc, userdata, msg)
+        return
+
+    #----------------------------------------------------------------------
+    def __handle(self, mqttc, userdata, msg):
+        handlers = self._handlers.match(msg.topic)
+        if len(handlers) == 0:
+            self._on_message(mqttc, userdata, msg)
+            return
+
+        for handler in handlers:
+            handler(mqttc, userdata, msg)
+        return
+
+    #----------------------------------------------------------------------
+    def __on_message(self, mqttc, userdata, msg):
+        if client.logger.isEnabledFor(DEBUG):
+            client.logger.debug('{} {}'.format(msg.topic, msg.payload.decode('utf-8', 'replace')))
         return
 
     #----------------------------------------------------------------------
-    def __check_published(self):
-        remove_targets = []
+    def __on_publish(self, mqttc, userdata, mid):
         with self._pubs_lock:
-            for mid, pub in self._pubs.items():
-                if pub.is_published():
-                    remove_targets.append(mid)
+            entry = self._pubs.pop(mid)
+            if len(self._errbacks) > 0:
+                self._errbacks.pop(mid, None)
+            if entry is None:
+                # on_publish came before publish() registered the mid,
+                # or the mid is of a QoS 0 message not registered at all
+                self._pubs_early[mid] = time.perf_counter()
+                if len(self._pubs_early) > client._EARLY_MAX:
+                    del self._pubs_early[next(iter(self._pubs_early))]
+                return
+            self._pubs_cond.notify_all()
+
+        if client.logger.isEnabledFor(DEBUG):
+            client.logger.debug('remove mid={:d}'.format(mid))
+        qos, published_at, callback = entry
+        self.metrics.on_ack(qos, time.perf_counter() - published_at)
+        if callback is not None:
+            callback(mid)
+        # the room may be taken by the spool unless another thread is
+        # already draining it
+        if len(self._spool_backlog) > 0 and self._spool_lock.acquire(blocking=False):
+            try:
+                self.__drain_spool()
+            finally:
+                self._spool_lock.release()
+        return
+
+    #----------------------------------------------------------------------
+    def __track_published(self, mid, msg, qos, callback, errback, published_at):
+        self.metrics.on_publish(1, len(msg) if isinstance(msg, (str, bytes, bytearray)) else 0)
+        if qos == 0:
+            # QoS 0 messages complete once queued and are never kept
+            self.metrics.on_ack(0, time.perf_counter() - published_at)
+            if callback is not None:
+                callback(mid)
+            return
 
         with self._pubs_lock:
-            for mid in remove_targets:
-                client.logger.debug('remove mid={:d}'.format(mid))
-                del self._pubs[mid]
+            acked_at = self._pubs_early.pop(mid, None)
+            # marks older than the publish are left by a previous use of the mid
+            if acked_at is not None and acked_at >= published_at:
+                self._pubs.release()
+                is_done = True
+            else:
+                self._pubs.add(mid, qos, published_at, callback)
+                if errback is not None:
+                    self._errbacks[mid] = errback
+                is_done = False
+
+        if is_done:
+            self.metrics.on_ack(qos, acked_at - published_at)
+            if callback is not None:
+                callback(mid)
+        return
+
+    #----------------------------------------------------------------------
+    @staticmethod
+    def __payload_bytes(msg):
+        # payload as sent by paho
+        if isinstance(msg, str):
+            return msg.encode('utf-8')
+        if isinstance(msg, (bytes, bytearray)):
+            return bytes(msg)
+        if msg is None:
+            return b''
+        return str(msg).encode('ascii')
+
+    #----------------------------------------------------------------------
+    def __publish(self, topic, msg, qos, retain, callback, errback=None):
+        if qos > 0:
+            with self._pubs_lock:
+                is_reserved = self._pubs.reserve()
+            if not is_reserved:
+                client.logger.error('cannot publish: {:d} messages in flight'.format(self._pubs.capacity))
+                return False
+
+        published_at = time.perf_counter()
+        try:
+            pub = self._client.publish(topic, msg, qos, retain)
+        except ValueError:
+            if qos > 0:
+                with self._pubs_lock:
+                    self._pubs.release()
+            raise
+        if qos == 0 and pub.rc != mqtt.MQTT_ERR_SUCCESS:
+            # QoS 0 messages are not queued by paho
+            client.logger.error('publish error: rc={:d}'.format(pub.rc))
+            return False
+        self.__track_published(pub.mid, msg, qos, callback, errback, published_at)
+        if self.cache is not None or self.capture is not None:
+            payload = client.__payload_bytes(msg)
+            if self.cache is not None:
+                self.cache.update(topic, payload)
+            if self.capture is not None:
+                self.capture.record(capture_log.OUTBOUND, topic, payload, qos, retain)
+
+        return True
+
+    #----------------------------------------------------------------------
+    def __publish_spooled(self, seq, topic, msg, qos, retain, callback):
+        def on_published(mid):
+            with self._pubs_lock:
+                self._spool_sent.discard(seq)
+            self.spool.ack(seq)
+            if callback is not None:
+                callback(mid)
+
+        with self._pubs_lock:
+            self._spool_sent.add(seq)
+        if not self.__publish(topic, msg, qos, retain, on_published):
+            with self._pubs_lock:
+                self._spool_sent.discard(seq)
+            return False
+
+        return True
 
+    #----------------------------------------------------------------------
+    def __drain_spool(self):
+        # stops at the first message paho cannot take to keep the order
+        with self._spool_lock:
+            while len(self._spool_backlog) > 0:
+                seq, topic, msg, qos, retain, callback = self._spool_backlog[0]
+                if qos > 0:
+                    with self._pubs_lock:
+                        is_full = self._pubs.is_full()
+                    if is_full:
+                        if not self._spool_blocked:
+                            self._spool_blocked = True
+                            client.logger.warning('spool waiting: {:d} messages in flight'.format(self._pubs.capacity))
+                        return
+                if not self.__publish_spooled(seq, topic, msg, qos, retain, callback):
+                    return
+                self._spool_backlog.popleft()
+            self._spool_blocked = False
+        return
+
+    #----------------------------------------------------------------------
+    def __replay_spool(self):
+        with self._spool_lock:
+            # keeps the callbacks of the messages not handed to paho yet
+            callbacks = {entry[0]: entry[5] for entry in self._spool_backlog if entry[5] is not None}
+            with self._pubs_lock:
+                sent = set(self._spool_sent)
+            self._spool_backlog = collections.deque(
+                (seq, topic, payload, qos, retain, callbacks.get(seq))
+                for seq, topic, payload, qos, retain in self.spool.pending() if seq not in sent)
+            client.logger.debug('replaying {:d} spooled messages'.format(len(self._spool_backlog)))
+            self.__drain_spool()
         return
 
     #----------------------------------------------------------------------
     def __unsubscribe_multiple(self, topics):
         for topic in topics:
             # check if topic is subscribed
-            if topic in self.topics:
+            if topic in self._subs:
                 client.logger.debug('unsubscribe from {}'.format(topic))
                 self._client.unsubscribe(topic)
-                self.topics.remove(topic)
+                del self._subs[topic]
+                self._handlers.pop(topic)
                 client.logger.debug('unsubscribed from {}'.format(topic))
             else:
                 client.logger.debug('not subscribed to {}'.format(topic))
+        self.__close_streams(topics)
 
         return True
 
     #----------------------------------------------------------------------
-    def __subscribe_multiple(self, topic_qos):
+    def __subscribe_multiple(self, topic_qos, callback):
         # check if qos is provided
         if type(topic_qos[0]) is tuple:
             # extract topics
@@ -161,22 +609,45 @@ class client(threading.Thread):
             topic_qos = list(zip(topics, [0]*len(topics)))
 
         # check if topics are already subscribed
-        if len(set(topics) & set(self.topics)) != 0:
-            subed_topics = set(topics) & set(self.topics)
+        subed_topics = [topic for topic in topics if topic in self._subs]
+        if len(subed_topics) != 0:
             client.logger.error('topics are already subscribed: {}'.format(', '.join(list(subed_topics))))
             return False
 
         client.logger.debug('subscribe topics {}'.format(', '.join(topics)))
         result, mid = self._client.subscribe(topic_qos)
-        if result is not mqtt.MQTT_ERR_SUCCESS:
+        if result == mqtt.MQTT_ERR_NO_CONN and self.auto_reconnect:
+            client.logger.warning('not connected: subscribe on reconnection')
+        elif result is not mqtt.MQTT_ERR_SUCCESS:
             client.logger.error('subscribe error')
             return False
 
-        self.topics.extend(topics)
+        self._subs.update(topic_qos)
+        if callback is not None:
+            for topic in topics:
+                self._handlers[topic] = callback
         client.logger.debug('subscribed topics {}'.format(', '.join(topics)))
 
         return True
 
+    #----------------------------------------------------------------------
+    def __close_stream(self, topic, stream):
+        if self._streams.get(topic) is stream:
+            del self._streams[topic]
+        # keep the subscription when disconnected or taken over
+        if self._client is None or self._handlers.get(topic) != stream._put:
+            return
+        self.unsubscribe(topic)
+        return
+
+    #----------------------------------------------------------------------
+    def __close_streams(self, topics):
+        # wakes up consumers waiting for the topics no longer subscribed
+        streams = [self._streams.pop(topic) for topic in topics if topic in self._streams]
+        for stream in streams:
+            stream.close()
+        return
+
     #----------------------------------------------------------------------
     def connect(self, token, on_connect=None, on_message=None):
         """
@@ -194,7 +665,11 @@ class client(threading.Thread):
             See https://pypi.org/project/paho-mqtt/ for more details.
         on_message : function, default None
             Callback function called when an instance gets message
-            from the connected MQTT server.
+            from the connected MQTT server and no callback is given to
+            the matching subscriptions.
+            The message is passed as mqbeebotte.codec.message, which
+            provides the attributes of paho MQTTMessage and the parsed
+            Beebotte message fields.
             See https://pypi.org/project/paho-mqtt/ for more details.
 
         Returns
@@ -207,12 +682,20 @@ class client(threading.Thread):
             return False
 
         self._client = mqtt.Client()
-        self._client.on_connect = on_connect if on_connect is not None else self.__on_connect
-        self._client.on_message = on_message if on_message is not None else self.__on_message
+        self._on_connect = on_connect
+        self._client.on_connect = self.__on_connect
+        self._on_message = on_message if on_message is not None else self.__on_message
+        self._client.on_message = self.__dispatch
+        self._client.on_disconnect = self.__on_disconnect
+        self._client.on_publish = self.__on_publish
+        self._token = token
         self._client.username_pw_set('token:{}'.format(token))
         if self.ca_cert is not None:
             client.logger.debug('use ca_cert: {}'.format(self.ca_cert))
-            self._client.tls_set(self.ca_cert)
+            # shared by instances to load ca_cert once and resume sessions
+            self._client.tls_set_context(tls_context.get(self.ca_cert))
+        if self._is_attached:
+            self._loop._bind(self, self._client)
 
         client.logger.debug('connecting to {}:{:d}'.format(self.host, self.port))
         self._client.connect(self.host, self.port)
@@ -221,19 +704,71 @@ class client(threading.Thread):
         return True
 
     #----------------------------------------------------------------------
-    def disconnect(self):
+    def flush(self, timeout=None):
+        """
+        Waits for outstanding messages to be published.
+        Messages published after the call are not waited for.
+        QoS 0 messages are complete once queued.
+
+        Parameters
+        ----------
+        timeout : float, default None
+            Maximum time in seconds to wait for all the messages,
+            None to wait forever.
+
+        Returns
+        -------
+        pending : list
+            mids of messages not published within timeout, empty when
+            all the messages are published.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._pubs_cond:
+            mids = list(self._pubs)
+            while True:
+                mids = [mid for mid in mids if mid in self._pubs]
+                if len(mids) == 0:
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                # releases the lock while waiting for on_publish
+                self._pubs_cond.wait(remaining)
+
+        if len(mids) > 0:
+            client.logger.warning('{:d} messages not published in {}s'.format(len(mids), timeout))
+        return sorted(mids)
+
+    #----------------------------------------------------------------------
+    def disconnect(self, timeout=None):
         """
         Disconnects from a MQTT server.
 
+        Parameters
+        ----------
+        timeout : float, default None
+            Maximum time in seconds to wait for outstanding messages,
+            None to use client.DISCONNECT_TIMEOUT.
+            Messages not published by then are discarded, and their
+            errbacks are called, or left in the spool to be published
+            on the next connection.
+
         Returns
         -------
         is_success : bool
-            True on success, False when any error occurs.
+            True on success, False when any error occurs or any message
+            is discarded.
         """
         if self._client is None:
             return True
 
-        self._client.loop_start()
+        if timeout is None:
+            timeout = client.DISCONNECT_TIMEOUT
+
+        # run paho network loop unless any loop drives this instance
+        use_paho_loop = not self._is_attached
+        if use_paho_loop:
+            self._client.loop_start()
 
         # unsubscribe from all topics
         client.logger.debug('unsubscribe all topics')
@@ -241,17 +776,30 @@ class client(threading.Thread):
 
         # wait for all publish requests to be published
         client.logger.debug('wait for all topics to be published')
-        with self._pubs_lock:
-            while len(self._pubs) > 0:
-                mid, pub = self._pubs.popitem()
-                client.logger.debug('wait for mid={:d}'.format(mid))
-                pub.wait_for_publish()
+        pending = self.flush(timeout)
 
-        self._client.loop_stop()
+        # paho loop thread does not stop while messages are unacknowledged
         self._client.disconnect()
+        if use_paho_loop:
+            self._client.loop_stop()
         self._client = None
-
-        return True
+        if self.cache is not None and self.cache.path is not None:
+            self.cache.save()
+        if self.capture is not None:
+            self.capture.flush()
+        with self._pubs_lock:
+            # mids are reused by the next connection
+            discarded = [(mid, self._errbacks[mid]) for mid in self._pubs if mid in self._errbacks]
+            self._pubs.clear()
+            self._pubs_early.clear()
+            self._errbacks.clear()
+            self._spool_sent.clear()
+            self._spool_blocked = False
+            self._pubs_cond.notify_all()
+        for mid, errback in discarded:
+            errback(mid)
+
+        return len(pending) == 0
 
     #----------------------------------------------------------------------
     def unsubscribe(self, topics):
@@ -274,19 +822,25 @@ class client(threading.Thread):
             return False
 
         if topics is None:
-            client.logger.debug('unsubscribe from all: {}'.format(', '.join(self.topics)))
-            self._client.unsubscribe(self.topics)
-            self.topics = []
+            if len(self._subs) == 0:
+                return True
+            client.logger.debug('unsubscribe from all: {}'.format(', '.join(self._subs)))
+            self._client.unsubscribe(list(self._subs))
+            self._subs = {}
+            self._handlers = topic_trie()
+            self.__close_streams(list(self._streams))
             client.logger.debug('unsubscribed all')
             return True
 
         if type(topics) is list:
             return self.__unsubscribe_multiple(topics)
 
-        if topics in self.topics:
+        if topics in self._subs:
             client.logger.debug('unsubscribe from {}'.format(topics))
             self._client.unsubscribe(topics)
-            self.topics.remove(topics)
+            del self._subs[topics]
+            self._handlers.pop(topics)
+            self.__close_streams([topics])
             client.logger.debug('unsubscribed from {}'.format(topics))
         else:
             client.logger.debug('not subscribed to {}'.format(topics))
@@ -294,7 +848,7 @@ class client(threading.Thread):
         return True
 
     #----------------------------------------------------------------------
-    def subscribe(self, topics, qos=0):
+    def subscribe(self, topics, qos=0, *, callback=None):
         """
         Subscribes to a single topic or multiple topics.
 
@@ -306,6 +860,10 @@ class client(threading.Thread):
         qos : int, default 0
             The integer of 0, 1, or 2 to specify Quality of Service
             for the subscription.  When topics is a list, qos is ignored.
+        callback : function, default None
+            Callback function called instead of on_message when an
+            instance gets message matching the topics.  Called with the
+            same arguments as on_message.
 
         Returns
         -------
@@ -317,10 +875,12 @@ class client(threading.Thread):
             return False
 
         if type(topics) is list:
-            return self.__subscribe_multiple(topics)
+            return self.__subscribe_multiple(topics, callback)
 
-        if topics in self.topics:
+        if topics in self._subs:
             client.logger.warning('already subscribed to {}'.format(topics))
+            if callback is not None:
+                self._handlers[topics] = callback
             return True
 
         if type(topics) is not str:
@@ -329,17 +889,99 @@ class client(threading.Thread):
 
         client.logger.debug('subscribe to {}'.format(topics))
         result, mid = self._client.subscribe(topics, qos)
-        if result is not mqtt.MQTT_ERR_SUCCESS:
+        if result == mqtt.MQTT_ERR_NO_CONN and self.auto_reconnect:
+            client.logger.warning('not connected: subscribe to {} on reconnection'.format(topics))
+        elif result is not mqtt.MQTT_ERR_SUCCESS:
             client.logger.error('subscribe error')
             return False
 
-        self.topics.append(topics)
-        client.logger.debug('subscribed to {}, mid={:d}'.format(topics, mid))
+        self._subs[topics] = qos
+        if callback is not None:
+            self._handlers[topics] = callback
+        client.logger.debug('subscribed to {}, mid={}'.format(topics, mid))
 
         return True
 
     #----------------------------------------------------------------------
-    def publish(self, topic, msg, qos=0, retain=False):
+    def messages(self, topic, maxlen=10000, timeout=None, qos=0):
+        """
+        Subscribes to a topic and returns a stream to pull its messages.
+
+        The stream replaces the callback of the topic, if any, and
+        closes the previous stream of the topic.  Closing the stream
+        unsubscribes from the topic.  The stream is closed when
+        unsubscribed from the topic or disconnected.
+
+        Parameters
+        ----------
+        topic : str
+            A name of topic to be subscribed, wildcards allowed.
+        maxlen : int, default 10000
+            Maximum number of buffered messages.  The oldest message is
+            dropped when the buffer is full.
+        timeout : float, default None
+            Timeout in seconds for iterating over the stream,
+            None to wait forever.
+        qos : int, default 0
+            The integer of 0, 1, or 2 to specify Quality of Service
+            for the subscription.
+
+        Returns
+        -------
+        stream : mqbeebotte.message_stream
+            Stream of messages, None when any error occurs.
+        """
+        stream = message_stream(maxlen, timeout, on_close=lambda: self.__close_stream(topic, stream))
+        if not self.subscribe(topic, qos, callback=stream._put):
+            return None
+        self.__close_streams([topic])
+        self._streams[topic] = stream
+
+        return stream
+
+    #----------------------------------------------------------------------
+    def latest(self, topic):
+        """
+        Gets the last payload of a topic from the cache.
+
+        Parameters
+        ----------
+        topic : str
+            The name of topic.
+
+        Returns
+        -------
+        payload : bytes
+            The last payload, None when not cached or no cache is used.
+        """
+        if self.cache is None:
+            client.logger.error('cannot look up: no cache')
+            return None
+        return self.cache.latest(topic)
+
+    #----------------------------------------------------------------------
+    def latest_many(self, topic_filter):
+        """
+        Gets the last payloads of the topics matching a topic filter
+        from the cache.
+
+        Parameters
+        ----------
+        topic_filter : str
+            Topic filter including '+' and '#' wildcards.
+
+        Returns
+        -------
+        payloads : dict
+            The last payloads keyed by topic, empty when no cache is used.
+        """
+        if self.cache is None:
+            client.logger.error('cannot look up: no cache')
+            return {}
+        return self.cache.latest_many(topic_filter)
+
+    #----------------------------------------------------------------------
+    def publish(self, topic, msg, qos=0, retain=False, *, callback=None, errback=None):
         """
         Publishes a message to a topic.
 
@@ -353,63 +995,541 @@ class client(threading.Thread):
             An integer of 0, 1, or 2 to specify Quality of Service for publish.
         retain : bool
             A flag to indicate that the message will be retained.
+        callback : function, default None
+            Callback function called with the message ID when the message
+            is published, i.e., when it is queued for QoS 0 or when
+            PUBACK/PUBCOMP is received for QoS 1/2.
+            Called in this method for QoS 0 and on the network loop
+            thread for QoS 1/2.
+        errback : function, default None
+            Callback function called with the message ID when a QoS 1/2
+            message is discarded by disconnect() before completion.
+            Not called for messages kept in the spool.
 
         Returns
         -------
         is_success : bool
-            True on success, False when any error occurs.
+            True on success, False when any error occurs, the message
+            is rejected by the rate limiter, or max_inflight messages
+            are waiting for completion.
+            True when the message is kept in the spool.  Spooled messages
+            paho cannot take while connected, e.g., with max_inflight
+            messages in flight, are retried in order as messages complete,
+            on the next publish(), and every reactor.MISC_INTERVAL.
         """
+        if self.rate_limit is not None and not self.rate_limit.acquire(topic):
+            client.logger.warning('rate limited: {}'.format(topic))
+            return False
+
+        if self.spool is not None:
+            with self._spool_lock:
+                seq = self.spool.append(topic, msg, qos, retain)
+                if self._client is None:
+                    client.logger.debug('spooled {}: not connected'.format(topic))
+                    return True
+                self._spool_backlog.append((seq, topic, msg, qos, retain, callback))
+                self.__drain_spool()
+            return True
+
         if self._client is None:
             client.logger.error('cannot publish: not connected')
             return False
 
-        client.logger.debug('publish {}'.format(topic))
-        pub = self._client.publish(topic, msg, qos, retain)
-        with self._pubs_lock:
-            self._pubs[pub.mid] = pub
-        client.logger.debug('published {}'.format(topic))
+        if not self.__publish(topic, msg, qos, retain, callback, errback):
+            return False
+        if client.logger.isEnabledFor(DEBUG):
+            client.logger.debug('published {}'.format(topic))
 
         return True
 
+    #----------------------------------------------------------------------
+    def _publish_resource(self, res, payload, callback):
+        """
+        Publishes an encoded message to the topic of a resource handle
+        without logging on success.  QoS 0 messages without callback
+        are not tracked and their latency is not recorded.  Called by
+        resource.
+
+        Parameters
+        ----------
+        res : mqbeebotte.resource
+            Resource handle with a validated topic.
+        payload : bytes
+            Encoded message.
+        callback : function
+            Callback function called with the message ID when the
+            message is published.
+
+        Returns
+        -------
+        is_success : bool
+            True on success, False when any error occurs.
+        """
+        if self.spool is not None or self._client is None:
+            return self.publish(res.topic, payload, res.qos, res.retain, callback=callback)
+        if self.rate_limit is not None and not self.rate_limit.acquire(res.topic):
+            client.logger.warning('rate limited: {}'.format(res.topic))
+            return False
+        if res.qos > 0 or callback is not None or self.cache is not None or self.capture is not None:
+            return self.__publish(res.topic, payload, res.qos, res.retain, callback)
+
+        # nothing to wait for nor to record but the counters
+        pub = self._client.publish(res.topic, payload, 0, res.retain)
+        if pub.rc != mqtt.MQTT_ERR_SUCCESS:
+            client.logger.error('publish error: rc={:d}'.format(pub.rc))
+            return False
+        self.metrics.on_publish(1, len(payload), 1)
+        return True
+
+    #----------------------------------------------------------------------
+    def resource(self, channel, name, qos=0, retain=False, *, ispublic=False):
+        """
+        Creates a handle to publish repeatedly to a resource.
+
+        The topic and the message envelope are validated and built once
+        so that the handle publishes with less work per message than
+        publish() and write().  QoS 0 messages published without callback
+        are handed to paho without being tracked.
+
+        Parameters
+        ----------
+        channel : str
+            Channel name.
+        name : str
+            Resource name.
+        qos : int, default 0
+            An integer of 0, 1, or 2 to specify Quality of Service for publish.
+        retain : bool, default False
+            A flag to indicate that the messages will be retained.
+        ispublic : bool, default False
+            A flag to indicate that the messages are public.
+
+        Returns
+        -------
+        handle : mqbeebotte.resource
+            Resource handle, None when the channel, the name, or qos is
+            invalid.
+        """
+        for level in (channel, name):
+            if not isinstance(level, str) or len(level) == 0 or any(c in level for c in '/+#\0'):
+                client.logger.error('invalid resource: {}/{}'.format(channel, name))
+                return None
+        if qos not in (0, 1, 2):
+            client.logger.error('invalid qos: {}'.format(qos))
+            return None
+        topic = '{}/{}'.format(channel, name)
+        if len(topic.encode('utf-8')) > 65535:
+            client.logger.error('too long topic: {}'.format(topic[:64]))
+            return None
+
+        return resource(self, topic, qos, retain, ispublic)
+
+    #----------------------------------------------------------------------
+    def write(self, topic, data, qos=0, retain=False, *, ispublic=False, ts=None, callback=None,
+              errback=None):
+        """
+        Publishes data in a Beebotte message envelope, i.e.,
+        {"data": data, "ispublic": ispublic, "ts": ts}.
+
+        Parameters
+        ----------
+        topic : str
+            The name of publish target topic, i.e., 'channel/resource'.
+        data : object
+            JSON-serializable data.
+        qos : int, default 0
+            An integer of 0, 1, or 2 to specify Quality of Service for publish.
+        retain : bool
+            A flag to indicate that the message will be retained.
+        ispublic : bool, default False
+            A flag to indicate that the message is public.
+        ts : int, default None
+            Timestamp in milliseconds, None to let Beebotte stamp the
+            message on receipt.
+        callback : function, default None
+            Callback function called with the message ID when the message
+            is published.
+        errback : function, default None
+            Callback function called with the message ID when the message
+            is discarded by disconnect() before completion.
+
+        Returns
+        -------
+        is_success : bool
+            True on success, False when any error occurs.
+        """
+        return self.publish(topic, encode(data, ispublic, ts), qos, retain, callback=callback,
+                            errback=errback)
+
+    #----------------------------------------------------------------------
+    def write_many(self, channel, records, qos=0, *, ispublic=False, via='mqtt', timeout=None):
+        """
+        Writes records to resources of a channel and waits for them.
+
+        Parameters
+        ----------
+        channel : str
+            Channel name.
+        records : iterable
+            Tuples of (resource, data) or (resource, data, ts), where
+            ts is a timestamp in milliseconds.
+        qos : int, default 0
+            An integer of 0, 1, or 2 to specify Quality of Service for
+            MQTT.
+        ispublic : bool, default False
+            A flag to indicate that the messages are public for MQTT.
+        via : str, default 'mqtt'
+            'mqtt' to publish a message per record, or 'rest' to send
+            the records in bulk write requests of the REST API with the
+            token given to connect().
+        timeout : float, default None
+            Maximum time in seconds to wait for the messages to be
+            published for MQTT, None to wait until all the messages
+            are published or discarded by disconnect().
+
+        Returns
+        -------
+        is_success : bool
+            True when all the records are written, False when any error
+            occurs or the messages are not published within timeout.
+        """
+        if via == 'rest':
+            if self.rest is None:
+                if self._token is None:
+                    client.logger.error('cannot write: no token')
+                    return False
+                self.rest = rest_writer(self._token)
+            return self.rest.write(channel, records)
+        if via != 'mqtt':
+            client.logger.error('invalid via: {}'.format(via))
+            return False
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        records = list(records)
+        prefix = channel + '/'
+        result = self.publish_many(
+            ((prefix + record[0], encode(record[1], ispublic, record[2] if len(record) > 2 else None), qos)
+             for record in records), timeout=timeout)
+        if result is None:
+            return False
+        if not result.wait(None if deadline is None else max(0.0, deadline - time.monotonic())):
+            client.logger.warning('{:d} messages not published in {}s'.format(
+                result.total - result.published - result.failed, timeout))
+            return False
+
+        return result.failed == 0 and result.total == len(records)
+
+    #----------------------------------------------------------------------
+    def publish_many(self, messages, max_inflight=100, timeout=None):
+        """
+        Publishes messages through a window of in-flight messages.
+
+        This method blocks while max_inflight messages are waiting to be
+        published.  The network loop thread must be running.
+
+        Parameters
+        ----------
+        messages : iterable
+            Tuples of (topic, msg, qos, retain).  qos and retain can be
+            omitted, i.e., (topic, msg) or (topic, msg, qos).
+        max_inflight : int, default 100
+            Maximum number of messages waiting to be published.
+        timeout : float, default None
+            Maximum time in seconds to wait for room in the window,
+            None to wait forever.  The rest of the messages are not
+            published when the time is over.
+
+        Returns
+        -------
+        result : publish_result
+            Aggregate result to wait for all the messages to be published.
+            None when not connected.
+        """
+        if self._client is None:
+            client.logger.error('cannot publish: not connected')
+            return None
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        result = publish_result(max_inflight)
+        limiter = self.rate_limit
+        for item in messages:
+            topic, msg, qos, retain = (tuple(item) + (0, False))[:4]
+            if not result._acquire(None if deadline is None else max(0.0, deadline - time.monotonic())):
+                client.logger.warning('publish_many timed out after {:d} messages'.format(result.total))
+                break
+            if limiter is not None and not limiter.acquire(topic):
+                result._fail(None)
+                continue
+            if not self.__publish(topic, msg, qos, retain, result._done, result._fail):
+                result._fail(None)
+        result._close()
+        client.logger.debug('published {:d} messages'.format(result.total))
+
+        return result
+
+    #----------------------------------------------------------------------
+    def stats(self):
+        """
+        Gets a snapshot of the client statistics.
+
+        Returns
+        -------
+        stats : dict
+            Snapshot of metrics, i.e., 'published', 'published_bytes',
+            'acked', 'received', 'received_bytes', 'ack_latency' (dict of
+            latency histograms keyed by QoS), 'loop_time',
+            'handshake_time' (TLS handshakes), and 'tls_resumed', with
+            'inflight' (messages waiting to be published),
+            'reconnect_count', and 'recover_time'.
+            'rate_limit', 'dedup', 'dispatcher', 'spool', 'rest', and
+            'capture' are included when used.
+        """
+        stats = self.metrics.snapshot()
+        with self._pubs_lock:
+            stats['inflight'] = len(self._pubs)
+        stats['reconnect_count'] = self.reconnect_count
+        stats['recover_time'] = self.recover_time
+        if self.rate_limit is not None:
+            stats['rate_limit'] = self.rate_limit.stats()
+        if self.dedup is not None:
+            stats['dedup'] = self.dedup.stats()
+        if self.dispatcher is not None:
+            stats['dispatcher'] = self.dispatcher.stats()
+        if self.spool is not None:
+            stats['spool'] = {'pending': len(self.spool), 'dropped': self.spool.dropped}
+        if self.rest is not None:
+            stats['rest'] = self.rest.stats()
+        if self.capture is not None:
+            stats['capture'] = self.capture.stats()
+
+        return stats
+
     #----------------------------------------------------------------------
     def start(self):
         """
-        Starts network loop thread.
+        Starts network loop thread and dispatcher worker threads.
+        Attaches this instance to the reactor instead when given.
         """
+        if self.dispatcher is not None:
+            self.dispatcher.start()
+        if self._loop is None:
+            self._loop = event_loop(reconnect_workers=0)
+        self._is_attached = True
+        if self._client is not None:
+            self._loop._bind(self, self._client)
+        self._loop.add(self)
+        if self.reactor is not None:
+            return
+        self._is_running = True
         return super().start()
 
     #----------------------------------------------------------------------
     def stop(self, block_wait=False):
         """
-        Stops network loop thread.
+        Stops network loop thread and dispatcher worker threads after
+        the queued messages are handled.
+        Detaches this instance from the reactor instead when given.
 
         Parameters
         ----------
         block_wait : bool
-            A flag to indicate to wait for the thread to be stopped.
+            A flag to indicate to wait for the threads to be stopped.
         """
 
-        # do nothing if the thread is not running
-        if not self._is_running:
-            return
-
-        client.logger.debug('stop')
-        self._is_running = False
-        if block_wait:
-            self.join()
+        if self._is_attached:
+            self._is_attached = False
+            if self._client is not None:
+                self._loop._unbind(self._client)
+        if self.reactor is not None:
+            self.reactor.remove(self)
+        elif self._is_running:
+            client.logger.debug('stop')
+            self._is_running = False
+            self._loop.stop()
+            if block_wait:
+                self.join()
+
+        if self.dispatcher is not None:
+            self.dispatcher.stop(block_wait)
 
         return
 
     #----------------------------------------------------------------------
     def run(self):
         if self._client is None:
+            self._is_running = False
             return False
 
-        self._is_running = True
-        while self._is_running:
-            self._client.loop()
-            self.__check_published()
+        # wait for the socket and the wake-up channel in this thread
+        self._loop.run()
+
+        return True
+
+#======================================================================
+class resource(object):
+    """
+    Handle to publish to a resource of a channel
+
+    Created by client.resource().
+
+    Attributes
+    ----------
+    topic : str
+        Topic name, i.e., 'channel/resource'.
+    qos : int
+        Quality of Service of the messages.
+    retain : bool
+        A flag to indicate that the messages will be retained.
+    ispublic : bool
+        A flag to indicate that the messages are public.
+    """
+
+    __slots__ = ('topic', 'qos', 'retain', 'ispublic', '_client', '_envelope')
+
+    #----------------------------------------------------------------------
+    def __init__(self, cl, topic, qos, retain, ispublic):
+        self.topic = topic
+        self.qos = qos
+        self.retain = retain
+        self.ispublic = ispublic
+        self._client = cl
+        self._envelope = envelope(ispublic)
+        return
+
+    #----------------------------------------------------------------------
+    def publish(self, data, ts=None, *, callback=None):
+        """
+        Publishes data in a Beebotte message envelope.
+
+        Parameters
+        ----------
+        data : object
+            JSON-serializable data.
+        ts : int, default None
+            Timestamp in milliseconds, None to let Beebotte stamp the
+            message on receipt.
+        callback : function, default None
+            Callback function called with the message ID when the message
+            is published.
+
+        Returns
+        -------
+        is_success : bool
+            True on success, False when any error occurs.
+        """
+        return self._client._publish_resource(self, self._envelope.encode(data, ts), callback)
+
+    #----------------------------------------------------------------------
+    def publish_raw(self, payload, *, callback=None):
+        """
+        Publishes a payload as is.
+
+        Parameters
+        ----------
+        payload : str or bytes
+            A message to be published.
+        callback : function, default None
+            Callback function called with the message ID when the message
+            is published.
+
+        Returns
+        -------
+        is_success : bool
+            True on success, False when any error occurs.
+        """
+        return self._client._publish_resource(self, payload, callback)
+
+#======================================================================
+class publish_result(object):
+    """
+    Aggregate result of client.publish_many()
 
+    Attributes
+    ----------
+    total : int
+        Number of messages passed to paho.
+    published : int
+        Number of published messages.
+    failed : int
+        Number of messages failed to be published, including messages
+        discarded by client.disconnect() before completion.
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, max_inflight):
+        self.total = 0
+        self.published = 0
+        self.failed = 0
+
+        self._window = threading.Semaphore(max_inflight)
+        self._cond = threading.Condition()
+        self._is_closed = False
+
+        return
+
+    #----------------------------------------------------------------------
+    def _acquire(self, timeout=None):
+        if not self._window.acquire(timeout=timeout):
+            return False
+        with self._cond:
+            self.total += 1
         return True
 
+    #----------------------------------------------------------------------
+    def _done(self, mid):
+        with self._cond:
+            self.published += 1
+            self._cond.notify_all()
+        self._window.release()
+        return
+
+    #----------------------------------------------------------------------
+    def _fail(self, mid):
+        with self._cond:
+            self.failed += 1
+            self._cond.notify_all()
+        self._window.release()
+        return
+
+    #----------------------------------------------------------------------
+    def _close(self):
+        with self._cond:
+            self._is_closed = True
+            self._cond.notify_all()
+        return
+
+    #----------------------------------------------------------------------
+    def is_done(self):
+        """
+        Checks if all the messages are published or failed.
+
+        Returns
+        -------
+        is_done : bool
+            True when no message is waiting to be published.
+        """
+        with self._cond:
+            return self._is_closed and self.published + self.failed == self.total
+
+    #----------------------------------------------------------------------
+    def wait(self, timeout=None):
+        """
+        Waits for all the messages to be published or failed.
+
+        Parameters
+        ----------
+        timeout : float, default None
+            Timeout in seconds, None to wait forever.
+
+        Returns
+        -------
+        is_done : bool
+            True when no message is waiting to be published,
+            False on timeout.
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self._is_closed and self.published + self.failed == self.total,
+                timeout)
+
 #======================================================================
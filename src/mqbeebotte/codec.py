@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020, Shigemi ISHIDA
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import json
+
+# use a fast JSON backend if installed
+try:
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
+try:
+    import ujson as _ujson
+except ImportError:
+    _ujson = None
+
+if _orjson is not None:
+    BACKEND = 'orjson'
+    dumps = _orjson.dumps
+    loads = _orjson.loads
+elif _ujson is not None:
+    BACKEND = 'ujson'
+    def dumps(obj):
+        return _ujson.dumps(obj, ensure_ascii=False).encode('utf-8')
+    loads = _ujson.loads
+else:
+    BACKEND = 'json'
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    def dumps(obj):
+        return _encoder.encode(obj).encode('utf-8')
+    loads = json.loads
+
+#======================================================================
+class envelope(object):
+    """
+    Pre-built Beebotte message envelope
+
+    The constant part of {"data": ..., "ispublic": ..., "ts": ...} is
+    encoded once and only the data is serialized on encode().
+
+    Attributes
+    ----------
+    ispublic : bool
+        A flag to indicate that the message is public.
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, ispublic=False):
+        """
+        Builds an envelope template.
+
+        Parameters
+        ----------
+        ispublic : bool, default False
+            A flag to indicate that the message is public.
+        """
+        self.ispublic = ispublic
+        self._suffix = b',"ispublic":true}' if ispublic else b',"ispublic":false}'
+        return
+
+    #----------------------------------------------------------------------
+    def encode(self, data, ts=None):
+        """
+        Encodes data into the envelope.
+
+        Parameters
+        ----------
+        data : object
+            JSON-serializable data.
+        ts : int, default None
+            Timestamp in milliseconds, None to let Beebotte stamp the
+            message on receipt.
+
+        Returns
+        -------
+        payload : bytes
+            Encoded message.
+        """
+        if ts is None:
+            return b'{"data":' + dumps(data) + self._suffix
+        return b'{"data":' + dumps(data) + b',"ts":' + str(int(ts)).encode('ascii') + self._suffix
+
+_private = envelope(False)
+_public = envelope(True)
+
+#----------------------------------------------------------------------
+def encode(data, ispublic=False, ts=None):
+    """
+    Encodes data into a Beebotte message envelope.
+
+    Parameters
+    ----------
+    data : object
+        JSON-serializable data.
+    ispublic : bool, default False
+        A flag to indicate that the message is public.
+    ts : int, default None
+        Timestamp in milliseconds, None to let Beebotte stamp the message
+        on receipt.
+
+    Returns
+    -------
+    payload : bytes
+        Encoded message.
+    """
+    return (_public if ispublic else _private).encode(data, ts)
+
+#======================================================================
+class message(object):
+    """
+    Received message parsed on demand
+
+    Wraps paho.mqtt.client.MQTTMessage.  The attributes of MQTTMessage,
+    e.g., topic, payload, and qos, are available as is.  The payload is
+    parsed as a Beebotte envelope only when its fields are read.
+    """
+
+    __slots__ = ('_msg', '_json')
+
+    _UNPARSED = object()
+
+    #----------------------------------------------------------------------
+    def __init__(self, msg):
+        self._msg = msg
+        self._json = message._UNPARSED
+        return
+
+    #----------------------------------------------------------------------
+    def __getattr__(self, name):
+        return getattr(self._msg, name)
+
+    #----------------------------------------------------------------------
+    @property
+    def text(self):
+        """
+        Payload decoded as UTF-8.
+        """
+        return self._msg.payload.decode('utf-8')
+
+    #----------------------------------------------------------------------
+    @property
+    def json(self):
+        """
+        Payload parsed as JSON.  Raises ValueError if it is not JSON.
+        """
+        if self._json is message._UNPARSED:
+            self._json = loads(self._msg.payload)
+        return self._json
+
+    #----------------------------------------------------------------------
+    @property
+    def data(self):
+        """
+        'data' field of the envelope, or the whole JSON if not an envelope.
+        """
+        obj = self.json
+        if type(obj) is dict and 'data' in obj:
+            return obj['data']
+        return obj
+
+    #----------------------------------------------------------------------
+    @property
+    def ispublic(self):
+        """
+        'ispublic' field of the envelope, None if not given.
+        """
+        obj = self.json
+        return obj.get('ispublic') if type(obj) is dict else None
+
+    #----------------------------------------------------------------------
+    @property
+    def ts(self):
+        """
+        'ts' field of the envelope in milliseconds, None if not given.
+        """
+        obj = self.json
+        return obj.get('ts') if type(obj) is dict else None
+
+#======================================================================
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020, Shigemi ISHIDA
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+import collections
+import threading
+import time
+
+#======================================================================
+class dedup(object):
+    """
+    Index of recently received messages to drop redeliveries
+
+    Only QoS 1/2 messages, which the server may deliver again, are
+    checked.  Messages are identified by the topic and an identity
+    derived from the message, the 'ts' of the Beebotte envelope by
+    default, so that the same data written twice is told apart by the
+    timestamps.  Messages without 'ts' are not checked unless a key
+    function is given since a repeated payload may be a new reading.
+    The index keeps up to maxlen identities in the order first seen and
+    forgets them window seconds after first seen.
+
+    Attributes
+    ----------
+    maxlen : int
+        Maximum number of identities kept.
+    window : float
+        Seconds to keep an identity after first seen, None to keep it
+        until evicted.
+    checked : int
+        Number of checked messages.
+    hits : int
+        Number of messages found to be duplicates.
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, maxlen=100000, window=60.0, key=None):
+        """
+        Creates an empty index.
+
+        Parameters
+        ----------
+        maxlen : int, default 100000
+            Maximum number of identities kept, which caps the memory.
+        window : float, default 60.0
+            Seconds to keep an identity after first seen, None to keep
+            it until evicted.
+        key : function, default None
+            Function to derive the identity of a message from
+            mqbeebotte.codec.message, e.g., lambda msg: msg.json['id'].
+            None to use the 'ts' of the envelope.
+        """
+        if maxlen < 1:
+            raise ValueError('maxlen must be positive: {}'.format(maxlen))
+
+        self.maxlen = maxlen
+        self.window = window
+        self.checked = 0
+        self.hits = 0
+
+        self._key = key
+        # (topic, identity) -> time.monotonic() when first seen
+        self._seen = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        return
+
+    #----------------------------------------------------------------------
+    def __len__(self):
+        return len(self._seen)
+
+    #----------------------------------------------------------------------
+    def is_duplicate(self, msg):
+        """
+        Checks if a message was seen and records it.
+
+        Parameters
+        ----------
+        msg : mqbeebotte.codec.message
+            Received message.
+
+        Returns
+        -------
+        is_duplicate : bool
+            True when the message was seen before, always False for
+            QoS 0 messages and, without key, for messages without 'ts'.
+        """
+        if msg.qos == 0:
+            return False
+        if self._key is not None:
+            return self.check(msg.topic, self._key(msg))
+
+        try:
+            identity = msg.ts
+        except ValueError:
+            # not JSON
+            return False
+        if identity is None:
+            return False
+        return self.check(msg.topic, identity)
+
+    #----------------------------------------------------------------------
+    def check(self, topic, identity):
+        """
+        Checks if an identity on a topic was seen and records it.
+
+        Parameters
+        ----------
+        topic : str
+            The name of topic.
+        identity : object
+            Hashable identity of a message.
+
+        Returns
+        -------
+        is_duplicate : bool
+            True when the identity was seen before.
+        """
+        entry = (topic, identity)
+        now = time.monotonic()
+        seen = self._seen
+        with self._lock:
+            self.checked += 1
+            if self.window is not None:
+                # forget the identities out of the window, oldest first
+                expire = now - self.window
+                while len(seen) > 0:
+                    oldest, seen_at = next(iter(seen.items()))
+                    if seen_at >= expire:
+                        break
+                    del seen[oldest]
+
+            # seen times are not refreshed so that the window does not slide
+            is_duplicate = entry in seen
+            if is_duplicate:
+                self.hits += 1
+            else:
+                if len(seen) >= self.maxlen:
+                    seen.popitem(last=False)
+                seen[entry] = now
+
+        return is_duplicate
+
+    #----------------------------------------------------------------------
+    def clear(self):
+        """
+        Forgets all the identities.
+        """
+        with self._lock:
+            self._seen.clear()
+        return
+
+    #----------------------------------------------------------------------
+    def stats(self):
+        """
+        Gets the hit rate and the number of kept identities.
+
+        Returns
+        -------
+        stats : dict
+            'checked', 'hits', 'hit_rate', and 'size'.
+        """
+        with self._lock:
+            return {
+                'checked': self.checked,
+                'hits': self.hits,
+                'hit_rate': self.hits / self.checked if self.checked > 0 else 0.0,
+                'size': len(self._seen),
+            }
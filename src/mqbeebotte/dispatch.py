@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020, Shigemi ISHIDA
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import queue
+import threading
+import time
+from logging import getLogger, NullHandler
+
+#======================================================================
+class dispatcher(object):
+    """
+    Worker thread pool to run message callbacks off the network loop
+
+    Messages are assigned to workers by the hash of the topic so that
+    messages on a topic are handled in order.
+
+    Attributes
+    ----------
+    logger : logging.Logger
+        Logger object class attribute.  Default handler is NullHandler().
+    BLOCK : str
+        Backpressure policy to block the network loop until a queue has room.
+    DROP_NEW : str
+        Backpressure policy to drop the incoming message.
+    DROP_OLD : str
+        Backpressure policy to drop the oldest queued message.
+    policy : str
+        Backpressure policy when a queue is full.
+    """
+
+    logger = getLogger(__name__)
+    logger.addHandler(NullHandler())
+    BLOCK = 'block'
+    DROP_NEW = 'drop_new'
+    DROP_OLD = 'drop_old'
+
+    #----------------------------------------------------------------------
+    def __init__(self, workers=4, maxsize=1000, policy='block', *, logger=None):
+        """
+        Creates worker queues.
+
+        Parameters
+        ----------
+        workers : int, default 4
+            Number of worker threads.
+        maxsize : int, default 1000
+            Maximum number of queued messages, shared equally by workers.
+        policy : str, default 'block'
+            Backpressure policy when a queue is full, i.e., 'block',
+            'drop_new', or 'drop_old'.
+        logger : logging.Logger, default None
+            Logger object, None to use module internal logging object.
+        """
+
+        if policy not in (dispatcher.BLOCK, dispatcher.DROP_NEW, dispatcher.DROP_OLD):
+            raise ValueError('invalid policy: {}'.format(policy))
+        if logger is not None:
+            dispatcher.logger = logger
+
+        self.policy = policy
+        size = max(1, -(-maxsize // workers))
+        self._queues = [queue.Queue(size) for idx in range(workers)]
+        self._threads = []
+        self._is_stopped = False
+        self._lock = threading.Lock()
+        self._dropped = 0
+        # per worker: [handled, errors, total wait, total latency, max latency]
+        self._stats = [[0, 0, 0.0, 0.0, 0.0] for idx in range(workers)]
+
+        return
+
+    #----------------------------------------------------------------------
+    def __worker(self, idx):
+        q = self._queues[idx]
+        stats = self._stats[idx]
+        while True:
+            item = q.get()
+            if item is None:
+                return
+            queued, func, args = item
+            start = time.perf_counter()
+            try:
+                func(*args)
+            except Exception:
+                dispatcher.logger.exception('error in message callback')
+                stats[1] += 1
+            end = time.perf_counter()
+            latency = end - start
+            stats[0] += 1
+            stats[2] += start - queued
+            stats[3] += latency
+            if latency > stats[4]:
+                stats[4] = latency
+
+    #----------------------------------------------------------------------
+    def start(self):
+        """
+        Starts worker threads.  Does nothing if already started.
+        """
+        with self._lock:
+            if len(self._threads) > 0:
+                return
+            self._is_stopped = False
+            for idx in range(len(self._queues)):
+                th = threading.Thread(target=self.__worker, args=(idx,), daemon=True)
+                th.start()
+                self._threads.append(th)
+        return
+
+    #----------------------------------------------------------------------
+    def stop(self, block_wait=False):
+        """
+        Stops worker threads after the queued messages are handled.
+        Messages submitted afterwards are dropped until started again.
+
+        Parameters
+        ----------
+        block_wait : bool
+            A flag to indicate to wait for the threads to be stopped.
+        """
+        with self._lock:
+            threads = self._threads
+            self._threads = []
+            self._is_stopped = True
+        if len(threads) == 0:
+            # no worker to take the stop marker off a full queue
+            return
+        for q in self._queues:
+            q.put(None)
+        if block_wait:
+            for th in threads:
+                th.join()
+        return
+
+    #----------------------------------------------------------------------
+    def submit(self, topic, func, *args):
+        """
+        Queues a callback to the worker of a topic.
+
+        Parameters
+        ----------
+        topic : str
+            The name of topic used to select a worker.
+        func : function
+            Callback function called on the worker.
+        args : tuple
+            Arguments of the callback function.
+
+        Returns
+        -------
+        is_queued : bool
+            False when the message is dropped.
+        """
+        if self._is_stopped:
+            with self._lock:
+                self._dropped += 1
+            dispatcher.logger.warning('stopped: dropped message on {}'.format(topic))
+            return False
+
+        q = self._queues[hash(topic) % len(self._queues)]
+        item = (time.perf_counter(), func, args)
+        if self.policy == dispatcher.BLOCK:
+            q.put(item)
+            return True
+
+        try:
+            q.put_nowait(item)
+            return True
+        except queue.Full:
+            pass
+
+        with self._lock:
+            self._dropped += 1
+        if self.policy == dispatcher.DROP_NEW:
+            dispatcher.logger.warning('queue full: dropped message on {}'.format(topic))
+            return False
+
+        # drop the oldest one
+        try:
+            q.get_nowait()
+        except queue.Empty:
+            pass
+        dispatcher.logger.warning('queue full: dropped oldest message')
+        try:
+            q.put_nowait(item)
+        except queue.Full:
+            return False
+        return True
+
+    #----------------------------------------------------------------------
+    def stats(self):
+        """
+        Gets queue depth and callback latency.
+
+        Returns
+        -------
+        stats : dict
+            'depth' (queued messages), 'depths' (queued messages per
+            worker), 'dropped', 'handled', 'errors',
+            'wait_avg' (average seconds queued), 'latency_avg' and
+            'latency_max' (seconds in callbacks).
+        """
+        depths = [q.qsize() for q in self._queues]
+        handled = sum(st[0] for st in self._stats)
+        with self._lock:
+            dropped = self._dropped
+
+        return {
+            'depth': sum(depths),
+            'depths': depths,
+            'dropped': dropped,
+            'handled': handled,
+            'errors': sum(st[1] for st in self._stats),
+            'wait_avg': sum(st[2] for st in self._stats) / handled if handled > 0 else 0.0,
+            'latency_avg': sum(st[3] for st in self._stats) / handled if handled > 0 else 0.0,
+            'latency_max': max(st[4] for st in self._stats),
+        }
+
+#======================================================================
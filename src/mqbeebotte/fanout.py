@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020, Shigemi ISHIDA
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+import multiprocessing
+import signal
+import struct
+import threading
+import time
+from logging import getLogger, NullHandler
+
+# record header: topic length, payload length
+_HEADER = struct.Struct('<HI')
+# topic length of the record to stop a worker
+_STOP = 0xFFFF
+
+#---------------------------------------------------------------------------
+def _worker(buf, used, free, stats, chunk, handler, initializer, initargs):
+    # the parent stops workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if initializer is not None:
+        initializer(*initargs)
+
+    mv = memoryview(buf).cast('B')
+    size = len(mv)
+    tail = 0
+    while True:
+        used.acquire()
+        topic_len, payload_len = _HEADER.unpack_from(mv, tail)
+        if topic_len == _STOP:
+            free.release()
+            return
+        length = topic_len + payload_len
+        chunks = -(-(_HEADER.size + length) // chunk)
+        for cnt in range(chunks - 1):
+            used.acquire()
+
+        start = tail + _HEADER.size
+        end = start + length
+        if end <= size:
+            data = bytes(mv[start:end])
+        else:
+            data = bytes(mv[start:]) + bytes(mv[:end - size])
+        tail = (tail + chunks * chunk) % size
+        # give the room back before running the handler
+        for cnt in range(chunks):
+            free.release()
+
+        try:
+            handler(data[:topic_len].decode('utf-8'), data[topic_len:])
+        except Exception:
+            fanout.logger.exception('error in message handler')
+            stats[2] += 1
+        stats[0] += 1
+        stats[1] += payload_len
+
+#======================================================================
+class fanout(object):
+    """
+    Worker process pool to run CPU-bound message handlers
+
+    Raw payloads are copied into a shared-memory ring buffer of a worker
+    process selected by the hash of the topic, so that messages on a
+    topic are handled in order and without being pickled.  Each ring is
+    divided into chunks counted by a pair of process-shared semaphores.
+
+    Pass forward() as the on_message or subscription callback of
+    mqbeebotte.client to fan out the messages it receives.
+
+    Attributes
+    ----------
+    logger : logging.Logger
+        Logger object class attribute.  Default handler is NullHandler().
+    BLOCK : str
+        Backpressure policy to block the caller until a ring has room.
+    DROP_NEW : str
+        Backpressure policy to drop the incoming message.
+    CHUNK : int
+        Allocation unit of the ring buffers in bytes.
+    policy : str
+        Backpressure policy when a ring is full.
+    """
+
+    logger = getLogger(__name__)
+    logger.addHandler(NullHandler())
+    BLOCK = 'block'
+    DROP_NEW = 'drop_new'
+    CHUNK = 256
+
+    #----------------------------------------------------------------------
+    def __init__(self, handler, workers=4, buffer_size=1 << 20, policy='block', *,
+                 initializer=None, initargs=(), context=None, logger=None):
+        """
+        Creates ring buffers of worker processes.
+
+        Parameters
+        ----------
+        handler : function
+            Function called with (topic, payload) of str and bytes in a
+            worker process.  Must be picklable unless the 'fork' start
+            method is used.
+        workers : int, default 4
+            Number of worker processes.
+        buffer_size : int, default 1048576
+            Size in bytes of the ring buffer of each worker, which
+            limits the size of a message.
+        policy : str, default 'block'
+            Backpressure policy when a ring is full, i.e., 'block' or
+            'drop_new'.
+        initializer : function, default None
+            Function called with initargs when a worker process starts.
+        initargs : tuple, default ()
+            Arguments of initializer.
+        context : str or multiprocessing context, default None
+            Start method or context of multiprocessing, None to use
+            the default.
+        logger : logging.Logger, default None
+            Logger object, None to use module internal logging object.
+        """
+
+        if policy not in (fanout.BLOCK, fanout.DROP_NEW):
+            raise ValueError('invalid policy: {}'.format(policy))
+        if logger is not None:
+            fanout.logger = logger
+        if context is None or isinstance(context, str):
+            context = multiprocessing.get_context(context)
+
+        self.policy = policy
+        self._handler = handler
+        self._initializer = initializer
+        self._initargs = initargs
+        self._context = context
+        self._chunks = max(1, -(-buffer_size // fanout.CHUNK))
+        self._rings = []
+        for idx in range(workers):
+            buf = context.RawArray('B', self._chunks * fanout.CHUNK)
+            self._rings.append({
+                'buf': buf,
+                'mv': memoryview(buf).cast('B'),
+                'head': 0,
+                'used': context.Semaphore(0),
+                'free': context.Semaphore(self._chunks),
+                'lock': threading.Lock(),
+                # written by the worker: handled, bytes, errors
+                'stats': context.RawArray('d', 3),
+                'submitted': 0,
+                'dropped': 0,
+            })
+        self._processes = []
+        self._lock = threading.Lock()
+        self._stats_at = time.monotonic()
+        self._stats_handled = [0] * workers
+
+        return
+
+    #----------------------------------------------------------------------
+    def start(self):
+        """
+        Starts worker processes.  Does nothing if already started.
+        """
+        with self._lock:
+            if len(self._processes) > 0:
+                return
+            for ring in self._rings:
+                proc = self._context.Process(
+                    target=_worker,
+                    args=(ring['buf'], ring['used'], ring['free'], ring['stats'], fanout.CHUNK,
+                          self._handler, self._initializer, self._initargs),
+                    daemon=True)
+                proc.start()
+                self._processes.append(proc)
+        return
+
+    #----------------------------------------------------------------------
+    def stop(self, block_wait=False):
+        """
+        Stops worker processes after the queued messages are handled.
+
+        Parameters
+        ----------
+        block_wait : bool
+            A flag to indicate to wait for the processes to be stopped.
+        """
+        with self._lock:
+            processes = self._processes
+            self._processes = []
+        if len(processes) == 0:
+            return
+        for ring in self._rings:
+            with ring['lock']:
+                ring['free'].acquire()
+                _HEADER.pack_into(ring['mv'], ring['head'], _STOP, 0)
+                ring['head'] = (ring['head'] + fanout.CHUNK) % len(ring['mv'])
+                ring['used'].release()
+        if block_wait:
+            for proc in processes:
+                proc.join()
+        return
+
+    #----------------------------------------------------------------------
+    def __acquire(self, free, chunks):
+        block = self.policy == fanout.BLOCK
+        for cnt in range(chunks):
+            if not free.acquire(block):
+                for acquired in range(cnt):
+                    free.release()
+                return False
+        return True
+
+    #----------------------------------------------------------------------
+    def submit(self, topic, payload):
+        """
+        Copies a message into the ring buffer of the worker of a topic.
+
+        Parameters
+        ----------
+        topic : str
+            The name of topic used to select a worker.
+        payload : bytes
+            Raw payload.
+
+        Returns
+        -------
+        is_queued : bool
+            False when the message is dropped.
+        """
+        ring = self._rings[hash(topic) % len(self._rings)]
+        topic_bytes = topic.encode('utf-8')
+        length = len(topic_bytes) + len(payload)
+        chunks = -(-(_HEADER.size + length) // fanout.CHUNK)
+        if chunks > self._chunks:
+            fanout.logger.error('message too large: {:d} bytes on {}'.format(length, topic))
+            with ring['lock']:
+                ring['dropped'] += 1
+            return False
+
+        mv = ring['mv']
+        size = len(mv)
+        with ring['lock']:
+            if not self.__acquire(ring['free'], chunks):
+                ring['dropped'] += 1
+                fanout.logger.warning('ring full: dropped message on {}'.format(topic))
+                return False
+
+            head = ring['head']
+            _HEADER.pack_into(mv, head, len(topic_bytes), len(payload))
+            start = head + _HEADER.size
+            data = topic_bytes + payload
+            end = start + length
+            if end <= size:
+                mv[start:end] = data
+            else:
+                mv[start:] = data[:size - start]
+                mv[:end - size] = data[size - start:]
+            ring['head'] = (head + chunks * fanout.CHUNK) % size
+            ring['submitted'] += 1
+            used = ring['used']
+            for cnt in range(chunks):
+                used.release()
+
+        return True
+
+    #----------------------------------------------------------------------
+    def forward(self, mqttc, userdata, msg):
+        """
+        Submits a received message.  Used as a message callback of
+        mqbeebotte.client.
+        """
+        self.submit(msg.topic, msg.payload)
+        return
+
+    #----------------------------------------------------------------------
+    def stats(self):
+        """
+        Gets queue depth and throughput of the workers.
+
+        Returns
+        -------
+        stats : dict
+            'depth' (queued messages), 'depths' (queued messages per
+            worker), 'dropped', 'handled', 'handled_bytes', 'errors',
+            'rate' and 'rates' (handled messages per second in total
+            and per worker since the last call).
+        """
+        now = time.monotonic()
+        elapsed = now - self._stats_at
+        self._stats_at = now
+
+        depths = []
+        rates = []
+        dropped = 0
+        for idx, ring in enumerate(self._rings):
+            handled = int(ring['stats'][0])
+            with ring['lock']:
+                depths.append(ring['submitted'] - handled)
+                dropped += ring['dropped']
+            rates.append((handled - self._stats_handled[idx]) / elapsed if elapsed > 0 else 0.0)
+            self._stats_handled[idx] = handled
+
+        return {
+            'depth': sum(depths),
+            'depths': depths,
+            'dropped': dropped,
+            'handled': sum(int(ring['stats'][0]) for ring in self._rings),
+            'handled_bytes': sum(int(ring['stats'][1]) for ring in self._rings),
+            'errors': sum(int(ring['stats'][2]) for ring in self._rings),
+            'rate': sum(rates),
+            'rates': rates,
+        }
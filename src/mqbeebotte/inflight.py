@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020, Shigemi ISHIDA
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+import array
+
+#======================================================================
+class inflight(object):
+    """
+    Table of in-flight messages keyed by MQTT message ID
+
+    Records are kept in parallel arrays of slots indexed by the low bits
+    of the message ID.  Since message IDs are assigned sequentially, the
+    slots form a ring that grows with the span of in-flight IDs.  IDs
+    colliding on an occupied slot at the maximum ring size are kept in
+    an overflow dict.  Callbacks are kept only for messages given one.
+
+    The table is not thread-safe; callers serialize the accesses.
+
+    Attributes
+    ----------
+    capacity : int
+        Maximum number of in-flight messages.
+    MIN_SLOTS : int
+        Initial number of slots.
+    """
+
+    MIN_SLOTS = 64
+
+    #----------------------------------------------------------------------
+    def __init__(self, capacity=65535):
+        """
+        Creates an empty table.
+
+        Parameters
+        ----------
+        capacity : int, default 65535
+            Maximum number of in-flight messages, up to 65535.
+        """
+        if capacity < 1 or capacity > 65535:
+            raise ValueError('capacity must be in 1..65535: {}'.format(capacity))
+
+        self.capacity = capacity
+        # ring size never exceeds the smallest power of two holding capacity
+        self._max_slots = 1 << (capacity - 1).bit_length()
+        self._count = 0
+        self._reserved = 0
+        self._overflow = {}
+        self._callbacks = {}
+        self.__alloc(min(inflight.MIN_SLOTS, self._max_slots))
+
+        return
+
+    #----------------------------------------------------------------------
+    def __alloc(self, size):
+        self._mask = size - 1
+        # message ID 0 is never used by MQTT and marks an empty slot
+        self._mids = array.array('H', bytes(2 * size))
+        self._qos = bytearray(size)
+        self._times = array.array('d', bytes(8 * size))
+        return
+
+    #----------------------------------------------------------------------
+    def __grow(self):
+        records = [(mid, self._qos[slot], self._times[slot])
+                   for slot, mid in enumerate(self._mids) if mid != 0]
+        records.extend((mid, qos, published_at)
+                       for mid, (qos, published_at) in self._overflow.items())
+        self._overflow = {}
+        self.__alloc(2 * (self._mask + 1))
+        for mid, qos, published_at in records:
+            self.__put(mid, qos, published_at)
+        return
+
+    #----------------------------------------------------------------------
+    def __put(self, mid, qos, published_at):
+        slot = mid & self._mask
+        while self._mids[slot] != 0 and self._mask + 1 < self._max_slots:
+            self.__grow()
+            slot = mid & self._mask
+        if self._mids[slot] != 0:
+            self._overflow[mid] = (qos, published_at)
+            return
+        self._mids[slot] = mid
+        self._qos[slot] = qos
+        self._times[slot] = published_at
+        return
+
+    #----------------------------------------------------------------------
+    def __len__(self):
+        return self._count
+
+    #----------------------------------------------------------------------
+    def __contains__(self, mid):
+        return self._mids[mid & self._mask] == mid or mid in self._overflow
+
+    #----------------------------------------------------------------------
+    def __iter__(self):
+        for mid in self._mids:
+            if mid != 0:
+                yield mid
+        yield from list(self._overflow)
+
+    #----------------------------------------------------------------------
+    def reserve(self):
+        """
+        Reserves room for a message to be added.
+
+        Returns
+        -------
+        is_success : bool
+            True on success, False when the table is full.
+        """
+        if self._count + self._reserved >= self.capacity:
+            return False
+        self._reserved += 1
+        return True
+
+    #----------------------------------------------------------------------
+    def release(self):
+        """
+        Releases a reservation not used for add().
+        """
+        self._reserved -= 1
+        return
+
+    #----------------------------------------------------------------------
+    def is_full(self):
+        """
+        Checks if no room is left to be reserved.
+
+        Returns
+        -------
+        is_full : bool
+            True when reserve() fails.
+        """
+        return self._count + self._reserved >= self.capacity
+
+    #----------------------------------------------------------------------
+    def add(self, mid, qos, published_at, callback=None):
+        """
+        Adds a message in place of a reservation.
+
+        Parameters
+        ----------
+        mid : int
+            Message ID.
+        qos : int
+            QoS of the message.
+        published_at : float
+            time.perf_counter() when the message is published.
+        callback : function, default None
+            Callback function kept with the message.
+        """
+        self._reserved -= 1
+        self._count += 1
+        self.__put(mid, qos, published_at)
+        if callback is not None:
+            self._callbacks[mid] = callback
+        return
+
+    #----------------------------------------------------------------------
+    def pop(self, mid):
+        """
+        Removes a message.
+
+        Parameters
+        ----------
+        mid : int
+            Message ID.
+
+        Returns
+        -------
+        record : tuple
+            (qos, published_at, callback), None when not found.
+        """
+        slot = mid & self._mask
+        if self._mids[slot] == mid:
+            self._mids[slot] = 0
+            record = (self._qos[slot], self._times[slot])
+        else:
+            record = self._overflow.pop(mid, None)
+            if record is None:
+                return None
+
+        self._count -= 1
+        if self._count == 0 and self._mask + 1 > inflight.MIN_SLOTS:
+            # give the memory of a burst back
+            self.__alloc(inflight.MIN_SLOTS)
+        return record + (self._callbacks.pop(mid, None),)
+
+    #----------------------------------------------------------------------
+    def clear(self):
+        """
+        Removes all the messages.  Reservations are kept.
+        """
+        self._count = 0
+        self._overflow = {}
+        self._callbacks = {}
+        self.__alloc(min(inflight.MIN_SLOTS, self._max_slots))
+        return
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020, Shigemi ISHIDA
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import bisect
+import threading
+
+#======================================================================
+class histogram(object):
+    """
+    Fixed-bucket histogram of durations
+
+    Buckets have upper bounds of 100 us doubled up to about 13 s, so that
+    recording is a bisect and an increment.
+
+    Attributes
+    ----------
+    BOUNDS : list
+        Upper bounds of the buckets in seconds.  The last bucket has no
+        upper bound.
+    """
+
+    BOUNDS = [0.0001 * (2 ** idx) for idx in range(18)]
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        self._counts = [0] * (len(histogram.BOUNDS) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        return
+
+    #----------------------------------------------------------------------
+    def record(self, value):
+        """
+        Records a duration.
+
+        Parameters
+        ----------
+        value : float
+            Duration in seconds.
+        """
+        self._counts[bisect.bisect_left(histogram.BOUNDS, value)] += 1
+        self._count += 1
+        self._sum += value
+        if value > self._max:
+            self._max = value
+        return
+
+    #----------------------------------------------------------------------
+    def percentile(self, pct):
+        """
+        Gets an approximate percentile, i.e., the upper bound of the
+        bucket including the percentile.
+
+        Parameters
+        ----------
+        pct : float
+            Percentile between 0 and 100.
+
+        Returns
+        -------
+        value : float
+            Duration in seconds, 0 when nothing is recorded.
+        """
+        if self._count == 0:
+            return 0.0
+        rank = pct / 100.0 * self._count
+        total = 0
+        for idx, count in enumerate(self._counts):
+            total += count
+            if total >= rank and count > 0:
+                return histogram.BOUNDS[idx] if idx < len(histogram.BOUNDS) else self._max
+        return self._max
+
+    #----------------------------------------------------------------------
+    def snapshot(self):
+        """
+        Gets a snapshot.
+
+        Returns
+        -------
+        snapshot : dict
+            'count', 'sum', 'avg', 'max', 'p50', 'p90', 'p99' in seconds,
+            and 'buckets', a list of counts for BOUNDS and overflow.
+        """
+        return {
+            'count': self._count,
+            'sum': self._sum,
+            'avg': self._sum / self._count if self._count > 0 else 0.0,
+            'max': self._max,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'buckets': list(self._counts),
+        }
+
+#======================================================================
+class metrics(object):
+    """
+    Client metrics
+
+    Attributes
+    ----------
+    published : int
+        Number of messages passed to paho.
+    published_bytes : int
+        Total payload size of published messages.  The length of str
+        payloads is counted in characters.
+    acked : int
+        Number of messages completed, i.e., queued for QoS 0 or
+        acknowledged for QoS 1/2.
+    received : int
+        Number of received messages.
+    received_bytes : int
+        Total payload size of received messages.
+    ack_latency : list
+        Histograms of publish-to-completion latency for QoS 0, 1, and 2.
+    loop_time : histogram
+        Histogram of time spent processing socket events per network
+        loop iteration, excluding the time waiting for the socket.
+    handshake_time : histogram
+        Histogram of TLS handshake time per connection.
+    tls_resumed : int
+        Number of TLS handshakes resuming a session.
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        self.published = 0
+        self.published_bytes = 0
+        self.acked = 0
+        self.received = 0
+        self.received_bytes = 0
+        self.ack_latency = [histogram(), histogram(), histogram()]
+        self.loop_time = histogram()
+        self.handshake_time = histogram()
+        self.tls_resumed = 0
+        self._lock = threading.Lock()
+        return
+
+    #----------------------------------------------------------------------
+    def on_publish(self, count, size, acked=0):
+        """
+        Records published messages.
+
+        Parameters
+        ----------
+        count : int
+            Number of messages.
+        size : int
+            Total payload size.
+        acked : int, default 0
+            Number of the messages completed at once without latency
+            recorded, i.e., untracked QoS 0 messages.
+        """
+        with self._lock:
+            self.published += count
+            self.published_bytes += size
+            self.acked += acked
+        return
+
+    #----------------------------------------------------------------------
+    def on_ack(self, qos, latency):
+        """
+        Records a completed message.
+
+        Parameters
+        ----------
+        qos : int
+            Quality of Service of the message.
+        latency : float
+            Seconds from publish to completion.
+        """
+        with self._lock:
+            self.acked += 1
+            self.ack_latency[qos].record(latency)
+        return
+
+    #----------------------------------------------------------------------
+    def on_receive(self, size):
+        """
+        Records a received message.
+
+        Parameters
+        ----------
+        size : int
+            Payload size.
+        """
+        with self._lock:
+            self.received += 1
+            self.received_bytes += size
+        return
+
+    #----------------------------------------------------------------------
+    def on_loop(self, elapsed):
+        """
+        Records a network loop iteration.
+
+        Parameters
+        ----------
+        elapsed : float
+            Seconds spent in the iteration.
+        """
+        with self._lock:
+            self.loop_time.record(elapsed)
+        return
+
+    #----------------------------------------------------------------------
+    def on_handshake(self, elapsed, resumed):
+        """
+        Records a TLS handshake.
+
+        Parameters
+        ----------
+        elapsed : float
+            Seconds spent in the handshake.
+        resumed : bool
+            A flag to indicate that a session is resumed.
+        """
+        with self._lock:
+            self.handshake_time.record(elapsed)
+            if resumed:
+                self.tls_resumed += 1
+        return
+
+    #----------------------------------------------------------------------
+    def snapshot(self):
+        """
+        Gets a snapshot.
+
+        Returns
+        -------
+        snapshot : dict
+            Counters and histogram snapshots keyed by the attribute names.
+            ack_latency is a dict keyed by QoS.
+        """
+        with self._lock:
+            return {
+                'published': self.published,
+                'published_bytes': self.published_bytes,
+                'acked': self.acked,
+                'received': self.received,
+                'received_bytes': self.received_bytes,
+                'ack_latency': {qos: hist.snapshot() for qos, hist in enumerate(self.ack_latency)},
+                'loop_time': self.loop_time.snapshot(),
+                'handshake_time': self.handshake_time.snapshot(),
+                'tls_resumed': self.tls_resumed,
+            }
+
+#======================================================================
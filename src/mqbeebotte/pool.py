@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020, Shigemi ISHIDA
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import bisect
+import hashlib
+import threading
+import time
+from logging import getLogger, NullHandler
+from mqbeebotte.client import client
+
+#======================================================================
+class pool(object):
+    """
+    Beebotte MQTT client pool API class
+
+    Opens multiple connections with the same token and shards topics
+    across them by consistent hashing.  Messages to a topic always go
+    through the same connection so that per-topic ordering is kept.
+
+    Attributes
+    ----------
+    logger : logging.Logger
+        Logger object class attribute.  Default handler is NullHandler().
+    VNODES : int
+        Number of virtual nodes per connection on the hash ring.
+    clients : list
+        Pooled client instances, i.e., shards.
+    """
+
+    logger = getLogger(__name__)
+    logger.addHandler(NullHandler())
+    VNODES = 64
+
+    #----------------------------------------------------------------------
+    def __init__(self, size=4, host=None, port=None, ca_cert=None, *, logger=None):
+        """
+        Creates client instances for the connections.
+
+        Parameters
+        ----------
+        size : int, default 4
+            Number of connections.
+        host : str, default None
+            Beebotte MQTT server hostname, None to use default value,
+            i.e., mqtt.beebotte.com.
+        port : int, default None
+            Beebotte MQTT server port number, None to use default value,
+            i.e., 1883 for non-SSL connection and 8883 for SSL connection.
+        ca_cert : str, default None
+            CA Certificate file path, None for non-SSL connection.
+        logger : logging.Logger, default None
+            Logger object, None to use module internal logging object.
+        """
+
+        if logger is not None:
+            pool.logger = logger
+
+        self.clients = [client(host, port, ca_cert, logger=logger) for idx in range(size)]
+
+        ring = sorted((pool.__hash('{:d}-{:d}'.format(idx, vnode)), idx)
+                      for idx in range(size) for vnode in range(pool.VNODES))
+        self._ring_keys = [key for key, idx in ring]
+        self._ring_shards = [idx for key, idx in ring]
+
+        self._counts = [0] * size
+        self._bytes = [0] * size
+        self._counts_lock = threading.Lock()
+        self._started = None
+
+        return
+
+    #----------------------------------------------------------------------
+    @staticmethod
+    def __hash(key):
+        return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+    #----------------------------------------------------------------------
+    def shard(self, topic):
+        """
+        Gets the shard index of a topic.
+
+        Parameters
+        ----------
+        topic : str
+            The name of topic.
+
+        Returns
+        -------
+        index : int
+            Index of the client in clients.
+        """
+        pos = bisect.bisect(self._ring_keys, pool.__hash(topic)) % len(self._ring_keys)
+        return self._ring_shards[pos]
+
+    #----------------------------------------------------------------------
+    def __group(self, topics):
+        groups = {}
+        for topic in topics:
+            name = topic[0] if type(topic) is tuple else topic
+            groups.setdefault(self.shard(name), []).append(topic)
+        return groups
+
+    #----------------------------------------------------------------------
+    def connect(self, token, on_connect=None, on_message=None):
+        """
+        Connects all the clients to a MQTT server.
+
+        Parameters
+        ----------
+        token : str
+            Token string for Beebotte MQTT server.
+        on_connect : function, default None
+            Callback function called when each client connected to
+            the MQTT server.
+        on_message : function, default None
+            Callback function called when any client gets message
+            from the MQTT server.
+
+        Returns
+        -------
+        is_success : bool
+            True on success, False when any error occurs.
+        """
+        is_success = True
+        for cl in self.clients:
+            is_success = cl.connect(token, on_connect, on_message) and is_success
+        self._started = time.monotonic()
+
+        return is_success
+
+    #----------------------------------------------------------------------
+    def flush(self, timeout=None):
+        """
+        Waits for outstanding messages of all the clients to be
+        published.
+
+        Parameters
+        ----------
+        timeout : float, default None
+            Maximum time in seconds to wait for all the messages,
+            None to wait forever.
+
+        Returns
+        -------
+        pending : list
+            Lists of mids not published within timeout for each client.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        pending = []
+        for cl in self.clients:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            pending.append(cl.flush(remaining))
+
+        return pending
+
+    #----------------------------------------------------------------------
+    def disconnect(self, timeout=None):
+        """
+        Disconnects all the clients from a MQTT server.
+
+        Parameters
+        ----------
+        timeout : float, default None
+            Maximum time in seconds to wait for outstanding messages of
+            all the clients, None to use client.DISCONNECT_TIMEOUT.
+
+        Returns
+        -------
+        is_success : bool
+            True on success, False when any error occurs.
+        """
+        if timeout is None:
+            timeout = client.DISCONNECT_TIMEOUT
+        deadline = time.monotonic() + timeout
+
+        is_success = True
+        for cl in self.clients:
+            is_success = cl.disconnect(max(0.0, deadline - time.monotonic())) and is_success
+
+        return is_success
+
+    #----------------------------------------------------------------------
+    def start(self):
+        """
+        Starts network loop threads of all the clients.
+        """
+        for cl in self.clients:
+            cl.start()
+        return
+
+    #----------------------------------------------------------------------
+    def stop(self, block_wait=False):
+        """
+        Stops network loop threads of all the clients.
+
+        Parameters
+        ----------
+        block_wait : bool
+            A flag to indicate to wait for the threads to be stopped.
+        """
+        for cl in self.clients:
+            cl.stop(block_wait)
+        return
+
+    #----------------------------------------------------------------------
+    def subscribe(self, topics, qos=0, *, callback=None):
+        """
+        Subscribes to a single topic or multiple topics.
+        Each topic is subscribed on the connection of its shard.
+
+        Parameters
+        ----------
+        topics : list or str
+            A list of topics, a list of tuple of (topic, qos),
+            or a name of topic to be subscribed.
+        qos : int, default 0
+            The integer of 0, 1, or 2 to specify Quality of Service
+            for the subscription.  When topics is a list, qos is ignored.
+        callback : function, default None
+            Callback function called instead of on_message when any
+            client gets message matching the topics.
+
+        Returns
+        -------
+        is_success : bool
+            True on success, False when any error occurs.
+        """
+        if type(topics) is not list:
+            return self.clients[self.shard(topics)].subscribe(topics, qos, callback=callback)
+
+        is_success = True
+        topic_qos = [x if type(x) is tuple else (x, 0) for x in topics]
+        for idx, group in self.__group(topic_qos).items():
+            is_success = self.clients[idx].subscribe(group, callback=callback) and is_success
+
+        return is_success
+
+    #----------------------------------------------------------------------
+    def unsubscribe(self, topics):
+        """
+        Unsubscribes from a single topic or multiple topics.
+
+        Parameters
+        ----------
+        topics : list or str
+            A list of topics or a name of topic to be unsubscribed.
+            None to unsubscribe from all the subscribed topics.
+
+        Returns
+        -------
+        is_success : bool
+            True on success, False when any error occurs.
+        """
+        if topics is None:
+            is_success = True
+            for cl in self.clients:
+                is_success = cl.unsubscribe(None) and is_success
+            return is_success
+
+        if type(topics) is not list:
+            return self.clients[self.shard(topics)].unsubscribe(topics)
+
+        is_success = True
+        for idx, group in self.__group(topics).items():
+            is_success = self.clients[idx].unsubscribe(group) and is_success
+
+        return is_success
+
+    #----------------------------------------------------------------------
+    def messages(self, topic, maxlen=10000, timeout=None, qos=0):
+        """
+        Subscribes to a topic on its shard and returns a stream to pull
+        its messages.  See client.messages() for details.
+
+        Parameters
+        ----------
+        topic : str
+            A name of topic to be subscribed, wildcards allowed.
+        maxlen : int, default 10000
+            Maximum number of buffered messages.
+        timeout : float, default None
+            Timeout in seconds for iterating over the stream,
+            None to wait forever.
+        qos : int, default 0
+            The integer of 0, 1, or 2 to specify Quality of Service
+            for the subscription.
+
+        Returns
+        -------
+        stream : mqbeebotte.message_stream
+            Stream of messages, None when any error occurs.
+        """
+        return self.clients[self.shard(topic)].messages(topic, maxlen, timeout, qos)
+
+    #----------------------------------------------------------------------
+    def publish(self, topic, msg, qos=0, retain=False, *, callback=None, errback=None):
+        """
+        Publishes a message to a topic through the connection of its shard.
+
+        Parameters
+        ----------
+        topic : str
+            The name of publish target topic.
+        msg : str or byte
+            A message to be published.
+        qos : int, default 0
+            An integer of 0, 1, or 2 to specify Quality of Service for publish.
+        retain : bool
+            A flag to indicate that the message will be retained.
+        callback : function, default None
+            Callback function called with the message ID when the message
+            is published.
+        errback : function, default None
+            Callback function called with the message ID when the message
+            is discarded by disconnect() before completion.
+
+        Returns
+        -------
+        is_success : bool
+            True on success, False when any error occurs.
+        """
+        idx = self.shard(topic)
+        if not self.clients[idx].publish(topic, msg, qos, retain, callback=callback, errback=errback):
+            return False
+
+        size = len(msg) if isinstance(msg, (str, bytes, bytearray)) else 0
+        with self._counts_lock:
+            self._counts[idx] += 1
+            self._bytes[idx] += size
+
+        return True
+
+    #----------------------------------------------------------------------
+    def stats(self):
+        """
+        Gets publish throughput of each shard.
+
+        Returns
+        -------
+        stats : list
+            A list of dict for each shard with keys of
+            'messages' (published messages), 'bytes' (published bytes),
+            'rate' (messages per second since connect()),
+            and 'topics' (subscribed topics).
+        """
+        elapsed = time.monotonic() - self._started if self._started is not None else 0.0
+        with self._counts_lock:
+            counts = list(self._counts)
+            sizes = list(self._bytes)
+
+        return [{
+            'messages': counts[idx],
+            'bytes': sizes[idx],
+            'rate': counts[idx] / elapsed if elapsed > 0 else 0.0,
+            'topics': len(cl.topics),
+        } for idx, cl in enumerate(self.clients)]
+
+#======================================================================
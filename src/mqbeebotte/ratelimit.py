@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020, Shigemi ISHIDA
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import threading
+import time
+
+#======================================================================
+class token_bucket(object):
+    """
+    Token bucket
+
+    Attributes
+    ----------
+    rate : float
+        Tokens added per second.
+    burst : float
+        Bucket capacity, i.e., maximum burst size.
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, rate, burst=None):
+        """
+        Creates a full bucket.
+
+        Parameters
+        ----------
+        rate : float
+            Tokens added per second.
+        burst : float, default None
+            Bucket capacity, None to use max(1, rate).
+        """
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+
+        self.rate = float(rate)
+        self.burst = float(burst) if burst is not None else max(1.0, self.rate)
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+        return
+
+    #----------------------------------------------------------------------
+    def reserve(self, timeout=None):
+        """
+        Takes a token, borrowing from the future if the bucket is empty.
+
+        Parameters
+        ----------
+        timeout : float, default None
+            Maximum seconds to wait for the token, None for no limit.
+
+        Returns
+        -------
+        wait : float
+            Seconds to wait before the token is available,
+            None when the wait would exceed timeout.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            wait = 0.0 if self._tokens >= 1.0 else (1.0 - self._tokens) / self.rate
+            if timeout is not None and wait > timeout:
+                return None
+            self._tokens -= 1.0
+
+        return wait
+
+    #----------------------------------------------------------------------
+    def refund(self):
+        """
+        Returns a token taken by reserve().
+        """
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1.0)
+        return
+
+#======================================================================
+class rate_limiter(object):
+    """
+    Publish rate limiter per connection and optionally per resource
+
+    Attributes
+    ----------
+    block : bool
+        A flag to indicate to wait for a token.  When False, messages
+        over the rate are rejected.
+    timeout : float
+        Maximum seconds to wait for a token in blocking mode.
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, rate, burst=None, *, resource_rate=None, resource_burst=None,
+                 block=True, timeout=None):
+        """
+        Creates token buckets.
+
+        Parameters
+        ----------
+        rate : float
+            Messages per second on the connection.
+        burst : float, default None
+            Maximum burst on the connection, None to use max(1, rate).
+        resource_rate : float, default None
+            Messages per second to each topic, i.e., 'channel/resource',
+            None for no limit per topic.
+        resource_burst : float, default None
+            Maximum burst to each topic, None to use max(1, resource_rate).
+        block : bool, default True
+            A flag to indicate to wait for a token.  When False, messages
+            over the rate are rejected.
+        timeout : float, default None
+            Maximum seconds to wait for a token in blocking mode,
+            None for no limit.
+        """
+        self.block = block
+        self.timeout = timeout
+
+        self._bucket = token_bucket(rate, burst)
+        self._resource_rate = resource_rate
+        self._resource_burst = resource_burst
+        self._resources = {}
+        self._lock = threading.Lock()
+
+        self._passed = 0
+        self._rejected = 0
+        self._waited = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+        return
+
+    #----------------------------------------------------------------------
+    def __resource_bucket(self, topic):
+        bucket = self._resources.get(topic)
+        if bucket is None:
+            with self._lock:
+                bucket = self._resources.setdefault(
+                    topic, token_bucket(self._resource_rate, self._resource_burst))
+        return bucket
+
+    #----------------------------------------------------------------------
+    def acquire(self, topic, block=None):
+        """
+        Waits for a message to a topic to be allowed.
+
+        Parameters
+        ----------
+        topic : str
+            The name of publish target topic.
+        block : bool, default None
+            A flag to indicate to wait for a token, None to use the block
+            attribute.
+
+        Returns
+        -------
+        is_allowed : bool
+            False when the message is rejected.
+        """
+        block = self.block if block is None else block
+        timeout = self.timeout if block else 0.0
+
+        wait = self._bucket.reserve(timeout)
+        if wait is not None and self._resource_rate is not None:
+            bucket = self.__resource_bucket(topic)
+            resource_wait = bucket.reserve(timeout)
+            if resource_wait is None:
+                self._bucket.refund()
+                wait = None
+            else:
+                wait = max(wait, resource_wait)
+
+        if wait is None:
+            with self._lock:
+                self._rejected += 1
+            return False
+
+        if wait > 0:
+            time.sleep(wait)
+        with self._lock:
+            self._passed += 1
+            if wait > 0:
+                self._waited += 1
+                self._wait_total += wait
+                if wait > self._wait_max:
+                    self._wait_max = wait
+
+        return True
+
+    #----------------------------------------------------------------------
+    def stats(self):
+        """
+        Gets limiter statistics.
+
+        Returns
+        -------
+        stats : dict
+            'passed' (allowed messages), 'rejected', 'waited' (messages
+            delayed), 'wait_total', 'wait_avg', and 'wait_max' in seconds.
+        """
+        with self._lock:
+            return {
+                'passed': self._passed,
+                'rejected': self._rejected,
+                'waited': self._waited,
+                'wait_total': self._wait_total,
+                'wait_avg': self._wait_total / self._passed if self._passed > 0 else 0.0,
+                'wait_max': self._wait_max,
+            }
+
+#======================================================================
@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020, Shigemi ISHIDA
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import collections
+import heapq
+import selectors
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger, NullHandler, ERROR
+
+#======================================================================
+class _paho_logger(object):
+    """
+    Logger given to paho to report errors of callbacks
+
+    paho calls log() inside the exception handler of a callback, so that
+    the traceback of the error is logged.
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, logger):
+        self.logger = logger
+        return
+
+    #----------------------------------------------------------------------
+    def log(self, level, fmt, *args):
+        if level >= ERROR:
+            self.logger.error(fmt, *args, exc_info=sys.exc_info()[0] is not None)
+        return
+
+#======================================================================
+class reactor(threading.Thread):
+    """
+    Network loop thread shared by many client instances
+
+    Sockets of attached clients are multiplexed on a single selector.
+    Reconnections run on a small fixed thread pool so that a slow
+    connection setup does not stall the other clients.
+
+    Attributes
+    ----------
+    logger : logging.Logger
+        Logger object class attribute.  Default handler is NullHandler().
+    MISC_INTERVAL : float
+        Interval in seconds to process keepalive and reconnection.
+    """
+
+    logger = getLogger(__name__)
+    logger.addHandler(NullHandler())
+    MISC_INTERVAL = 1.0
+
+    #----------------------------------------------------------------------
+    def __init__(self, reconnect_workers=4, *, logger=None):
+        """
+        Creates a selector and a wake-up channel.
+
+        Parameters
+        ----------
+        reconnect_workers : int, default 4
+            Number of threads to run reconnections.
+            0 to reconnect in the loop thread.
+        logger : logging.Logger, default None
+            Logger object, None to use module internal logging object.
+        """
+
+        super().__init__(daemon=True)
+
+        if logger is not None:
+            reactor.logger = logger
+
+        self._selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+
+        self._commands = collections.deque()
+        self._clients = set()
+        self._reconnector = ThreadPoolExecutor(reconnect_workers) if reconnect_workers > 0 else None
+        self._thread_id = None
+        self._is_stopped = False
+
+        return
+
+    #----------------------------------------------------------------------
+    def wakeup(self):
+        """
+        Wakes up the loop thread from waiting for the sockets.
+        """
+        try:
+            self._wake_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass
+        return
+
+    #----------------------------------------------------------------------
+    def __call(self, func, *args):
+        if threading.get_ident() == self._thread_id:
+            func(*args)
+            return
+        self._commands.append((func, args))
+        self.wakeup()
+        return
+
+    #----------------------------------------------------------------------
+    def add(self, cl):
+        """
+        Attaches a client to the loop.
+
+        Parameters
+        ----------
+        cl : mqbeebotte.client
+            Client to drive.
+        """
+        self.__call(self._clients.add, cl)
+        return
+
+    #----------------------------------------------------------------------
+    def remove(self, cl):
+        """
+        Detaches a client from the loop.  Socket events of the client
+        are routed by _bind() and _unbind() separately.
+
+        Parameters
+        ----------
+        cl : mqbeebotte.client
+            Client to detach.
+        """
+        self.__call(self._clients.discard, cl)
+        return
+
+    #----------------------------------------------------------------------
+    def __register(self, cl, mqttc, sock):
+        self._selector.register(sock, selectors.EVENT_READ, (cl, mqttc))
+        if mqttc.want_write():
+            self._selector.modify(sock, selectors.EVENT_READ | selectors.EVENT_WRITE, (cl, mqttc))
+        return
+
+    #----------------------------------------------------------------------
+    def __unregister(self, sock):
+        try:
+            self._selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+        return
+
+    #----------------------------------------------------------------------
+    def __modify(self, sock, events):
+        try:
+            key = self._selector.get_key(sock)
+        except (KeyError, ValueError):
+            return
+        if key.events != events:
+            self._selector.modify(sock, events, key.data)
+        return
+
+    #----------------------------------------------------------------------
+    def __write(self, cl, mqttc, sock):
+        # the socket is almost always writable; wait for it only when needed
+        if mqttc.socket() is not sock:
+            return
+        start = time.perf_counter()
+        mqttc.loop_write()
+        cl.metrics.on_loop(time.perf_counter() - start)
+        if mqttc.want_write():
+            self.__modify(sock, selectors.EVENT_READ | selectors.EVENT_WRITE)
+        return
+
+    #----------------------------------------------------------------------
+    def _bind(self, cl, mqttc):
+        """
+        Routes socket events of a paho client to this loop.
+
+        Parameters
+        ----------
+        cl : mqbeebotte.client
+            Client owning the paho client.
+        mqttc : paho.mqtt.client.Client
+            paho client, connected or not.
+        """
+        # errors of callbacks are logged instead of breaking the loop and the
+        # state of the packet being read
+        mqttc.suppress_exceptions = True
+        mqttc.enable_logger(_paho_logger(reactor.logger))
+        mqttc.on_socket_open = lambda c, u, sock: self.__call(self.__register, cl, c, sock)
+        mqttc.on_socket_close = lambda c, u, sock: self.__call(self.__unregister, sock)
+        mqttc.on_socket_register_write = lambda c, u, sock: self.__call(self.__write, cl, c, sock)
+        mqttc.on_socket_unregister_write = lambda c, u, sock: self.__call(
+            self.__modify, sock, selectors.EVENT_READ)
+        sock = mqttc.socket()
+        if sock is not None:
+            self.__call(self.__register, cl, mqttc, sock)
+        return
+
+    #----------------------------------------------------------------------
+    def _unbind(self, mqttc):
+        """
+        Stops routing socket events of a paho client to this loop.
+        paho writes packets in publish() again.
+
+        Parameters
+        ----------
+        mqttc : paho.mqtt.client.Client
+            paho client bound by _bind().
+        """
+        mqttc.on_socket_open = None
+        mqttc.on_socket_close = None
+        mqttc.on_socket_register_write = None
+        mqttc.on_socket_unregister_write = None
+        mqttc.suppress_exceptions = False
+        mqttc.disable_logger()
+        sock = mqttc.socket()
+        if sock is not None:
+            self.__call(self.__unregister, sock)
+        return
+
+    #----------------------------------------------------------------------
+    def _reconnect(self, func):
+        """
+        Runs a reconnection on the reconnection threads.
+
+        Parameters
+        ----------
+        func : function
+            Function to reconnect.
+        """
+        if self._reconnector is None:
+            func()
+            return
+        self._reconnector.submit(func)
+        return
+
+    #----------------------------------------------------------------------
+    def __run_commands(self):
+        while len(self._commands) > 0:
+            func, args = self._commands.popleft()
+            try:
+                func(*args)
+            except Exception:
+                reactor.logger.exception('error in reactor command')
+        return
+
+    #----------------------------------------------------------------------
+    def stop(self, block_wait=False):
+        """
+        Stops the loop thread.
+
+        Parameters
+        ----------
+        block_wait : bool
+            A flag to indicate to wait for the thread to be stopped.
+        """
+        if self._is_stopped:
+            return
+
+        reactor.logger.debug('stop')
+        self._is_stopped = True
+        self.wakeup()
+        if block_wait and self.is_alive():
+            self.join()
+        return
+
+    #----------------------------------------------------------------------
+    def __misc(self, cl, now, timers, next_misc):
+        if cl not in self._clients:
+            return
+        try:
+            when = cl._loop_misc(now)
+        except Exception:
+            # keep serving the other clients
+            reactor.logger.exception('error in client loop')
+            return
+        # clients asking for an earlier call get a timer of their own
+        if when is not None and when < next_misc:
+            heapq.heappush(timers, (when, id(cl), cl))
+        return
+
+    #----------------------------------------------------------------------
+    @staticmethod
+    def __handle(mqttc, events):
+        if events & selectors.EVENT_READ:
+            mqttc.loop_read()
+            # TLS may buffer decrypted data invisible to the selector
+            sock = mqttc.socket()
+            while sock is not None and hasattr(sock, 'pending') and sock.pending() > 0:
+                mqttc.loop_read()
+                sock = mqttc.socket()
+        if events & selectors.EVENT_WRITE and mqttc.socket() is not None:
+            mqttc.loop_write()
+        return
+
+    #----------------------------------------------------------------------
+    def run(self):
+        self._thread_id = threading.get_ident()
+        timers = []
+        next_misc = time.monotonic()
+        while not self._is_stopped:
+            self.__run_commands()
+            deadline = min(next_misc, timers[0][0]) if len(timers) > 0 else next_misc
+            timeout = max(0.0, deadline - time.monotonic())
+            lost = []
+            for key, events in self._selector.select(timeout):
+                if key.data is None:
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except (BlockingIOError, OSError):
+                        pass
+                    continue
+                cl, mqttc = key.data
+                start = time.perf_counter()
+                try:
+                    self.__handle(mqttc, events)
+                except Exception:
+                    # keep serving the other clients
+                    reactor.logger.exception('error in client loop')
+                cl.metrics.on_loop(time.perf_counter() - start)
+                if mqttc.socket() is None:
+                    lost.append(cl)
+
+            now = time.monotonic()
+            # schedule reconnection of lost clients without waiting for a tick
+            for cl in lost:
+                self.__misc(cl, now, timers, next_misc)
+            while len(timers) > 0 and timers[0][0] <= now:
+                when, key, cl = heapq.heappop(timers)
+                self.__misc(cl, now, timers, next_misc)
+            if now >= next_misc:
+                next_misc = now + reactor.MISC_INTERVAL
+                for cl in list(self._clients):
+                    self.__misc(cl, now, timers, next_misc)
+
+        self.__run_commands()
+        self._thread_id = None
+        if self._reconnector is not None:
+            self._reconnector.shutdown(wait=False)
+        self._selector.close()
+        self._wake_r.close()
+        self._wake_w.close()
+
+        return
+
+#======================================================================
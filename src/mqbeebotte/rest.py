@@ -0,0 +1,481 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020, Shigemi ISHIDA
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+import array
+import http.client
+import queue
+import ssl
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger, NullHandler
+from mqbeebotte.codec import dumps, loads
+
+# NumPy output of rest_reader if installed
+try:
+    import numpy as _numpy
+except ImportError:
+    _numpy = None
+
+#======================================================================
+class _session(object):
+    """
+    Pool of kept-alive HTTP connections to the Beebotte REST API
+
+    Requests are authenticated with a channel token.  Failed requests
+    are retried with exponential backoff except for client errors.
+    """
+
+    logger = getLogger(__name__)
+    logger.addHandler(NullHandler())
+    HOST = 'api.beebotte.com'
+
+    #----------------------------------------------------------------------
+    def __init__(self, token, host=None, port=None, secure=True, *, connections=2,
+                 retries=3, retry_delay=0.5, timeout=10.0, ssl_context=None, logger=None):
+        if logger is not None:
+            _session.logger = logger
+        if secure and ssl_context is None:
+            ssl_context = ssl.create_default_context()
+
+        self.token = token
+        self.host = host if host is not None else _session.HOST
+        self.port = port if port is not None else (443 if secure else 80)
+
+        self._secure = secure
+        self._ssl_context = ssl_context
+        self._timeout = timeout
+        self._retries = retries
+        self._retry_delay = retry_delay
+        self._connections = connections
+        # idle connections, the most recently used first
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(connections)
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._retried = 0
+
+        return
+
+    #----------------------------------------------------------------------
+    def __connect(self):
+        if self._secure:
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self._timeout,
+                                               context=self._ssl_context)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self._timeout)
+
+    #----------------------------------------------------------------------
+    def __request(self, method, path, body):
+        headers = {'X-Auth-Token': self.token}
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+        with self._slots:
+            try:
+                conn = self._idle.get_nowait()
+                is_reused = True
+            except queue.Empty:
+                conn = self.__connect()
+                is_reused = False
+            while True:
+                try:
+                    conn.request(method, path, body, headers)
+                    res = conn.getresponse()
+                    data = res.read()
+                    break
+                except (OSError, http.client.HTTPException) as err:
+                    conn.close()
+                    if is_reused:
+                        # the server may have closed the idle connection
+                        conn = self.__connect()
+                        is_reused = False
+                        continue
+                    _session.logger.warning('request to {} failed: {}'.format(self.host, err))
+                    return None, None
+            if res.will_close:
+                conn.close()
+            else:
+                self._idle.put(conn)
+        return res.status, data
+
+    #----------------------------------------------------------------------
+    def _call(self, method, path, body=None):
+        """
+        Sends a request with retries.
+
+        Returns
+        -------
+        status : int
+            HTTP status of the last response, None when not connected.
+        data : bytes
+            Body of the last response, None when not connected.
+        """
+        for attempt in range(self._retries + 1):
+            if attempt > 0:
+                with self._lock:
+                    self._retried += 1
+                time.sleep(self._retry_delay * (2 ** (attempt - 1)))
+
+            status, data = self.__request(method, path, body)
+            with self._lock:
+                self._requests += 1
+            if status is None:
+                continue
+            if 200 <= status < 300:
+                break
+            _session.logger.warning('{} {} failed: HTTP {:d} {}'.format(method, path, status, data[:200]))
+            # client errors other than throttling are not retried
+            if 400 <= status < 500 and status != 429:
+                break
+
+        return status, data
+
+    #----------------------------------------------------------------------
+    def close(self):
+        """
+        Closes idle connections.
+        """
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        return
+
+#======================================================================
+class rest_writer(_session):
+    """
+    Beebotte REST API bulk writer
+
+    Writes many resource records of a channel per request through the
+    bulk write API, i.e., POST /v1/data/write/{channel}, authenticated
+    with a channel token.  HTTP connections are kept alive in a pool and
+    reused.  Records are split into chunks sent in parallel over the
+    pooled connections, and failed chunks are retried with exponential
+    backoff.
+
+    Attributes
+    ----------
+    logger : logging.Logger
+        Logger object class attribute.  Default handler is NullHandler().
+    HOST : str
+        Default host name class attribute, i.e., api.beebotte.com.
+    PATH : str
+        Path of the bulk write API.
+    token : str
+        Channel token.
+    host : str
+        REST API server name.
+    port : int
+        REST API server port number.
+    chunk_size : int
+        Maximum number of records per request.
+    """
+
+    PATH = '/v1/data/write/{}'
+
+    #----------------------------------------------------------------------
+    def __init__(self, token, host=None, port=None, secure=True, *, connections=2, chunk_size=500,
+                 retries=3, retry_delay=0.5, timeout=10.0, ssl_context=None, logger=None):
+        """
+        Creates an empty connection pool.
+
+        Parameters
+        ----------
+        token : str
+            Channel token.
+        host : str, default None
+            REST API server name, None to use HOST.
+        port : int, default None
+            REST API server port number, None to use 443 or 80.
+        secure : bool, default True
+            A flag to indicate to use HTTPS.
+        connections : int, default 2
+            Maximum number of HTTP connections, i.e., of parallel
+            requests.
+        chunk_size : int, default 500
+            Maximum number of records per request.
+        retries : int, default 3
+            Number of retries of a failed request.
+        retry_delay : float, default 0.5
+            Delay in seconds before the first retry, doubled on each
+            retry.
+        timeout : float, default 10.0
+            Socket timeout in seconds.
+        ssl_context : ssl.SSLContext, default None
+            SSL context for HTTPS, None to use the default context.
+        logger : logging.Logger, default None
+            Logger object, None to use module internal logging object.
+        """
+        super().__init__(token, host, port, secure, connections=connections, retries=retries,
+                         retry_delay=retry_delay, timeout=timeout, ssl_context=ssl_context, logger=logger)
+
+        self.chunk_size = chunk_size
+        self._executor = None
+        self._written = 0
+        self._failed = 0
+
+        return
+
+    #----------------------------------------------------------------------
+    def __post(self, path, records):
+        status, data = self._call('POST', path, dumps({'records': records}))
+        is_success = status is not None and 200 <= status < 300
+        with self._lock:
+            if is_success:
+                self._written += len(records)
+            else:
+                self._failed += len(records)
+        return is_success
+
+    #----------------------------------------------------------------------
+    def write(self, channel, records):
+        """
+        Writes records to resources of a channel.
+
+        Parameters
+        ----------
+        channel : str
+            Channel name.
+        records : iterable
+            Tuples of (resource, data) or (resource, data, ts), where
+            ts is a timestamp in milliseconds.
+
+        Returns
+        -------
+        is_success : bool
+            True when all the records are written, False when any chunk
+            of records fails after the retries.
+        """
+        path = rest_writer.PATH.format(channel)
+        chunks = []
+        chunk = []
+        for record in records:
+            item = {'resource': record[0], 'data': record[1]}
+            if len(record) > 2 and record[2] is not None:
+                item['ts'] = record[2]
+            chunk.append(item)
+            if len(chunk) >= self.chunk_size:
+                chunks.append(chunk)
+                chunk = []
+        if len(chunk) > 0:
+            chunks.append(chunk)
+
+        if len(chunks) <= 1 or self._connections <= 1:
+            results = [self.__post(path, chunk) for chunk in chunks]
+        else:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self._connections)
+            results = list(self._executor.map(lambda chunk: self.__post(path, chunk), chunks))
+
+        rest_writer.logger.debug('wrote {:d} chunks to {}'.format(len(chunks), channel))
+        return all(results)
+
+    #----------------------------------------------------------------------
+    def close(self):
+        """
+        Closes idle connections and stops the request threads.
+        """
+        super().close()
+        with self._lock:
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=False)
+        return
+
+    #----------------------------------------------------------------------
+    def stats(self):
+        """
+        Gets request counters.
+
+        Returns
+        -------
+        stats : dict
+            'requests', 'records' (written records), 'retries', and
+            'failed' (records failed after the retries).
+        """
+        with self._lock:
+            return {
+                'requests': self._requests,
+                'records': self._written,
+                'retries': self._retried,
+                'failed': self._failed,
+            }
+
+#======================================================================
+class rest_reader(_session):
+    """
+    Beebotte REST API history reader
+
+    Reads records of a resource through the read API, i.e.,
+    GET /v1/data/read/{channel}/{resource}, page by page from the newest
+    to the oldest, and yields each page as a columnar batch so that
+    memory use does not depend on the time range.
+
+    Attributes
+    ----------
+    logger : logging.Logger
+        Logger object class attribute.  Default handler is NullHandler().
+    HOST : str
+        Default host name class attribute, i.e., api.beebotte.com.
+    PATH : str
+        Path of the read API.
+    FROM_PARAM : str
+        Query parameter of the oldest timestamp to read.
+    TO_PARAM : str
+        Query parameter of the newest timestamp to read.
+    token : str
+        Channel token.
+    host : str
+        REST API server name.
+    port : int
+        REST API server port number.
+    """
+
+    PATH = '/v1/data/read/{}/{}'
+    FROM_PARAM = 'ts-from'
+    TO_PARAM = 'ts-to'
+
+    #----------------------------------------------------------------------
+    def __init__(self, token, host=None, port=None, secure=True, *,
+                 retries=3, retry_delay=0.5, timeout=10.0, ssl_context=None, logger=None):
+        """
+        Creates an empty connection pool.
+
+        Parameters
+        ----------
+        token : str
+            Channel token.
+        host : str, default None
+            REST API server name, None to use HOST.
+        port : int, default None
+            REST API server port number, None to use 443 or 80.
+        secure : bool, default True
+            A flag to indicate to use HTTPS.
+        retries : int, default 3
+            Number of retries of a failed request.
+        retry_delay : float, default 0.5
+            Delay in seconds before the first retry, doubled on each
+            retry.
+        timeout : float, default 10.0
+            Socket timeout in seconds.
+        ssl_context : ssl.SSLContext, default None
+            SSL context for HTTPS, None to use the default context.
+        logger : logging.Logger, default None
+            Logger object, None to use module internal logging object.
+        """
+        super().__init__(token, host, port, secure, connections=1, retries=retries,
+                         retry_delay=retry_delay, timeout=timeout, ssl_context=ssl_context, logger=logger)
+        return
+
+    #----------------------------------------------------------------------
+    @staticmethod
+    def __columns(records, as_numpy):
+        ts = [record['ts'] for record in records]
+        data = [record.get('data') for record in records]
+        if not as_numpy:
+            return {'ts': array.array('q', ts), 'data': data}
+
+        try:
+            values = _numpy.asarray(data, dtype=_numpy.float64)
+        except (TypeError, ValueError):
+            values = _numpy.asarray(data, dtype=object)
+        return {'ts': _numpy.asarray(ts, dtype=_numpy.int64), 'data': values}
+
+    #----------------------------------------------------------------------
+    def read(self, channel, resource, start=None, end=None, *, batch_size=1000, as_numpy=False):
+        """
+        Reads records of a resource in batches.
+
+        Batches are yielded from the newest to the oldest, and records
+        in a batch are in ascending order of time.
+
+        Parameters
+        ----------
+        channel : str
+            Channel name.
+        resource : str
+            Resource name.
+        start : int, default None
+            Oldest timestamp in milliseconds to read, None for no limit.
+        end : int, default None
+            Newest timestamp in milliseconds to read, None for no limit.
+        batch_size : int, default 1000
+            Maximum number of records per request and batch.
+        as_numpy : bool, default False
+            A flag to yield NumPy arrays.  Requires numpy.
+
+        Yields
+        ------
+        batch : dict
+            'ts' (timestamps in milliseconds) and 'data' (values), as
+            array.array and list, or as NumPy arrays of int64 and of
+            float64 or object.
+
+        Raises
+        ------
+        OSError
+            When a request fails after the retries.
+        """
+        if as_numpy and _numpy is None:
+            raise ImportError('numpy is required for as_numpy')
+
+        path = rest_reader.PATH.format(urllib.parse.quote(channel), urllib.parse.quote(resource))
+        to = end
+        # records on the boundary timestamp already yielded
+        boundary = set()
+        while True:
+            params = {'limit': batch_size, 'source': 'raw'}
+            if start is not None:
+                params[rest_reader.FROM_PARAM] = start
+            if to is not None:
+                params[rest_reader.TO_PARAM] = to
+            status, data = self._call('GET', path + '?' + urllib.parse.urlencode(params))
+            if status is None or not 200 <= status < 300:
+                raise OSError('cannot read {}/{}: HTTP {}'.format(channel, resource, status))
+
+            page = loads(data)
+            is_last = len(page) < batch_size
+            del data
+            if len(page) == 0:
+                return
+
+            records = [record for record in page if record.get('_id') not in boundary]
+            oldest = min(record['ts'] for record in page)
+            boundary = set(record.get('_id') for record in page if record['ts'] == oldest)
+            # a full page on a single timestamp cannot be paged further by time
+            to = oldest if len(boundary) < len(page) else oldest - 1
+            del page
+            if len(records) > 0:
+                records.sort(key=lambda record: record['ts'])
+                yield rest_reader.__columns(records, as_numpy)
+            del records
+
+            if is_last or (start is not None and to < start):
+                return
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020, Shigemi ISHIDA
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import mmap
+import os
+import struct
+import threading
+import zlib
+from logging import getLogger, NullHandler
+
+#======================================================================
+class spool(object):
+    """
+    Append-only on-disk spool of outbound messages
+
+    Messages are appended to memory-mapped segment files and kept until
+    acknowledged.  Segments whose messages are all acknowledged are
+    removed.  Unacknowledged messages survive process restarts and are
+    replayed in order.
+
+    Attributes
+    ----------
+    logger : logging.Logger
+        Logger object class attribute.  Default handler is NullHandler().
+    SEGMENT_SIZE : int
+        Default segment file size in bytes, i.e., 4 MiB.
+    MAX_BYTES : int
+        Default limit of total segment file size in bytes, i.e., 64 MiB.
+    path : str
+        Spool directory path.
+    dropped : int
+        Number of messages dropped to keep disk usage under the limit.
+    """
+
+    logger = getLogger(__name__)
+    logger.addHandler(NullHandler())
+    SEGMENT_SIZE = 4 * 1024 * 1024
+    MAX_BYTES = 64 * 1024 * 1024
+
+    # payload length, crc32 of body, seq, qos, retain, topic length
+    _HEADER = struct.Struct('<IIQBBH')
+    _ACK = struct.Struct('<Q')
+
+    #----------------------------------------------------------------------
+    def __init__(self, path, segment_size=None, max_bytes=None, *, logger=None):
+        """
+        Opens a spool directory and recovers unacknowledged messages.
+
+        Parameters
+        ----------
+        path : str
+            Spool directory path, created if not exists.
+        segment_size : int, default None
+            Segment file size in bytes, None to use SEGMENT_SIZE.
+        max_bytes : int, default None
+            Limit of total segment file size in bytes, None to use MAX_BYTES.
+            The oldest segment is dropped when the limit is exceeded.
+        logger : logging.Logger, default None
+            Logger object, None to use module internal logging object.
+        """
+
+        if logger is not None:
+            spool.logger = logger
+
+        self.path = path
+        self.dropped = 0
+        self._segment_size = segment_size if segment_size is not None else spool.SEGMENT_SIZE
+        self._max_bytes = max_bytes if max_bytes is not None else spool.MAX_BYTES
+
+        # list of [first_seq, last_seq, file, mmap, write_offset]
+        self._segments = []
+        self._lock = threading.RLock()
+        self._acked = set()
+        self._low = 1
+        self._next_seq = 1
+
+        os.makedirs(path, exist_ok=True)
+        self.__recover()
+
+        return
+
+    #----------------------------------------------------------------------
+    def __del__(self):
+        self.close()
+        return
+
+    #----------------------------------------------------------------------
+    def __segment_path(self, first_seq):
+        return os.path.join(self.path, '{:020d}.seg'.format(first_seq))
+
+    #----------------------------------------------------------------------
+    def __ack_path(self):
+        return os.path.join(self.path, 'ack')
+
+    #----------------------------------------------------------------------
+    def __recover(self):
+        try:
+            with open(self.__ack_path(), 'rb') as fp:
+                self._low, = spool._ACK.unpack(fp.read(spool._ACK.size))
+        except (OSError, struct.error):
+            self._low = 1
+
+        names = sorted(name for name in os.listdir(self.path) if name.endswith('.seg'))
+        for name in names:
+            first_seq = int(name[:-4])
+            fp = open(os.path.join(self.path, name), 'r+b')
+            mm = mmap.mmap(fp.fileno(), 0)
+            last_seq = first_seq - 1
+            offset = 0
+            for seq, pos, end in spool.__records(mm):
+                last_seq = seq
+                offset = end
+            self._segments.append([first_seq, last_seq, fp, mm, offset])
+            self._next_seq = max(self._next_seq, last_seq + 1)
+
+        self._next_seq = max(self._next_seq, self._low)
+        self.__compact()
+        spool.logger.debug('spool {}: {:d} pending messages'.format(
+            self.path, self._next_seq - self._low))
+
+        return
+
+    #----------------------------------------------------------------------
+    @staticmethod
+    def __records(mm):
+        offset = 0
+        size = len(mm)
+        while offset + spool._HEADER.size <= size:
+            plen, crc, seq, qos, retain, tlen = spool._HEADER.unpack_from(mm, offset)
+            end = offset + spool._HEADER.size + tlen + plen
+            if seq == 0 or end > size:
+                return
+            if zlib.crc32(mm[offset + 8:end]) != crc:
+                # torn write at the tail
+                return
+            yield seq, offset, end
+            offset = end
+
+    #----------------------------------------------------------------------
+    def __new_segment(self, size):
+        total = sum(len(seg[3]) for seg in self._segments)
+        while len(self._segments) > 0 and total + size > self._max_bytes:
+            seg = self._segments[0]
+            count = sum(1 for seq in range(max(seg[0], self._low), seg[1] + 1)
+                        if seq not in self._acked)
+            self.dropped += count
+            spool.logger.warning('spool full: dropped {:d} messages'.format(count))
+            total -= len(seg[3])
+            self.__remove_head()
+
+        path = self.__segment_path(self._next_seq)
+        fp = open(path, 'w+b')
+        fp.truncate(size)
+        mm = mmap.mmap(fp.fileno(), size)
+        seg = [self._next_seq, self._next_seq - 1, fp, mm, 0]
+        self._segments.append(seg)
+
+        return seg
+
+    #----------------------------------------------------------------------
+    def __remove_head(self):
+        first_seq, last_seq, fp, mm, offset = self._segments.pop(0)
+        mm.close()
+        fp.close()
+        os.remove(self.__segment_path(first_seq))
+        if self._low <= last_seq:
+            self._acked.difference_update(range(self._low, last_seq + 1))
+            self._low = last_seq + 1
+            self.__save_low()
+        return
+
+    #----------------------------------------------------------------------
+    def __save_low(self):
+        tmp = self.__ack_path() + '.tmp'
+        with open(tmp, 'wb') as fp:
+            fp.write(spool._ACK.pack(self._low))
+        os.replace(tmp, self.__ack_path())
+        return
+
+    #----------------------------------------------------------------------
+    def __compact(self):
+        # keep the last segment to append to
+        removed = False
+        while len(self._segments) > 1 and self._segments[0][1] < self._low:
+            self.__remove_head()
+            removed = True
+        if removed:
+            self.__save_low()
+        return
+
+    #----------------------------------------------------------------------
+    def append(self, topic, payload, qos=0, retain=False):
+        """
+        Appends a message to the spool.
+
+        Parameters
+        ----------
+        topic : str
+            The name of publish target topic.
+        payload : str or bytes
+            A message to be published.
+        qos : int, default 0
+            An integer of 0, 1, or 2 to specify Quality of Service for publish.
+        retain : bool
+            A flag to indicate that the message will be retained.
+
+        Returns
+        -------
+        seq : int
+            Sequence number of the message to acknowledge with ack().
+        """
+        btopic = topic.encode('utf-8')
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        elif isinstance(payload, (int, float)):
+            payload = str(payload).encode('ascii')
+        elif payload is None:
+            payload = b''
+
+        with self._lock:
+            seq = self._next_seq
+            size = spool._HEADER.size + len(btopic) + len(payload)
+            seg = self._segments[-1] if len(self._segments) > 0 else None
+            if seg is None or seg[4] + size > len(seg[3]):
+                seg = self.__new_segment(max(self._segment_size, size))
+
+            body = struct.pack('<QBBH', seq, qos, 1 if retain else 0, len(btopic)) + btopic + payload
+            offset = seg[4]
+            seg[3][offset:offset + size] = struct.pack('<II', len(payload), zlib.crc32(body)) + body
+            seg[1] = seq
+            seg[4] = offset + size
+            self._next_seq = seq + 1
+
+        return seq
+
+    #----------------------------------------------------------------------
+    def ack(self, seq):
+        """
+        Acknowledges a message not to be replayed anymore.
+
+        Parameters
+        ----------
+        seq : int
+            Sequence number returned by append().
+        """
+        with self._lock:
+            if seq < self._low:
+                return
+            self._acked.add(seq)
+            while self._low in self._acked:
+                self._acked.discard(self._low)
+                self._low += 1
+            if len(self._segments) > 1 and self._segments[0][1] < self._low:
+                self.__compact()
+        return
+
+    #----------------------------------------------------------------------
+    def pending(self):
+        """
+        Gets unacknowledged messages in order.
+
+        Returns
+        -------
+        messages : list
+            A list of tuple of (seq, topic, payload, qos, retain).
+        """
+        messages = []
+        with self._lock:
+            for seg in self._segments:
+                if seg[1] < self._low:
+                    continue
+                mm = seg[3]
+                for seq, offset, end in spool.__records(mm):
+                    if seq < self._low or seq in self._acked:
+                        continue
+                    plen, crc, seq, qos, retain, tlen = spool._HEADER.unpack_from(mm, offset)
+                    pos = offset + spool._HEADER.size
+                    topic = mm[pos:pos + tlen].decode('utf-8')
+                    messages.append((seq, topic, mm[pos + tlen:end], qos, retain == 1))
+
+        return messages
+
+    #----------------------------------------------------------------------
+    def __len__(self):
+        with self._lock:
+            return self._next_seq - self._low - len(self._acked)
+
+    #----------------------------------------------------------------------
+    def close(self):
+        """
+        Saves the acknowledged position and closes all the segment files.
+        """
+        with self._lock:
+            if len(self._segments) == 0:
+                return
+            self.__save_low()
+            for seg in self._segments:
+                seg[3].close()
+                seg[2].close()
+            self._segments = []
+        return
+
+#======================================================================
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020, Shigemi ISHIDA
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+import collections
+import threading
+import time
+
+#======================================================================
+class message_stream(object):
+    """
+    Bounded buffer of messages to be pulled by a consumer thread
+
+    Messages are put by the network loop or dispatcher thread and kept
+    in a ring buffer.  When the buffer is full, the oldest message is
+    dropped and counted in overflow.  Iterating over an instance yields
+    messages until it is closed or no message arrives within timeout.
+
+    Attributes
+    ----------
+    maxlen : int
+        Maximum number of buffered messages.
+    timeout : float
+        Timeout in seconds for iteration, None to wait forever.
+    received : int
+        Number of messages put into the buffer.
+    overflow : int
+        Number of messages dropped because the buffer was full.
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, maxlen=10000, timeout=None, on_close=None):
+        """
+        Creates an empty buffer.
+
+        Parameters
+        ----------
+        maxlen : int, default 10000
+            Maximum number of buffered messages.
+        timeout : float, default None
+            Timeout in seconds for iteration, None to wait forever.
+        on_close : function, default None
+            Function called without arguments when closed.
+        """
+        self.maxlen = maxlen
+        self.timeout = timeout
+        self.received = 0
+        self.overflow = 0
+
+        self._buffer = collections.deque(maxlen=maxlen)
+        self._cond = threading.Condition()
+        self._waiting = 0
+        self._on_close = on_close
+        self._is_closed = False
+
+        return
+
+    #----------------------------------------------------------------------
+    def __len__(self):
+        return len(self._buffer)
+
+    #----------------------------------------------------------------------
+    def __iter__(self):
+        while True:
+            batch = self.get_batch(self.maxlen, self.timeout)
+            if len(batch) == 0:
+                return
+            yield from batch
+
+    #----------------------------------------------------------------------
+    def __enter__(self):
+        return self
+
+    #----------------------------------------------------------------------
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    #----------------------------------------------------------------------
+    def _put(self, mqttc, userdata, msg):
+        """
+        Puts a message.  Used as a subscription callback.
+        """
+        with self._cond:
+            if self._is_closed:
+                return
+            if len(self._buffer) == self.maxlen:
+                self.overflow += 1
+            self._buffer.append(msg)
+            self.received += 1
+            if self._waiting > 0:
+                self._cond.notify()
+        return
+
+    #----------------------------------------------------------------------
+    def __wait(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._waiting += 1
+        try:
+            while len(self._buffer) == 0 and not self._is_closed:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        finally:
+            self._waiting -= 1
+        return len(self._buffer) > 0
+
+    #----------------------------------------------------------------------
+    def get(self, timeout=None):
+        """
+        Gets the oldest message.
+
+        Parameters
+        ----------
+        timeout : float, default None
+            Timeout in seconds to wait for a message, None to wait
+            forever.
+
+        Returns
+        -------
+        msg : mqbeebotte.codec.message
+            The oldest message, None on timeout or when closed.
+        """
+        with self._cond:
+            if not self.__wait(timeout):
+                return None
+            return self._buffer.popleft()
+
+    #----------------------------------------------------------------------
+    def get_batch(self, n, timeout=None):
+        """
+        Gets up to n oldest messages at once.
+        Waits only until the first message arrives.
+
+        Parameters
+        ----------
+        n : int
+            Maximum number of messages to get.
+        timeout : float, default None
+            Timeout in seconds to wait for a message, None to wait
+            forever.
+
+        Returns
+        -------
+        msgs : list
+            Messages from the oldest, empty on timeout or when closed.
+        """
+        with self._cond:
+            if not self.__wait(timeout):
+                return []
+            buffer = self._buffer
+            if n >= len(buffer):
+                batch = list(buffer)
+                buffer.clear()
+                return batch
+            return [buffer.popleft() for cnt in range(n)]
+
+    #----------------------------------------------------------------------
+    def close(self):
+        """
+        Stops receiving messages and wakes up waiting consumers.
+        Buffered messages can still be got.
+        """
+        with self._cond:
+            if self._is_closed:
+                return
+            self._is_closed = True
+            self._cond.notify_all()
+        if self._on_close is not None:
+            self._on_close()
+        return
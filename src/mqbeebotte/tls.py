@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020, Shigemi ISHIDA
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+import os
+import ssl
+import threading
+import time
+from logging import getLogger, NullHandler
+
+#======================================================================
+class tls_socket(ssl.SSLSocket):
+    """
+    SSL socket measuring the TLS handshake time
+
+    Attributes
+    ----------
+    handshake_time : float
+        Seconds spent in the last handshake, None before handshake.
+    """
+
+    handshake_time = None
+
+    #----------------------------------------------------------------------
+    def do_handshake(self, block=False):
+        started_at = time.perf_counter()
+        super().do_handshake(block)
+        self.handshake_time = time.perf_counter() - started_at
+        self.context._on_handshake(self)
+        return
+
+#======================================================================
+class tls_context(ssl.SSLContext):
+    """
+    SSL context resuming TLS sessions
+
+    Client sockets wrapped by this context resume the last session
+    established with the same server name, so that reconnections skip
+    the certificate exchange and verification of a full handshake.
+    Contexts are shared in a process through get() to load a CA
+    certificate file only once.
+
+    Attributes
+    ----------
+    logger : logging.Logger
+        Logger object class attribute.  Default handler is NullHandler().
+    handshakes : int
+        Number of completed handshakes.
+    resumed : int
+        Number of handshakes resuming a session.
+    """
+
+    logger = getLogger(__name__)
+    logger.addHandler(NullHandler())
+    sslsocket_class = tls_socket
+
+    # (CA path, mtime, options) -> shared context
+    _cache = {}
+    _cache_lock = threading.Lock()
+
+    #----------------------------------------------------------------------
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self.handshakes = 0
+        self.resumed = 0
+        # server name -> ssl.SSLSession
+        self._sessions = {}
+        self._lock = threading.Lock()
+        return
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def get(cls, ca_cert=None, certfile=None, keyfile=None, cert_reqs=None, ciphers=None):
+        """
+        Gets a shared context for a CA certificate file and options.
+
+        A new context is created when the CA certificate file is
+        modified.
+
+        Parameters
+        ----------
+        ca_cert : str, default None
+            CA certificate file path, None to use the system default CA
+            certificates.
+        certfile : str, default None
+            Client certificate file path, None not to authenticate the
+            client.
+        keyfile : str, default None
+            Client private key file path, None when included in certfile.
+        cert_reqs : int, default None
+            Certificate requirements on the server, None to use
+            ssl.CERT_REQUIRED.
+        ciphers : str, default None
+            Allowed ciphers, None to use the defaults.
+
+        Returns
+        -------
+        context : mqbeebotte.tls_context
+            Shared SSL context.
+        """
+        mtime = os.stat(ca_cert).st_mtime_ns if ca_cert is not None else None
+        key = (ca_cert, mtime, certfile, keyfile, cert_reqs, ciphers)
+        with cls._cache_lock:
+            context = cls._cache.get(key)
+            if context is not None:
+                return context
+
+            context = cls(ssl.PROTOCOL_TLS_CLIENT)
+            if certfile is not None:
+                context.load_cert_chain(certfile, keyfile)
+            if cert_reqs == ssl.CERT_NONE:
+                context.check_hostname = False
+            context.verify_mode = ssl.CERT_REQUIRED if cert_reqs is None else cert_reqs
+            if ca_cert is not None:
+                context.load_verify_locations(ca_cert)
+            else:
+                context.load_default_certs()
+            if ciphers is not None:
+                context.set_ciphers(ciphers)
+
+            # contexts of older versions of the file are not used anymore
+            for old in [old for old in cls._cache if old[0] == ca_cert and old[1] != mtime]:
+                del cls._cache[old]
+            cls._cache[key] = context
+        tls_context.logger.debug('created TLS context for {}'.format(ca_cert))
+        return context
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def clear(cls):
+        """
+        Removes all the shared contexts.
+        """
+        with cls._cache_lock:
+            cls._cache.clear()
+        return
+
+    #----------------------------------------------------------------------
+    def wrap_socket(self, sock, server_side=False, do_handshake_on_connect=True,
+                    suppress_ragged_eofs=True, server_hostname=None, session=None):
+        if session is None and not server_side:
+            with self._lock:
+                session = self._sessions.get(server_hostname)
+        return super().wrap_socket(sock, server_side, do_handshake_on_connect,
+                                   suppress_ragged_eofs, server_hostname, session)
+
+    #----------------------------------------------------------------------
+    def _on_handshake(self, sock):
+        """
+        Counts a handshake and keeps the session.
+        Called by tls_socket.
+
+        Parameters
+        ----------
+        sock : mqbeebotte.tls_socket
+            Socket completed a handshake.
+        """
+        with self._lock:
+            self.handshakes += 1
+            if sock.session_reused:
+                self.resumed += 1
+        self.keep_session(sock)
+        return
+
+    #----------------------------------------------------------------------
+    def keep_session(self, sock):
+        """
+        Keeps the session of a socket to be resumed by the next
+        connection to the same server.  Sessions of TLS 1.3 become
+        resumable once data is received after the handshake.
+
+        Parameters
+        ----------
+        sock : ssl.SSLSocket
+            Connected socket wrapped by this context.
+        """
+        session = sock.session
+        if session is None or not session.has_ticket:
+            return
+        with self._lock:
+            self._sessions[sock.server_hostname] = session
+        return
+
+    #----------------------------------------------------------------------
+    def stats(self):
+        """
+        Gets handshake counters.
+
+        Returns
+        -------
+        stats : dict
+            'handshakes' and 'resumed'.
+        """
+        with self._lock:
+            return {'handshakes': self.handshakes, 'resumed': self.resumed}
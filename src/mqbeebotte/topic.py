@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020, Shigemi ISHIDA
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+#======================================================================
+class topic_trie(object):
+    """
+    Trie of MQTT topic filters
+
+    Maps topic filters including '+' and '#' wildcards to values and finds
+    the values of the filters matching a topic in time proportional to
+    the topic depth.
+    """
+
+    _EMPTY = object()
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        # node: [children dict, value]
+        self._root = [{}, topic_trie._EMPTY]
+        self._count = 0
+        return
+
+    #----------------------------------------------------------------------
+    def __len__(self):
+        return self._count
+
+    #----------------------------------------------------------------------
+    def __contains__(self, topic_filter):
+        return self.get(topic_filter, topic_trie._EMPTY) is not topic_trie._EMPTY
+
+    #----------------------------------------------------------------------
+    def __setitem__(self, topic_filter, value):
+        node = self._root
+        for level in topic_filter.split('/'):
+            child = node[0].get(level)
+            if child is None:
+                child = [{}, topic_trie._EMPTY]
+                node[0][level] = child
+            node = child
+        if node[1] is topic_trie._EMPTY:
+            self._count += 1
+        node[1] = value
+        return
+
+    #----------------------------------------------------------------------
+    def __getitem__(self, topic_filter):
+        value = self.get(topic_filter, topic_trie._EMPTY)
+        if value is topic_trie._EMPTY:
+            raise KeyError(topic_filter)
+        return value
+
+    #----------------------------------------------------------------------
+    def __delitem__(self, topic_filter):
+        if self.pop(topic_filter, topic_trie._EMPTY) is topic_trie._EMPTY:
+            raise KeyError(topic_filter)
+        return
+
+    #----------------------------------------------------------------------
+    def get(self, topic_filter, default=None):
+        """
+        Gets the value of a topic filter.
+
+        Parameters
+        ----------
+        topic_filter : str
+            Topic filter, compared literally.
+        default : object, default None
+            Value returned when the topic filter is not found.
+
+        Returns
+        -------
+        value : object
+            The value of the topic filter.
+        """
+        node = self._root
+        for level in topic_filter.split('/'):
+            node = node[0].get(level)
+            if node is None:
+                return default
+        return default if node[1] is topic_trie._EMPTY else node[1]
+
+    #----------------------------------------------------------------------
+    def pop(self, topic_filter, default=None):
+        """
+        Removes a topic filter.
+
+        Parameters
+        ----------
+        topic_filter : str
+            Topic filter, compared literally.
+        default : object, default None
+            Value returned when the topic filter is not found.
+
+        Returns
+        -------
+        value : object
+            The removed value of the topic filter.
+        """
+        path = []
+        node = self._root
+        for level in topic_filter.split('/'):
+            path.append((node, level))
+            node = node[0].get(level)
+            if node is None:
+                return default
+        value = node[1]
+        if value is topic_trie._EMPTY:
+            return default
+
+        node[1] = topic_trie._EMPTY
+        self._count -= 1
+        # prune empty nodes
+        for parent, level in reversed(path):
+            child = parent[0][level]
+            if len(child[0]) > 0 or child[1] is not topic_trie._EMPTY:
+                break
+            del parent[0][level]
+
+        return value
+
+    #----------------------------------------------------------------------
+    def match(self, topic):
+        """
+        Finds the values of the topic filters matching a topic.
+
+        Parameters
+        ----------
+        topic : str
+            Topic name without wildcards.
+
+        Returns
+        -------
+        values : list
+            Values of the matching topic filters.
+        """
+        levels = topic.split('/')
+        depth = len(levels)
+        values = []
+        # wildcards do not match topics beginning with '$'
+        is_system = topic.startswith('$')
+        nodes = [(self._root, 0)]
+        while len(nodes) > 0:
+            node, idx = nodes.pop()
+            children = node[0]
+            wildcard = not (is_system and idx == 0)
+            if wildcard:
+                child = children.get('#')
+                if child is not None and child[1] is not topic_trie._EMPTY:
+                    values.append(child[1])
+            if idx == depth:
+                if node[1] is not topic_trie._EMPTY:
+                    values.append(node[1])
+                continue
+            child = children.get(levels[idx])
+            if child is not None:
+                nodes.append((child, idx + 1))
+            if wildcard:
+                child = children.get('+')
+                if child is not None:
+                    nodes.append((child, idx + 1))
+
+        return values
+
+    #----------------------------------------------------------------------
+    def search(self, topic_filter):
+        """
+        Finds the topics matching a topic filter, i.e., the reverse of
+        match() with topics stored instead of topic filters.
+
+        Parameters
+        ----------
+        topic_filter : str
+            Topic filter including '+' and '#' wildcards.
+
+        Returns
+        -------
+        items : list
+            A list of tuple of (topic, value) of the matching topics.
+        """
+        levels = topic_filter.split('/')
+        depth = len(levels)
+        items = []
+        nodes = [(self._root, 0, None)]
+        while len(nodes) > 0:
+            node, idx, name = nodes.pop()
+            if idx == depth:
+                if node[1] is not topic_trie._EMPTY:
+                    items.append((name, node[1]))
+                continue
+
+            level = levels[idx]
+            if level == '#':
+                # the parent level and all the levels below
+                if idx > 0 and node[1] is not topic_trie._EMPTY:
+                    items.append((name, node[1]))
+                subtree = [(node, name)]
+                while len(subtree) > 0:
+                    parent, parent_name = subtree.pop()
+                    for child_level, child in parent[0].items():
+                        # wildcards do not match topics beginning with '$'
+                        if parent is self._root and child_level.startswith('$'):
+                            continue
+                        child_name = child_level if parent_name is None else parent_name + '/' + child_level
+                        if child[1] is not topic_trie._EMPTY:
+                            items.append((child_name, child[1]))
+                        subtree.append((child, child_name))
+                continue
+
+            if level == '+':
+                for child_level, child in node[0].items():
+                    if idx == 0 and child_level.startswith('$'):
+                        continue
+                    nodes.append((child, idx + 1, child_level if name is None else name + '/' + child_level))
+                continue
+
+            child = node[0].get(level)
+            if child is not None:
+                nodes.append((child, idx + 1, level if name is None else name + '/' + level))
+
+        return items
+
+    #----------------------------------------------------------------------
+    def items(self):
+        """
+        Gets all the topic filters and values.
+
+        Returns
+        -------
+        items : list
+            A list of tuple of (topic filter, value).
+        """
+        items = []
+        nodes = [(self._root, None)]
+        while len(nodes) > 0:
+            node, name = nodes.pop()
+            if node[1] is not topic_trie._EMPTY:
+                items.append((name, node[1]))
+            for level, child in node[0].items():
+                nodes.append((child, level if name is None else name + '/' + level))
+
+        return items
+
+#======================================================================
@@ -0,0 +1,75 @@
+import asyncio
+from mqbeebotte import aio
+
+def _run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 10.0))
+
+def test_publish_and_receive(server):
+    async def main():
+        cl = aio.client('127.0.0.1', server.port)
+        assert await cl.connect('token_x')
+        assert await cl.subscribe('chan/#', 2)
+        for qos in (0, 1, 2):
+            assert await cl.publish('chan/res', 'qos{:d}'.format(qos), qos)
+
+        received = []
+        async for msg in cl.messages():
+            received.append((msg.topic, msg.payload, msg.qos))
+            if len(received) == 3:
+                break
+        assert await cl.disconnect(1.0)
+        assert cl.topics == []
+        return received
+
+    received = _run(main())
+    assert sorted(received) == [('chan/res', b'qos0', 0), ('chan/res', b'qos1', 1), ('chan/res', b'qos2', 2)]
+
+def test_messages_end_on_disconnect(server):
+    async def main():
+        cl = aio.client('127.0.0.1', server.port)
+        assert await cl.connect('token_x')
+        assert await cl.subscribe('chan/#')
+
+        async def consume():
+            return [msg.payload async for msg in cl.messages()]
+
+        consumer = asyncio.ensure_future(consume())
+        assert await cl.publish('chan/res', 'x')
+        await asyncio.sleep(0.1)
+        assert await cl.disconnect(1.0)
+        return await consumer
+
+    assert _run(main()) == [b'x']
+
+def test_disconnect_timeout(server):
+    server.drop_acks = True
+
+    async def main():
+        cl = aio.client('127.0.0.1', server.port)
+        assert await cl.connect('token_x')
+        pub = asyncio.ensure_future(cl.publish('chan/res', 'x', 1))
+        await asyncio.sleep(0.05)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        assert not await cl.disconnect(0.2)
+        elapsed = loop.time() - start
+        return await pub, elapsed
+
+    published, elapsed = _run(main())
+    assert not published
+    assert elapsed < 2.0
+
+def test_messages_end_on_disconnect_full(server):
+    async def main():
+        cl = aio.client('127.0.0.1', server.port, maxsize=2)
+        assert await cl.connect('token_x')
+        assert await cl.subscribe('chan/#', 1)
+        for cnt in range(3):
+            assert await cl.publish('chan/res', str(cnt), 1)
+        await asyncio.sleep(0.2)
+        assert await cl.disconnect(1.0)
+        first = [msg.payload async for msg in cl.messages()]
+        second = [msg.payload async for msg in cl.messages()]
+        return first, second
+
+    assert _run(main()) == ([b'0', b'1'], [])
@@ -0,0 +1,31 @@
+import os
+from mqbeebotte.cache import last_value
+
+def test_latest_many():
+    cache = last_value()
+    cache.update('ch/a', b'1')
+    cache.update('ch/b', b'2')
+    cache.update('ch/a', b'3')
+    cache.update('other/a', b'4')
+    assert cache.latest('ch/a') == b'3'
+    assert cache.latest('ch/c') is None
+    assert cache.latest_many('ch/+') == {'ch/a': b'3', 'ch/b': b'2'}
+    assert cache.latest_many('+/a') == {'ch/a': b'3', 'other/a': b'4'}
+    cache.update('ch/b', b'')
+    assert cache.latest_many('ch/#') == {'ch/a': b'3'}
+
+def test_snapshot(tmp_path):
+    path = os.path.join(str(tmp_path), 'lv')
+    cache = last_value(path)
+    cache.update('ch/a', b'1', 100.0)
+    cache.update('ch/b', b'2' * 1000, 100.0)
+    assert cache.save()
+
+    warm = last_value(path)
+    assert warm.latest_many('#') == {'ch/a': b'1', 'ch/b': b'2' * 1000}
+    assert warm.updated_at('ch/a') == 100.0
+
+    # broken tail is ignored
+    with open(path, 'ab') as fp:
+        fp.write(b'garbage')
+    assert len(last_value(path)) == 2
@@ -0,0 +1,54 @@
+import os
+import time
+from mqbeebotte.capture import capture, replay
+
+class _publisher(object):
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, topic, msg, qos=0, retain=False):
+        self.messages.append((time.monotonic(), topic, msg, qos, retain))
+        return True
+
+def test_record_and_read(tmp_path):
+    path = os.path.join(str(tmp_path), 'cap')
+    log = capture(path)
+    assert log.record(capture.OUTBOUND, 'ch/a', b'1', 1, False, ts=100.0)
+    assert log.record(capture.INBOUND, 'ch/b', b'\x00' * 300, 2, True, ts=100.5)
+    log.close()
+    assert not log.record(capture.OUTBOUND, 'ch/a', b'2')
+
+    # appends to the existing log
+    log = capture(path)
+    log.record(capture.OUTBOUND, 'ch/c', b'', ts=101.0)
+    log.close()
+    assert log.stats()['records'] == 1
+
+    records = list(capture.read(path))
+    assert records == [
+        (100.0, capture.OUTBOUND, 'ch/a', b'1', 1, False),
+        (100.5, capture.INBOUND, 'ch/b', b'\x00' * 300, 2, True),
+        (101.0, capture.OUTBOUND, 'ch/c', b'', 0, False),
+    ]
+
+    # cut record is ignored
+    with open(path, 'ab') as fp:
+        fp.write(capture._RECORD.pack(100, 102.0, 0, 4) + b'ch/d')
+    assert len(list(capture.read(path))) == 3
+
+def test_replay(tmp_path):
+    path = os.path.join(str(tmp_path), 'cap')
+    log = capture(path)
+    for cnt in range(5):
+        log.record(capture.OUTBOUND, 'ch/a', str(cnt).encode(), ts=100.0 + cnt * 0.1)
+        log.record(capture.INBOUND, 'ch/b', b'in', ts=100.0 + cnt * 0.1)
+    log.close()
+
+    cl = _publisher()
+    assert replay(cl, path, None) == 5
+    assert [msg for _, _, msg, _, _ in cl.messages] == [b'0', b'1', b'2', b'3', b'4']
+
+    cl = _publisher()
+    assert replay(cl, path, 2.0, direction=None) == 10
+    elapsed = cl.messages[-1][0] - cl.messages[0][0]
+    assert 0.18 <= elapsed < 0.4
@@ -0,0 +1,275 @@
+import logging
+import threading
+import time
+from mqbeebotte import client
+from .conftest import wait
+
+def _subscriber(server, topic, qos=0):
+    received = []
+    cl = client('127.0.0.1', server.port)
+    cl.connect('token_x', on_message=lambda c, u, msg: received.append(msg.payload))
+    cl.start()
+    cl.subscribe(topic, qos)
+    assert wait(lambda: len(server._sessions) > 0 and any(len(sess.subs) > 0 for sess in server._sessions))
+    return cl, received
+
+def test_publish_without_start(server):
+    sub, received = _subscriber(server, 'chan/#')
+    cl = client('127.0.0.1', server.port)
+    cl.connect('token_x')
+    for cnt in range(5):
+        assert cl.publish('chan/res', str(cnt))
+    assert wait(lambda: len(received) == 5)
+    assert cl.disconnect(1.0)
+    sub.stop(block_wait=True)
+    sub.disconnect(1.0)
+
+def test_loop_created_by_start(server):
+    cl = client('127.0.0.1', server.port)
+    assert cl._loop is None
+    cl.connect('token_x')
+    assert cl.publish('chan/res', 'x')
+    assert cl.disconnect(1.0)
+    assert cl._loop is None
+
+def test_disconnect_fails_pending(server):
+    server.drop_acks = True
+    cl = client('127.0.0.1', server.port)
+    cl.connect('token_x')
+    cl.start()
+    done = []
+    failed = []
+    for cnt in range(3):
+        assert cl.publish('chan/res', str(cnt), 1, callback=done.append, errback=failed.append)
+    assert not cl.disconnect(0.2)
+    assert done == []
+    assert len(failed) == 3
+    cl.stop(block_wait=True)
+
+def test_publish_many_discarded(server):
+    server.drop_acks = True
+    cl = client('127.0.0.1', server.port)
+    cl.connect('token_x')
+    cl.start()
+    result = cl.publish_many(('chan/res', str(cnt), 1) for cnt in range(5))
+    assert not result.wait(0.1)
+    assert not cl.disconnect(0.1)
+    assert result.wait(1.0)
+    assert (result.total, result.published, result.failed) == (5, 0, 5)
+    cl.stop(block_wait=True)
+
+def test_write_many_timeout(server):
+    server.drop_acks = True
+    cl = client('127.0.0.1', server.port)
+    cl.connect('token_x')
+    cl.start()
+    start = time.monotonic()
+    assert not cl.write_many('chan', [('res', cnt) for cnt in range(3)], 1, timeout=0.2)
+    # the window of publish_many() is full
+    assert not cl.write_many('chan', [('res', cnt) for cnt in range(300)], 1, timeout=0.2)
+    assert time.monotonic() - start < 1.0
+    assert not cl.disconnect(0.1)
+    cl.stop(block_wait=True)
+
+    server.drop_acks = False
+    cl = client('127.0.0.1', server.port)
+    cl.connect('token_x')
+    cl.start()
+    assert cl.write_many('chan', [('res', cnt) for cnt in range(300)], 1, timeout=5.0)
+    assert cl.disconnect(1.0)
+    cl.stop(block_wait=True)
+
+def test_reconnect_resubscribe(server):
+    received = []
+    cl = client('127.0.0.1', server.port, reconnect_min_delay=0.05, reconnect_max_delay=0.1)
+    cl.connect('token_x', on_message=lambda c, u, msg: received.append(msg.topic))
+    cl.start()
+    for topic in ('a/#', 'b/#', 'c/#'):
+        assert cl.subscribe(topic, 1)
+    assert wait(lambda: server.subscribes == 3)
+    assert cl.recover_time is None
+
+    server.drop_connections()
+    assert wait(lambda: cl.reconnect_count == 1)
+    # the topics are restored with a single SUBSCRIBE
+    assert wait(lambda: server.subscribes == 4)
+    assert 0.0 < cl.recover_time < 5.0
+    assert sorted(cl.topics) == ['a/#', 'b/#', 'c/#']
+
+    pub = client('127.0.0.1', server.port)
+    pub.connect('token_x')
+    for topic in ('a/x', 'b/x', 'c/x'):
+        pub.publish(topic, 'x')
+    assert wait(lambda: sorted(received) == ['a/x', 'b/x', 'c/x'])
+    pub.disconnect(1.0)
+    cl.stop(block_wait=True)
+    cl.disconnect(1.0)
+
+def test_flush(server):
+    cl = client('127.0.0.1', server.port)
+    cl.connect('token_x')
+    cl.start()
+    done = []
+    for cnt in range(3):
+        assert cl.publish('chan/res', str(cnt), 1, callback=done.append)
+    assert cl.flush(2.0) == []
+    assert len(done) == 3
+    assert cl.stats()['inflight'] == 0
+
+    server.drop_acks = True
+    for cnt in range(3):
+        assert cl.publish('chan/res', str(cnt), 2)
+    start = time.monotonic()
+    pending = cl.flush(0.2)
+    assert 0.15 < time.monotonic() - start < 1.0
+    assert len(pending) == 3
+    assert pending == sorted(pending)
+    assert cl.stats()['inflight'] == 3
+    cl.disconnect(0.1)
+    cl.stop(block_wait=True)
+
+def test_publish_many_window(server):
+    cl = client('127.0.0.1', server.port)
+    cl.connect('token_x')
+    cl.start()
+    result = cl.publish_many((('chan/res', str(cnt), 1) for cnt in range(50)), max_inflight=5)
+    assert result.wait(2.0)
+    assert (result.total, result.published, result.failed) == (50, 50, 0)
+
+    server.drop_acks = True
+    result = cl.publish_many((('chan/res', str(cnt), 1) for cnt in range(10)), max_inflight=4, timeout=0.2)
+    # no room in the window without acknowledgements
+    assert result.total == 4
+    assert cl.stats()['inflight'] == 4
+    cl.disconnect(0.1)
+    assert result.wait(1.0)
+    assert result.failed == 4
+    cl.stop(block_wait=True)
+
+def test_resource_qos0(server):
+    sub, received = _subscriber(server, 'chan/#')
+    cl = client('127.0.0.1', server.port)
+    cl.connect('token_x')
+    cl.start()
+    res = cl.resource('chan', 'res')
+    for cnt in range(5):
+        assert res.publish(cnt)
+    done = []
+    assert res.publish_raw(b'5', callback=done.append)
+    assert wait(lambda: len(received) == 6)
+    assert wait(lambda: len(done) == 1)
+    assert (cl.metrics.published, cl.metrics.acked) == (6, 6)
+    assert cl.disconnect(1.0)
+    cl.stop(block_wait=True)
+    sub.stop(block_wait=True)
+    sub.disconnect(1.0)
+
+def test_spool_retry_while_connected(server, tmp_path):
+    from mqbeebotte import spool
+    sub, received = _subscriber(server, 'chan/#', 1)
+    sp = spool(str(tmp_path))
+    cl = client('127.0.0.1', server.port, spool=sp, max_inflight=2)
+    cl.connect('token_x')
+    # acks are not read until start()
+    for cnt in range(5):
+        assert cl.publish('chan/res', str(cnt), 1)
+    assert len(sp) == 5
+    cl.start()
+    assert wait(lambda: len(sp) == 0)
+    assert wait(lambda: len(received) == 5)
+    assert received == [str(cnt).encode() for cnt in range(5)]
+    assert cl.disconnect(1.0)
+    cl.stop(block_wait=True)
+    sub.stop(block_wait=True)
+    sub.disconnect(1.0)
+    sp.close()
+
+def test_spool_inflight_full(server, tmp_path, caplog):
+    from mqbeebotte import spool
+    server.drop_acks = True
+    sp = spool(str(tmp_path))
+    cl = client('127.0.0.1', server.port, spool=sp, max_inflight=2)
+    cl.connect('token_x')
+    cl.start()
+    start = time.monotonic()
+    with caplog.at_level(logging.WARNING, logger='mqbeebotte.client'):
+        for cnt in range(2000):
+            assert cl.publish('chan/res', str(cnt), 1)
+    assert time.monotonic() - start < 5.0
+    # logged once while the in-flight table stays full
+    assert len(caplog.records) == 1
+    assert len(sp) == 2000
+    assert not cl.disconnect(0.1)
+    cl.stop(block_wait=True)
+
+    server.drop_acks = False
+    sub, received = _subscriber(server, 'chan/#', 1)
+    cl = client('127.0.0.1', server.port, spool=sp, max_inflight=20)
+    cl.connect('token_x')
+    cl.start()
+    assert wait(lambda: len(sp) == 0, 10.0)
+    assert wait(lambda: len(received) == 2000)
+    assert received == [str(cnt).encode() for cnt in range(2000)]
+    assert cl.disconnect(1.0)
+    cl.stop(block_wait=True)
+    sub.stop(block_wait=True)
+    sub.disconnect(1.0)
+    sp.close()
+
+def test_reconnect_delay_long_outage():
+    cl = client('127.0.0.1', 1, reconnect_min_delay=0.5, reconnect_max_delay=30.0)
+    cl._reconnect_attempts = 1100
+    delay = cl._client__reconnect_delay()
+    assert 0.0 <= delay <= 30.0
+    assert cl._reconnect_attempts == 1101
+
+def test_streams_closed(server):
+    cl = client('127.0.0.1', server.port)
+    cl.connect('token_x')
+    cl.start()
+    streams = [cl.messages('chan/a'), cl.messages('chan/b'), cl.messages('chan/c')]
+    old = streams[2]
+    streams[2] = cl.messages('chan/c')
+    assert old.get() is None
+    received = [[] for stream in streams]
+    consumers = [threading.Thread(target=lambda stream=stream, out=out: out.extend(stream))
+                 for stream, out in zip(streams, received)]
+    for consumer in consumers:
+        consumer.start()
+    assert cl.publish('chan/a', b'x')
+    assert wait(lambda: [msg.payload for msg in received[0]] == [b'x'])
+
+    assert cl.unsubscribe('chan/a')
+    consumers[0].join(1.0)
+    assert not consumers[0].is_alive()
+    assert cl.unsubscribe(['chan/b'])
+    consumers[1].join(1.0)
+    assert not consumers[1].is_alive()
+    assert cl.disconnect(1.0)
+    consumers[2].join(1.0)
+    assert not consumers[2].is_alive()
+    cl.stop(block_wait=True)
+
+def test_stop_dispatcher(server):
+    from mqbeebotte import dispatcher
+    disp = dispatcher(workers=2)
+    handled = []
+
+    def slow(c, u, msg):
+        time.sleep(0.1)
+        handled.append(msg.payload)
+
+    cl = client('127.0.0.1', server.port, dispatcher=disp)
+    cl.connect('token_x', on_message=slow)
+    cl.start()
+    workers = list(disp._threads)
+    cl.subscribe('chan/#', 1)
+    assert wait(lambda: any(len(sess.subs) > 0 for sess in server._sessions))
+    for cnt in range(3):
+        assert cl.publish('chan/res', str(cnt), 1)
+    assert wait(lambda: disp.stats()['depth'] + len(handled) == 3)
+    cl.stop(block_wait=True)
+    # queued callbacks are handled before the workers stop
+    assert handled == [b'0', b'1', b'2']
+    assert not any(th.is_alive() for th in workers)
+    cl.disconnect(1.0)
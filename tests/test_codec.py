@@ -0,0 +1,31 @@
+from mqbeebotte import codec
+
+class _msg(object):
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+        self.qos = 1
+
+def test_encode_envelope():
+    assert codec.loads(codec.encode(1.5)) == {'data': 1.5, 'ispublic': False}
+    assert codec.loads(codec.encode('x', True, 1600000000000)) == \
+        {'data': 'x', 'ispublic': True, 'ts': 1600000000000}
+
+def test_envelope_template():
+    env = codec.envelope(ispublic=True)
+    assert codec.loads(env.encode({'a': 1})) == {'data': {'a': 1}, 'ispublic': True}
+
+def test_message_lazy_parse():
+    msg = codec.message(_msg('ch/res', codec.encode(10, ts=123)))
+    assert msg.topic == 'ch/res'
+    assert msg.qos == 1
+    assert msg._json is codec.message._UNPARSED
+    assert msg.data == 10
+    assert msg.ts == 123
+    assert msg.ispublic is False
+
+def test_message_not_envelope():
+    msg = codec.message(_msg('ch/res', b'[1, 2]'))
+    assert msg.data == [1, 2]
+    assert msg.ts is None
+    assert codec.message(_msg('ch/res', b'abc')).text == 'abc'
@@ -0,0 +1,63 @@
+import time
+import paho.mqtt.client as mqtt
+from mqbeebotte.codec import message
+from mqbeebotte.dedup import dedup
+
+def _msg(payload, qos=1):
+    msg = mqtt.MQTTMessage(topic=b'ch/res')
+    msg.payload = payload
+    msg.qos = qos
+    return message(msg)
+
+def test_bound():
+    index = dedup(maxlen=2)
+    assert not index.check('ch/res', 1)
+    assert not index.check('ch/res', 2)
+    assert index.check('ch/res', 1)
+    assert not index.check('ch/other', 1)
+    # 1 was seen first
+    assert not index.check('ch/res', 1)
+    assert len(index) == 2
+    stats = index.stats()
+    assert stats['checked'] == 5
+    assert stats['hits'] == 1
+    assert stats['hit_rate'] == 0.2
+
+def test_window():
+    index = dedup(window=0.05)
+    assert not index.check('ch/res', 'a')
+    assert index.check('ch/res', 'a')
+    time.sleep(0.1)
+    assert not index.check('ch/res', 'a')
+    assert len(index) == 1
+
+def test_window_does_not_slide():
+    index = dedup(window=0.2)
+    results = []
+    for cnt in range(5):
+        results.append(index.check('ch/res', 'a'))
+        time.sleep(0.1)
+    assert results[:2] == [False, True]
+    assert results[2:].count(False) >= 1
+
+def test_qos0_not_checked():
+    index = dedup()
+    payloads = [b'{"data":1,"ts":1}', b'{"data":1,"ts":1}']
+    assert [index.is_duplicate(_msg(payload, 0)) for payload in payloads] == [False, False]
+    assert index.stats()['checked'] == 0
+
+def test_envelope_ts():
+    index = dedup()
+    assert not index.is_duplicate(_msg(b'{"data":21.5,"ts":1000}'))
+    # the same reading written again
+    assert not index.is_duplicate(_msg(b'{"data":21.5,"ts":2000}'))
+    # redelivery
+    assert index.is_duplicate(_msg(b'{"data":21.5,"ts":1000}'))
+
+def test_raw_payload_not_checked():
+    index = dedup()
+    assert [index.is_duplicate(_msg(payload)) for payload in (b'21.5', b'21.5', b'[1]', b'[1]')] == [False] * 4
+    assert index.stats()['checked'] == 0
+
+    index = dedup(key=lambda msg: msg.payload)
+    assert [index.is_duplicate(_msg(payload)) for payload in (b'21.5', b'21.5')] == [False, True]
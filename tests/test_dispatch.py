@@ -0,0 +1,35 @@
+from mqbeebotte import dispatcher
+
+def test_order_per_topic():
+    disp = dispatcher(workers=3, maxsize=100)
+    disp.start()
+    got = {}
+    for cnt in range(50):
+        for topic in ('a', 'b', 'c'):
+            disp.submit(topic, lambda t, n: got.setdefault(t, []).append(n), topic, cnt)
+    disp.stop(block_wait=True)
+    assert all(got[topic] == list(range(50)) for topic in ('a', 'b', 'c'))
+    assert disp.stats()['handled'] == 150
+
+def test_drop_new():
+    disp = dispatcher(workers=1, maxsize=2, policy='drop_new')
+    results = [disp.submit('a', lambda n: None, cnt) for cnt in range(4)]
+    assert results == [True, True, False, False]
+    assert disp.stats()['dropped'] == 2
+    assert disp.stats()['depth'] == 2
+
+def test_drop_old():
+    disp = dispatcher(workers=1, maxsize=2, policy='drop_old')
+    got = []
+    for cnt in range(4):
+        disp.submit('a', got.append, cnt)
+    disp.start()
+    disp.stop(block_wait=True)
+    assert got == [2, 3]
+
+def test_stop_not_started():
+    disp = dispatcher(workers=1, maxsize=1)
+    assert disp.submit('a', lambda n: None, 0)
+    disp.stop(block_wait=True)
+    assert not disp.submit('a', lambda n: None, 1)
+    assert disp.stats()['dropped'] == 1
@@ -0,0 +1,34 @@
+import multiprocessing
+from mqbeebotte.fanout import fanout
+
+_results = None
+
+def _init(results):
+    global _results
+    _results = results
+
+def _handle(topic, payload):
+    _results.put((topic, payload))
+
+def test_order_per_topic():
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.SimpleQueue()
+    # small ring to wrap around and to span chunks
+    procs = fanout(_handle, workers=2, buffer_size=1024, initializer=_init, initargs=(results,), context=ctx)
+    procs.start()
+    sent = []
+    for cnt in range(200):
+        topic = 'ch/res{:d}'.format(cnt % 3)
+        payload = bytes([cnt % 256]) * (cnt % 400)
+        assert procs.submit(topic, payload)
+        sent.append((topic, payload))
+    assert not procs.submit('ch/big', b'x' * 2048)
+    procs.stop(block_wait=True)
+
+    got = [results.get() for cnt in range(len(sent))]
+    for topic in ('ch/res0', 'ch/res1', 'ch/res2'):
+        assert [m for m in got if m[0] == topic] == [m for m in sent if m[0] == topic]
+    stats = procs.stats()
+    assert stats['handled'] == 200
+    assert stats['depth'] == 0
+    assert stats['dropped'] == 1
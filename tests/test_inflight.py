@@ -0,0 +1,35 @@
+from mqbeebotte.inflight import inflight
+
+def test_ring_and_overflow():
+    table = inflight(100)
+    cb = lambda mid: None
+    for mid in range(1, 101):
+        assert table.reserve()
+        table.add(mid, 1, float(mid), cb if mid == 7 else None)
+    assert not table.reserve()
+    assert table.is_full()
+    assert len(table) == 100
+    assert table.pop(7) == (1, 7.0, cb)
+    assert table.pop(7) is None
+    # mid 1 is still in flight after the ring wraps
+    for mid in range(2, 101):
+        if mid != 7:
+            table.pop(mid)
+    assert table.reserve()
+    table.add(129, 2, 129.0)
+    assert sorted(table) == [1, 129]
+    assert table.pop(129) == (2, 129.0, None)
+    assert table.pop(1) == (1, 1.0, None)
+    assert len(table) == 0
+
+def test_reservation():
+    table = inflight(2)
+    assert table.reserve()
+    assert table.reserve()
+    assert not table.reserve()
+    table.release()
+    table.add(1, 1, 0.0)
+    assert 1 in table and 2 not in table
+    table.clear()
+    assert len(table) == 0
+    assert table.reserve()
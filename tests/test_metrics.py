@@ -0,0 +1,23 @@
+from mqbeebotte import histogram, metrics
+
+def test_histogram_percentile():
+    hist = histogram()
+    for cnt in range(99):
+        hist.record(0.00005)
+    hist.record(1.0)
+    snap = hist.snapshot()
+    assert snap['count'] == 100
+    assert snap['p50'] == histogram.BOUNDS[0]
+    assert snap['p99'] == histogram.BOUNDS[0]
+    assert hist.percentile(100) == histogram.BOUNDS[14]
+    assert snap['max'] == 1.0
+
+def test_metrics_snapshot():
+    mt = metrics()
+    mt.on_publish(2, 10)
+    mt.on_ack(1, 0.01)
+    mt.on_receive(5)
+    snap = mt.snapshot()
+    assert (snap['published'], snap['published_bytes'], snap['acked']) == (2, 10, 1)
+    assert snap['ack_latency'][1]['count'] == 1
+    assert snap['received_bytes'] == 5
@@ -0,0 +1,44 @@
+from mqbeebotte import pool
+from .conftest import wait
+
+def test_shard_consistent():
+    topics = ['chan/res{:d}'.format(cnt) for cnt in range(200)]
+    shards = [pool(4).shard(topic) for topic in topics]
+    assert shards == [pool(4).shard(topic) for topic in topics]
+    assert set(shards) == {0, 1, 2, 3}
+
+def test_shard_stable_on_resize():
+    topics = ['chan/res{:d}'.format(cnt) for cnt in range(1000)]
+    small = pool(4)
+    large = pool(5)
+    moved = [topic for topic in topics if small.shard(topic) != large.shard(topic)]
+    # only the topics taken over by the new shard move
+    assert all(large.shard(topic) == 4 for topic in moved)
+    assert len(moved) < len(topics) / 2
+
+def test_publish_subscribe(server):
+    received = []
+    pl = pool(3, '127.0.0.1', server.port)
+    assert pl.connect('token_x', on_message=lambda c, u, msg: received.append((msg.topic, msg.payload)))
+    pl.start()
+    topics = ['chan/res{:d}'.format(cnt) for cnt in range(6)]
+    assert pl.subscribe([(topic, 1) for topic in topics])
+    assert wait(lambda: server.subscribes >= len({pl.shard(topic) for topic in topics}))
+    for idx, cl in enumerate(pl.clients):
+        assert sorted(cl.topics) == sorted(topic for topic in topics if pl.shard(topic) == idx)
+
+    for topic in topics:
+        assert pl.publish(topic, topic, 1)
+    assert wait(lambda: len(received) == len(topics))
+    assert sorted(received) == sorted((topic, topic.encode()) for topic in topics)
+    stats = pl.stats()
+    assert sum(st['messages'] for st in stats) == len(topics)
+    for idx, st in enumerate(stats):
+        count = len([topic for topic in topics if pl.shard(topic) == idx])
+        assert (st['messages'], st['topics']) == (count, count)
+
+    assert pl.unsubscribe(topics)
+    assert all(len(cl.topics) == 0 for cl in pl.clients)
+    assert pl.flush(1.0) == [[], [], []]
+    assert pl.disconnect(1.0)
+    pl.stop(block_wait=True)
@@ -0,0 +1,29 @@
+import time
+from mqbeebotte import rate_limiter, token_bucket
+
+def test_bucket_burst():
+    bucket = token_bucket(10, burst=3)
+    assert [bucket.reserve(0.0) for cnt in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.reserve(0.0) is None
+    assert 0.09 < bucket.reserve() <= 0.1
+
+def test_nonblocking_reject():
+    limiter = rate_limiter(1000, burst=2, block=False)
+    assert [limiter.acquire('ch/res') for cnt in range(3)] == [True, True, False]
+    assert limiter.stats()['rejected'] == 1
+
+def test_blocking_paces():
+    limiter = rate_limiter(100, burst=1)
+    start = time.monotonic()
+    for cnt in range(6):
+        assert limiter.acquire('ch/res')
+    assert time.monotonic() - start >= 0.045
+    assert limiter.stats()['waited'] == 5
+
+def test_resource_limit():
+    limiter = rate_limiter(1000, burst=10, resource_rate=1, resource_burst=1, block=False)
+    assert limiter.acquire('ch/a')
+    assert not limiter.acquire('ch/a')
+    assert limiter.acquire('ch/b')
+    # refunded to the connection bucket
+    assert limiter.stats()['passed'] == 2
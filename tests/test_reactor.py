@@ -0,0 +1,69 @@
+import logging
+from mqbeebotte import client, reactor
+from .conftest import wait
+
+def test_failing_handler(server, caplog):
+    loop = reactor()
+    loop.start()
+    received = ([], [])
+
+    def failing(c, u, msg):
+        received[0].append(msg.payload)
+        if msg.payload == b'0':
+            raise RuntimeError('handler failure')
+
+    clients = []
+    for on_message in (failing, lambda c, u, msg: received[1].append(msg.payload)):
+        cl = client('127.0.0.1', server.port, reactor=loop)
+        cl.connect('token_x', on_message=on_message)
+        cl.start()
+        cl.subscribe('chan/#', 1)
+        clients.append(cl)
+    assert wait(lambda: sum(len(sess.subs) for sess in server._sessions) == 2)
+
+    pub = client('127.0.0.1', server.port)
+    pub.connect('token_x')
+    with caplog.at_level(logging.ERROR, logger='mqbeebotte.reactor'):
+        for cnt in range(5):
+            pub.publish('chan/res', str(cnt), 1)
+        expected = [str(cnt).encode() for cnt in range(5)]
+        assert wait(lambda: received[0] == expected and received[1] == expected)
+    assert loop.is_alive()
+    assert any(record.exc_info is not None and 'handler failure' in str(record.exc_info[1])
+               for record in caplog.records)
+
+    pub.disconnect(1.0)
+    for cl in clients:
+        cl.stop()
+        cl.disconnect(1.0)
+    loop.stop(block_wait=True)
+
+def test_failing_misc(server, caplog):
+    loop = reactor()
+    loop.start()
+    received = []
+
+    def failing(now):
+        raise RuntimeError('misc failure')
+
+    broken = client('127.0.0.1', server.port, reactor=loop)
+    broken.connect('token_x')
+    broken._loop_misc = failing
+    broken.start()
+    cl = client('127.0.0.1', server.port, reactor=loop)
+    cl.connect('token_x', on_message=lambda c, u, msg: received.append(msg.payload))
+    cl.start()
+    cl.subscribe('chan/#', 1)
+    assert wait(lambda: sum(len(sess.subs) for sess in server._sessions) == 1)
+
+    with caplog.at_level(logging.ERROR, logger='mqbeebotte.reactor'):
+        assert wait(lambda: any('misc failure' in str(record.exc_info[1])
+                                 for record in caplog.records if record.exc_info is not None))
+    assert loop.is_alive()
+    assert broken.publish('chan/res', b'x', 1)
+    assert wait(lambda: received == [b'x'])
+
+    for each in (broken, cl):
+        each.stop()
+        each.disconnect(1.0)
+    loop.stop(block_wait=True)
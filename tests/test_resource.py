@@ -0,0 +1,13 @@
+from mqbeebotte import client
+
+def test_resource_validation():
+    cl = client()
+    res = cl.resource('chan', 'temp', 1, True, ispublic=True)
+    assert (res.topic, res.qos, res.retain, res.ispublic) == ('chan/temp', 1, True, True)
+    assert cl.resource('chan/x', 'temp') is None
+    assert cl.resource('chan', 'temp/#') is None
+    assert cl.resource('chan', '') is None
+    assert cl.resource('chan', 'temp', 3) is None
+    # not connected
+    assert not res.publish(1.5)
+    assert not res.publish_raw(b'1.5')
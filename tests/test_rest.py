@@ -0,0 +1,111 @@
+import json
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from mqbeebotte.rest import rest_writer, rest_reader
+
+class _handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        server = self.server
+        with server.lock:
+            server.clients.add(self.client_address)
+            server.tokens.add(self.headers['X-Auth-Token'])
+            fail = server.failures > 0
+            if fail:
+                server.failures -= 1
+            else:
+                server.requests.append((self.path, json.loads(body)['records']))
+        status = 500 if fail else 200
+        self.send_response(status)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        records = [rec for rec in self.server.history
+                   if rec['ts'] >= int(query.get('ts-from', 0))
+                   and rec['ts'] <= int(query.get('ts-to', 1 << 62))]
+        # newest first like the read API
+        records.sort(key=lambda rec: -rec['ts'])
+        body = json.dumps(records[:int(query['limit'])]).encode()
+        with self.server.lock:
+            self.server.requests.append((url.path, query))
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def _serve(failures=0):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _handler)
+    server.lock = threading.Lock()
+    server.clients = set()
+    server.tokens = set()
+    server.requests = []
+    server.failures = failures
+    server.history = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def test_bulk_write_keep_alive():
+    server = _serve()
+    writer = rest_writer('token_x', '127.0.0.1', server.server_address[1], secure=False,
+                         connections=2, chunk_size=10)
+    records = [('res', cnt, 1000 + cnt) for cnt in range(95)]
+    assert writer.write('chan', records)
+    assert writer.write('chan', [('res', 'x')])
+    server.shutdown()
+    writer.close()
+
+    assert len(server.requests) == 11
+    assert all(path == '/v1/data/write/chan' for path, chunk in server.requests)
+    written = sorted(rec['data'] for path, chunk in server.requests for rec in chunk if rec['data'] != 'x')
+    assert written == list(range(95))
+    assert server.tokens == {'token_x'}
+    # connections are reused
+    assert len(server.clients) <= 2
+    assert writer.stats()['records'] == 96
+
+def test_retry_failed_chunk():
+    server = _serve(failures=2)
+    writer = rest_writer('token_x', '127.0.0.1', server.server_address[1], secure=False,
+                         connections=1, retry_delay=0.01)
+    assert writer.write('chan', [('res', 1)])
+    stats = writer.stats()
+    assert stats['retries'] == 2
+    assert stats['requests'] == 3
+    writer.close()
+    server.shutdown()
+
+def test_read_history_batches():
+    server = _serve()
+    # two records share each timestamp to cross page boundaries
+    server.history = [{'_id': str(cnt), 'ts': 1000 + cnt // 2, 'data': float(cnt)} for cnt in range(25)]
+    reader = rest_reader('token_x', '127.0.0.1', server.server_address[1], secure=False)
+    batches = list(reader.read('chan', 'res', batch_size=7))
+    reader.close()
+    server.shutdown()
+
+    assert all(len(batch['ts']) <= 7 for batch in batches)
+    assert all(list(batch['ts']) == sorted(batch['ts']) for batch in batches)
+    values = sorted(value for batch in batches for value in batch['data'])
+    assert values == [float(cnt) for cnt in range(25)]
+    assert all(path == '/v1/data/read/chan/res' for path, query in server.requests)
+
+def test_read_history_range():
+    server = _serve()
+    server.history = [{'_id': str(cnt), 'ts': 1000 + cnt, 'data': cnt} for cnt in range(50)]
+    reader = rest_reader('token_x', '127.0.0.1', server.server_address[1], secure=False)
+    ts = [t for batch in reader.read('chan', 'res', 1010, 1029, batch_size=8) for t in batch['ts']]
+    reader.close()
+    server.shutdown()
+
+    assert sorted(ts) == list(range(1010, 1030))
+    assert len(ts) == 20
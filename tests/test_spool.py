@@ -0,0 +1,41 @@
+from mqbeebotte import spool
+
+def test_pending_in_order(tmp_path):
+    sp = spool(str(tmp_path))
+    for cnt in range(3):
+        sp.append('ch/res', 'msg{:d}'.format(cnt), 1)
+    sp.ack(2)
+    assert [(m[0], m[2]) for m in sp.pending()] == [(1, b'msg0'), (3, b'msg2')]
+    sp.close()
+
+def test_recover_after_reopen(tmp_path):
+    sp = spool(str(tmp_path))
+    seqs = [sp.append('ch/res', b'x' * 10, 1) for cnt in range(5)]
+    sp.ack(seqs[0])
+    sp.ack(seqs[1])
+    sp.close()
+
+    sp = spool(str(tmp_path))
+    assert len(sp) == 3
+    assert [m[0] for m in sp.pending()] == seqs[2:]
+    assert sp.append('ch/res', b'y') == seqs[-1] + 1
+    sp.close()
+
+def test_compact_acked_segments(tmp_path):
+    sp = spool(str(tmp_path), segment_size=256)
+    seqs = [sp.append('ch/res', b'x' * 100) for cnt in range(10)]
+    assert len(list(tmp_path.glob('*.seg'))) > 1
+    for seq in seqs:
+        sp.ack(seq)
+    assert len(list(tmp_path.glob('*.seg'))) == 1
+    assert len(sp) == 0
+    sp.close()
+
+def test_drop_oldest_over_limit(tmp_path):
+    sp = spool(str(tmp_path), segment_size=256, max_bytes=1024)
+    for cnt in range(20):
+        sp.append('ch/res', b'x' * 100)
+    assert sum(p.stat().st_size for p in tmp_path.glob('*.seg')) <= 1024
+    assert sp.dropped > 0
+    assert len(sp) == 20 - sp.dropped
+    sp.close()
@@ -0,0 +1,30 @@
+import threading
+from mqbeebotte.stream import message_stream
+
+def test_overflow_drops_oldest():
+    stream = message_stream(maxlen=3)
+    for cnt in range(5):
+        stream._put(None, None, cnt)
+    assert stream.received == 5
+    assert stream.overflow == 2
+    assert stream.get_batch(10) == [2, 3, 4]
+    assert stream.get(timeout=0) is None
+
+def test_get_batch_waits_for_first():
+    stream = message_stream()
+    timer = threading.Timer(0.05, lambda: [stream._put(None, None, cnt) for cnt in range(3)])
+    timer.start()
+    assert stream.get_batch(2, timeout=5) == [0, 1]
+    assert stream.get_batch(2, timeout=0) == [2]
+    timer.join()
+
+def test_iterate_until_closed():
+    closed = []
+    stream = message_stream(on_close=lambda: closed.append(True))
+    stream._put(None, None, 'a')
+    stream._put(None, None, 'b')
+    threading.Timer(0.05, stream.close).start()
+    assert list(stream) == ['a', 'b']
+    assert closed == [True]
+    stream._put(None, None, 'c')
+    assert len(stream) == 0
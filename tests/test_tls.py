@@ -0,0 +1,60 @@
+import os
+import socket
+import ssl
+import threading
+from mqbeebotte.tls import tls_context
+
+DATA = os.path.join(os.path.dirname(__file__), 'data')
+CERT = os.path.join(DATA, 'tls_cert.pem')
+KEY = os.path.join(DATA, 'tls_key.pem')
+
+def _serve():
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(CERT, KEY)
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen()
+
+    def serve():
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                # listener closed
+                return
+            try:
+                with context.wrap_socket(conn, server_side=True) as sock:
+                    sock.sendall(b'x')
+                    sock.recv(1)
+            except OSError:
+                pass
+
+    threading.Thread(target=serve, daemon=True).start()
+    return listener
+
+def test_shared_context():
+    tls_context.clear()
+    context = tls_context.get(CERT)
+    assert tls_context.get(CERT) is context
+    assert tls_context.get(CERT, ciphers='ECDHE+AESGCM') is not context
+    assert context.check_hostname
+    assert context.verify_mode == ssl.CERT_REQUIRED
+
+def test_session_resumption():
+    tls_context.clear()
+    listener = _serve()
+    context = tls_context.get(CERT)
+    reused = []
+    for cnt in range(3):
+        sock = context.wrap_socket(socket.create_connection(listener.getsockname()),
+                                   server_hostname='localhost', do_handshake_on_connect=False)
+        sock.do_handshake()
+        assert sock.handshake_time > 0
+        sock.recv(1)
+        context.keep_session(sock)
+        reused.append(sock.session_reused)
+        sock.close()
+    listener.close()
+
+    assert reused == [False, True, True]
+    assert context.stats() == {'handshakes': 3, 'resumed': 2}
@@ -0,0 +1,44 @@
+from mqbeebotte.topic import topic_trie
+
+def test_match_wildcards():
+    trie = topic_trie()
+    trie['ch/res'] = 1
+    trie['ch/+'] = 2
+    trie['ch/#'] = 3
+    trie['#'] = 4
+    trie['other/res'] = 5
+    assert sorted(trie.match('ch/res')) == [1, 2, 3, 4]
+    assert sorted(trie.match('ch')) == [3, 4]
+    assert sorted(trie.match('ch/res/sub')) == [3, 4]
+    assert sorted(trie.match('other/x')) == [4]
+
+def test_system_topics():
+    trie = topic_trie()
+    trie['#'] = 1
+    trie['+/res'] = 2
+    trie['$SYS/#'] = 3
+    assert trie.match('$SYS/res') == [3]
+
+def test_pop_prunes():
+    trie = topic_trie()
+    trie['a/b/c'] = 1
+    trie['a/b'] = 2
+    assert len(trie) == 2
+    assert trie.pop('a/b/c') == 1
+    assert trie.pop('a/b/c') is None
+    assert 'a/b' in trie
+    del trie['a/b']
+    assert len(trie) == 0
+    assert trie._root[0] == {}
+    assert trie.items() == []
+
+def test_search_topics():
+    trie = topic_trie()
+    for topic in ('ch/a', 'ch/b', 'ch/a/x', 'other/a', '$SYS/a'):
+        trie[topic] = topic
+    assert sorted(t for t, v in trie.search('ch/+')) == ['ch/a', 'ch/b']
+    assert sorted(t for t, v in trie.search('ch/#')) == ['ch/a', 'ch/a/x', 'ch/b']
+    assert sorted(t for t, v in trie.search('+/a')) == ['ch/a', 'other/a']
+    assert sorted(t for t, v in trie.search('#')) == ['ch/a', 'ch/a/x', 'ch/b', 'other/a']
+    assert trie.search('$SYS/#') == [('$SYS/a', '$SYS/a')]
+    assert trie.search('ch/a') == [('ch/a', 'ch/a')]